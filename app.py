@@ -6,13 +6,30 @@
 # =====================================================
 # BLOQUE 1 - IMPORTS Y CONFIGURACIÓN
 # =====================================================
-import io
-import sqlite3
+import time
+from datetime import datetime
+from functools import partial
 
 import pandas as pd
 import streamlit as st
 
-DB_NAME = "tarifario.db"
+from core.catalogs import obtener_catalogos, valores_tarifario
+from core.db import conexion_lectura
+from core.diff import diferencias, leer_snapshot, resumen
+from core.export import FORMATOS, formatos_disponibles
+from core.history import COLUMNAS_A_FECHA, FIN_DEL_DIA, libro_a_fecha, normalizar_fecha
+from core.jobs import enviar_export, leer_resultado, obtener_trabajo
+from core.lane_index import obtener_indice
+from core.migrations import aplicar_migraciones
+from core.queries import (
+    SQL_BASE_TARIFA,
+    SQL_HISTORIAL_TARIFA,
+    construir_busqueda,
+)
+from core.ranking import top_k_por_carril
+from core.services import cargar_bd_completa, crear_nueva_version
+
+aplicar_migraciones()
 
 # ⚠️ set_page_config SOLO UNA VEZ Y AL INICIO
 #st.set_page_config(
@@ -62,72 +79,52 @@ st.markdown(
 # BLOQUE 3 - FUNCIONES BD
 # =====================================================
 
-@st.cache_data
-def cargar_bd_completa() -> pd.DataFrame:
-    """
-    Carga TODA la BD.
-    El filtrado por ACTIVA se hace en los bloques de negocio,
-    no aquí (evita romper vistas y reportes).
-    """
-    conn = sqlite3.connect(DB_NAME)
-    df = pd.read_sql("SELECT * FROM tarifario_estandar", conn)
-    conn.close()
-    return df
+# Exportaciones en segundo plano (core.jobs): el script solo encola y
+# pinta el avance; el archivo se genera en otro hilo y se cachea en disco
+@st.fragment(run_every=1.0)
+def _avance_export(clave_sesion):
+    trabajo = obtener_trabajo(st.session_state.get(clave_sesion))
+    if trabajo is None or trabajo.terminado:
+        st.rerun()  # rerun completo para pintar el botón de descarga
+    st.progress(
+        trabajo.progreso,
+        text=f"⏳ Generando… {trabajo.filas:,} / {trabajo.total:,} filas" if trabajo.total else "⏳ En cola…",
+    )
 
 
-@st.cache_data
-def cargar_rutas() -> pd.DataFrame:
-    """
-    Catálogo de rutas (sin filtrar por ACTIVA todavía)
-    """
-    conn = sqlite3.connect(DB_NAME)
-    df = pd.read_sql(
-        """
-        SELECT DISTINCT
-            CIUDAD_ORIGEN AS origen,
-            CIUDAD_DESTINO AS destino
-        FROM tarifario_estandar
-        WHERE CIUDAD_ORIGEN IS NOT NULL
-          AND CIUDAD_DESTINO IS NOT NULL
-        ORDER BY origen, destino
-        """,
-        conn,
-    )
-    conn.close()
-    return df
+def panel_export(clave_sesion, sql, params, formato, nombre_archivo):
+    peticion = (sql, tuple(params), formato)
+
+    if st.button("⚙️ Generar archivo", key=f"{clave_sesion}_generar"):
+        try:
+            st.session_state[clave_sesion] = enviar_export(*peticion).id
+        except RuntimeError as e:
+            st.warning(str(e))
 
+    trabajo = obtener_trabajo(st.session_state.get(clave_sesion))
+    # Si cambiaron filtros / formato, el archivo anterior ya no corresponde
+    if trabajo is None or trabajo.peticion != peticion:
+        return
 
-def refrescar_bd():
-    cargar_bd_completa.clear()
-    cargar_rutas.clear()
+    if not trabajo.terminado:
+        _avance_export(clave_sesion)
+    elif trabajo.estado == "error":
+        st.error(f"❌ Error al exportar: {trabajo.error}")
+    elif not trabajo.ruta.exists():
+        st.info("El archivo expiró de la caché; vuelve a generarlo.")
+    else:
+        st.download_button(
+            f"⬇ Descargar {nombre_archivo}.{FORMATOS[formato][1]} ({trabajo.ruta.stat().st_size / 1024:,.0f} KB)",
+            data=partial(leer_resultado, trabajo.id),
+            file_name=f"{nombre_archivo}.{FORMATOS[formato][1]}",
+            mime=FORMATOS[formato][2],
+            key=f"{clave_sesion}_descargar",
+        )
 
 # =====================================================
 # BLOQUE 4 - LÓGICA DE NEGOCIO
 # =====================================================
-def obtener_columna_precio(tipo_operacion: str, tipo_viaje: str) -> str:
-    if tipo_operacion in ["Exportación", "Importación"]:
-        return "PRECIO_VIAJE_SENCILLO"
-    if tipo_viaje == "REDONDO":
-        return "PRECIO_VIAJE_REDONDO"
-    return "PRECIO_VIAJE_SENCILLO"
-
-
-def calcular_mejor_opcion(df: pd.DataFrame, col_precio: str) -> pd.Series | None:
-    df_valida = df[
-        df[col_precio].notna()
-        & (df[col_precio] > 0)
-        & df["ALL_IN"].notna()
-        & (df["ALL_IN"] > 0)
-    ].copy()
-
-    if df_valida.empty:
-        return None
-
-    df_valida["PRECIO_USADO"] = df_valida[col_precio]
-    df_valida["PROFIT"] = df_valida["PRECIO_USADO"] - df_valida["ALL_IN"]
-    df_valida["MARGEN"] = df_valida["PROFIT"] / df_valida["PRECIO_USADO"]
-    return df_valida.sort_values("ALL_IN").iloc[0]
-
+# obtener_columna_precio / calcular_mejor_opcion viven en core.services
 
 # =====================================================
 # BLOQUE 5 - FILTROS + CÁLCULO + RESULTADO (BUSCADOR REAL)
@@ -145,32 +142,21 @@ if "configuracion" not in st.session_state:
 # -------------------------------
 # CATÁLOGOS
 # -------------------------------
-with sqlite3.connect(DB_NAME) as conn:
-    clientes = ["Todos"] + pd.read_sql(
-        "SELECT CLIENTE FROM CAT_CLIENTES ORDER BY CLIENTE", conn
-    )["CLIENTE"].tolist()
+catalogos = obtener_catalogos()
+
+clientes = ["Todos"] + list(catalogos["CAT_CLIENTES"].lista(solo_activos=False))
 
-    transportistas = ["Todos"] + pd.read_sql(
-        "SELECT DISTINCT TRANSPORTISTA FROM tarifario_estandar ORDER BY TRANSPORTISTA",
-        conn
-    )["TRANSPORTISTA"].tolist()
+transportistas = ["Todos"] + sorted(
+    valores_tarifario(("TRANSPORTISTA",), solo_activas=False)["TRANSPORTISTA"]
+)
 
-    tipos_operacion = ["Todos"] + pd.read_sql(
-        "SELECT TIPO_OPERACION FROM CAT_TIPO_OPERACION ORDER BY TIPO_OPERACION",
-        conn
-    )["TIPO_OPERACION"].tolist()
+tipos_operacion = ["Todos"] + list(catalogos["CAT_TIPO_OPERACION"].lista())
 
-    tipos_viaje = ["Todos", "SENCILLO", "REDONDO"]
+tipos_viaje = ["Todos", "SENCILLO", "REDONDO"]
 
-    tipos_unidad = ["Todos"] + pd.read_sql(
-        "SELECT TIPO_UNIDAD FROM CAT_TIPO_UNIDAD ORDER BY TIPO_UNIDAD",
-        conn
-    )["TIPO_UNIDAD"].tolist()
+tipos_unidad = ["Todos"] + list(catalogos["CAT_TIPO_UNIDAD"].lista())
 
-    paises = ["Todos"] + pd.read_sql(
-        "SELECT PAIS FROM CAT_PAISES ORDER BY PAIS",
-        conn
-    )["PAIS"].tolist()
+paises = ["Todos"] + list(catalogos["CAT_PAISES"].lista(solo_activos=False))
 
 # -------------------------------
 # CONFIGURACIÓN DEL SERVICIO
@@ -226,49 +212,25 @@ num_destinos = st.number_input(
 # -------------------------------
 if st.button("🔍 Buscar tarifas"):
 
-    df_filtrado = cargar_bd_completa()
-
-    # ✅ Normalizar nombres de columnas (acentos/variantes)
-    df_filtrado.columns = [
-        c.replace("Ó","O").replace("Á","A").replace("É","E").replace("Í","I").replace("Ú","U")
-        for c in df_filtrado.columns
-    ]
-
-    # -------- FILTROS DINÁMICOS (ALL = no filtra) --------
-    if cliente_sel != "Todos":
-        df_filtrado = df_filtrado[df_filtrado["CLIENTE"] == cliente_sel]
-
-    if transportista_sel != "Todos":
-        df_filtrado = df_filtrado[df_filtrado["TRANSPORTISTA"] == transportista_sel]
-
-    if tipo_operacion != "Todos":
-        df_filtrado = df_filtrado[df_filtrado["TIPO_DE_OPERACION"] == tipo_operacion]
-
-    if tipo_viaje != "Todos":
-        df_filtrado = df_filtrado[df_filtrado["TIPO_DE_VIAJE"] == tipo_viaje]
-
-    if tipo_unidad != "Todos":
-        df_filtrado = df_filtrado[df_filtrado["TIPO_UNIDAD"] == tipo_unidad]
-
-    if pais_origen != "Todos":
-        df_filtrado = df_filtrado[df_filtrado["PAIS_ORIGEN"] == pais_origen]
-
-    if estado_origen:
-        df_filtrado = df_filtrado[df_filtrado["ESTADO_ORIGEN"] == estado_origen]
-
-    if ciudad_origen:
-        df_filtrado = df_filtrado[df_filtrado["CIUDAD_ORIGEN"] == ciudad_origen]
-
-    if pais_destino != "Todos":
-        df_filtrado = df_filtrado[df_filtrado["PAIS_DESTINO"] == pais_destino]
-
-    if estado_destino:
-        df_filtrado = df_filtrado[df_filtrado["ESTADO_DESTINO"] == estado_destino]
-
-    if ciudad_destino:
-        df_filtrado = df_filtrado[df_filtrado["CIUDAD_DESTINO"] == ciudad_destino]
+    # -------- FILTROS SOBRE EL ÍNDICE EN MEMORIA (Todos / vacío = no filtra, solo ACTIVA = 1) --------
+    filtros_busqueda = {
+        "cliente": cliente_sel,
+        "transportista": transportista_sel,
+        "tipo_operacion": tipo_operacion,
+        "tipo_viaje": tipo_viaje,
+        "tipo_unidad": tipo_unidad,
+        "pais_origen": pais_origen,
+        "estado_origen": estado_origen,
+        "ciudad_origen": ciudad_origen,
+        "pais_destino": pais_destino,
+        "estado_destino": estado_destino,
+        "ciudad_destino": ciudad_destino,
+    }
+    df_filtrado = obtener_indice().buscar(filtros_busqueda)
 
     st.session_state["df_filtrado"] = df_filtrado
+    # La exportación (BLOQUE 8) vuelve a correr estos filtros directo en SQLite
+    st.session_state["filtros_busqueda"] = filtros_busqueda
     st.session_state["configuracion"] = {
         "tipo_operacion": tipo_operacion,
         "tipo_viaje": tipo_viaje,
@@ -299,6 +261,27 @@ if not st.session_state["df_filtrado"].empty:
         use_container_width=True,
         height=400
     )
+
+    # Top 3 transportistas más baratos por carril (precio según operación / viaje de cada fila)
+    ranking = top_k_por_carril(df_resultado, k=3)
+    if not ranking.empty:
+        st.subheader("🏆 Mejores opciones por carril")
+        st.dataframe(
+            ranking[
+                [
+                    "RANGO",
+                    "CLIENTE",
+                    "TRANSPORTISTA",
+                    "CIUDAD_ORIGEN",
+                    "CIUDAD_DESTINO",
+                    "ALL_IN",
+                    "PRECIO_USADO",
+                    "PROFIT",
+                    "MARGEN",
+                ]
+            ],
+            use_container_width=True,
+        )
 else:
     st.info("Aún no hay resultados. Configura filtros y busca.")
 
@@ -329,13 +312,29 @@ if modo == "Administración":
 
             st.session_state["tarifa_id"] = tarifa_id
 
-            tarifa_df = df_activo[df_activo["ID_TARIFA"] == tarifa_id]
+            # La búsqueda viene de la réplica (puede ir atrasada): lo que se edita y su
+            # VERSION se leen de la BD principal
+            with conexion_lectura() as conn:
+                tarifa_df = pd.read_sql(SQL_BASE_TARIFA, conn, params=(tarifa_id,))
+
+            if "conflicto_edicion" in st.session_state:
+                st.error(
+                    f"⛔ {st.session_state.pop('conflicto_edicion')} "
+                    "Se recargó la versión actual: revisa los valores y guarda de nuevo."
+                )
 
             if tarifa_df.empty:
                 st.warning("La tarifa seleccionada no está disponible para edición.")
             else:
                 tarifa = tarifa_df.iloc[0]
 
+                # 🔒 Versión que se muestra al elegir la tarifa, fija hasta guardar
+                if st.session_state.get("version_edicion", (None,))[0] != tarifa_id:
+                    st.session_state["version_edicion"] = (
+                        tarifa_id,
+                        int(tarifa["VERSION"]) if tarifa["ACTIVA"] == 1 else None,
+                    )
+
                 with st.form("editar_tarifa_form"):
                     nuevo_precio = st.number_input(
                         "Precio viaje sencillo",
@@ -360,95 +359,39 @@ if modo == "Administración":
                     if not motivo.strip():
                         st.warning("⚠️ El motivo del cambio es obligatorio.")
                     else:
-                        with sqlite3.connect(DB_NAME) as conn:
-                            cur = conn.cursor()
-
-                            # 0️⃣ Calcular nueva versión
-                            cur.execute(
-                                "SELECT COALESCE(MAX(VERSION), 0) + 1 FROM tarifario_estandar WHERE ID_TARIFA = ?",
-                                (tarifa_id,)
-                            )
-                            nueva_version = cur.fetchone()[0]
-
-                            # 1️⃣ Desactivar versión actual
-                            cur.execute("""
-                                UPDATE tarifario_estandar
-                                SET ACTIVA = 0
-                                WHERE ID_TARIFA = ? AND ACTIVA = 1
-                            """, (tarifa_id,))
-
-                            # 2️⃣ Insertar nueva versión
-                            cur.execute("""
-                                INSERT INTO tarifario_estandar (
-                                    ID_TARIFA,
-                                    VERSION,
-                                    ACTIVA,
-                                    PRECIO_VIAJE_SENCILLO,
-                                    ALL_IN,
-                                    FECHA_CAMBIO,
-                                    USUARIO_CAMBIO,
-                                    MOTIVO_CAMBIO,
-                                    CLIENTE,
-                                    TRANSPORTISTA,
-                                    TIPO_DE_OPERACION,
-                                    TIPO_DE_VIAJE,
-                                    TIPO_UNIDAD,
-                                    PAIS_ORIGEN,
-                                    ESTADO_ORIGEN,
-                                    CIUDAD_ORIGEN,
-                                    PAIS_DESTINO,
-                                    ESTADO_DESTINO,
-                                    CIUDAD_DESTINO
-                                )
-                                SELECT
-                                    ID_TARIFA,
-                                    ?,
-                                    1,
-                                    ?,
-                                    ?,
-                                    datetime('now'),
-                                    'Ingeniero Hugo',
-                                    ?,
-                                    CLIENTE,
-                                    TRANSPORTISTA,
-                                    TIPO_DE_OPERACION,
-                                    TIPO_DE_VIAJE,
-                                    TIPO_UNIDAD,
-                                    PAIS_ORIGEN,
-                                    ESTADO_ORIGEN,
-                                    CIUDAD_ORIGEN,
-                                    PAIS_DESTINO,
-                                    ESTADO_DESTINO,
-                                    CIUDAD_DESTINO
-                                FROM tarifario_estandar
-                                WHERE ID_TARIFA = ?
-                                ORDER BY VERSION DESC
-                                LIMIT 1
-                            """, (nueva_version, nuevo_precio, nuevo_allin, motivo, tarifa_id))
-
-                            conn.commit()
-
-                        st.success(f"✅ Nueva versión creada (v{nueva_version})")
-                        st.rerun()
+                        # Copia la versión activa con los precios nuevos, si nadie la cambió
+                        # desde que se mostró
+                        resultado = crear_nueva_version(
+                            {"PRECIO_VIAJE_SENCILLO": nuevo_precio, "ALL_IN": nuevo_allin},
+                            id_tarifa=tarifa_id,
+                            version_esperada=st.session_state["version_edicion"][1],
+                            usuario="Ingeniero Hugo",
+                            motivo=motivo,
+                        )
+
+                        if resultado.ok:
+                            # El siguiente guardado espera la versión nueva; la búsqueda en
+                            # sesión (solo para la tabla) también la muestra
+                            st.session_state["version_edicion"] = (tarifa_id, resultado.version)
+                            df_sesion = st.session_state["df_filtrado"]
+                            df_sesion.loc[
+                                df_sesion["ID_TARIFA"] == tarifa_id,
+                                ["id", "VERSION", "PRECIO_VIAJE_SENCILLO", "ALL_IN"],
+                            ] = [resultado.id_fila, resultado.version, nuevo_precio, nuevo_allin]
+                            st.success(f"✅ Nueva versión creada (v{resultado.version})")
+                            st.rerun()
+                        else:
+                            # 🔄 Se recarga la base de la BD principal; su versión se fija al mostrarla
+                            st.session_state.pop("version_edicion", None)
+                            st.session_state["conflicto_edicion"] = resultado.conflicto
+                            st.rerun()
 
                 st.divider()
                 st.subheader("📜 Historial de versiones")
 
-                with sqlite3.connect(DB_NAME) as conn:
+                with conexion_lectura() as conn:
                     historial = pd.read_sql(
-                        """
-                        SELECT
-                            VERSION,
-                            PRECIO_VIAJE_SENCILLO,
-                            ALL_IN,
-                            ACTIVA,
-                            FECHA_CAMBIO,
-                            USUARIO_CAMBIO,
-                            MOTIVO_CAMBIO
-                        FROM tarifario_estandar
-                        WHERE ID_TARIFA = ?
-                        ORDER BY VERSION DESC
-                        """,
+                        SQL_HISTORIAL_TARIFA,
                         conn,
                         params=(tarifa_id,)
                     )
@@ -480,16 +423,109 @@ if modo == "Administración":
             height=450
         )
 
-        buffer = io.BytesIO()
-        df_bd.to_excel(buffer, index=False)
-        buffer.seek(0)
+        c_fmt, c_act = st.columns([2, 1])
+        formato_bd = c_fmt.selectbox(
+            "Formato",
+            formatos_disponibles(),
+            format_func=lambda f: FORMATOS[f][0],
+            key="formato_bd",
+        )
+        solo_activas_bd = c_act.checkbox("Solo activas", value=False, key="solo_activas_bd")
+        columnas_bd = st.multiselect(
+            "Columnas (vacío = todas)",
+            list(df_bd.columns),
+            key="columnas_bd",
+        )
+        sql_bd, params_bd = construir_busqueda(
+            {}, solo_activas=solo_activas_bd, columnas=columnas_bd or list(df_bd.columns)
+        )
+
+        panel_export("export_bd", sql_bd, params_bd, formato_bd, "tarifario_oficial")
+
+# =====================================================
+# BLOQUE 6.5 - TARIFARIO A UNA FECHA (AUDITORÍA)
+# =====================================================
+
+if modo == "Administración":
+
+    st.divider()
+    st.subheader("🕰️ Tarifario a una fecha")
+    st.caption("La versión que valía en cada carril en ese momento (lo que se habría cotizado).")
+
+    c_dia, c_hora = st.columns(2)
+    dia_a_fecha = c_dia.date_input("Fecha", key="dia_a_fecha")
+    hora_a_fecha = c_hora.time_input("Hora", value=FIN_DEL_DIA, key="hora_a_fecha")
 
+    if st.checkbox("👁️ Mostrar tarifario a esa fecha", key="ver_a_fecha"):
+        momento = datetime.combine(dia_a_fecha, hora_a_fecha)
+        df_a_fecha = libro_a_fecha(momento, COLUMNAS_A_FECHA)
+        st.caption(f"{len(df_a_fecha):,} carriles vigentes al {normalizar_fecha(momento)}")
+        st.dataframe(df_a_fecha, use_container_width=True, height=400)
+
+# =====================================================
+# BLOQUE 6.6 - DIFERENCIAS ENTRE FECHAS / SNAPSHOTS
+# =====================================================
+
+def _origen_diferencias(columna, lado, dia_default):
+    """Fecha (libro a esa fecha) o snapshot exportado del BLOQUE 6; None si falta el archivo."""
+    tipo = columna.radio(
+        lado, ["Fecha", "Snapshot (archivo exportado)"], horizontal=True, key=f"tipo_dif_{lado}"
+    )
+    if tipo == "Fecha":
+        return datetime.combine(columna.date_input("Fecha", value=dia_default, key=f"dia_dif_{lado}"), FIN_DEL_DIA)
+
+    archivo = columna.file_uploader(
+        "Archivo", type=["xlsx", "gz", "csv", "parquet", "arrow"], key=f"archivo_dif_{lado}"
+    )
+    if archivo is None:
+        return None
+    previo = st.session_state.get(f"snapshot_dif_{lado}")
+    if previo is None or previo[0] != archivo.file_id:
+        try:
+            with st.spinner("Leyendo snapshot..."):
+                previo = (archivo.file_id, leer_snapshot(archivo, archivo.name))
+        except ValueError as e:
+            columna.error(f"❌ {e}")
+            return None
+        st.session_state[f"snapshot_dif_{lado}"] = previo
+    columna.caption(f"{len(previo[1]):,} carriles activos en {archivo.name}")
+    return previo[1]
+
+
+if modo == "Administración":
+
+    st.divider()
+    st.subheader("🔀 Diferencias entre fechas")
+    st.caption("Carriles nuevos, eliminados y con cambio de precio entre dos fechas o dos archivos exportados.")
+
+    hoy = datetime.now().date()
+    c_antes, c_despues = st.columns(2)
+    antes = _origen_diferencias(c_antes, "Antes", hoy.replace(day=1))
+    despues = _origen_diferencias(c_despues, "Después", hoy)
+
+    if antes is not None and despues is not None and st.checkbox("🔍 Comparar", key="ver_diferencias"):
+        inicio_dif = time.perf_counter()
+        df_dif = diferencias(antes, despues)
+        r = resumen(df_dif)
+
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Cambios de precio", f"{r['cambios_precio']:,}")
+        m2.metric("Nuevos", f"{r['nuevos']:,}")
+        m3.metric("Eliminados", f"{r['eliminados']:,}")
+        delta_all_in, delta_margen = r["delta_all_in_pct_promedio"], r["delta_margen_promedio"]
+        m4.metric("Δ ALL IN promedio", "—" if delta_all_in is None else f"{delta_all_in:+.2f} %")
+        st.caption(
+            f"Δ margen promedio: {'—' if delta_margen is None else f'{delta_margen * 100:+.2f} pts'} · "
+            f"⚡ {time.perf_counter() - inicio_dif:.2f} s"
+        )
+
+        st.dataframe(df_dif, use_container_width=True, height=400, hide_index=True)
         st.download_button(
-            "⬇ Descargar Excel",
-            data=buffer,
-            file_name="tarifario_oficial.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            key="download_bd_btn",
+            "⬇️ Descargar diferencias (CSV)",
+            data=lambda: df_dif.to_csv(index=False).encode("utf-8-sig"),
+            file_name="diferencias_tarifario.csv",
+            mime="text/csv",
+            key="btn_diferencias",
         )
 
 # =====================================================
@@ -520,7 +556,7 @@ if modo == "Administración":
 # )
 
 # =====================================================
-# BLOQUE 8 - EXPORTAR TARIFARIO FILTRADO A EXCEL
+# BLOQUE 8 - EXPORTAR TARIFARIO FILTRADO (EXCEL / CSV / PARQUET / ARROW)
 # =====================================================
 st.divider()
 st.subheader("📤 Exportar tarifario filtrado")
@@ -528,17 +564,16 @@ st.subheader("📤 Exportar tarifario filtrado")
 df_export = st.session_state.get("df_filtrado", pd.DataFrame())
 
 if not df_export.empty:
-    buffer_export = io.BytesIO()
-    df_export.to_excel(buffer_export, index=False)
-    buffer_export.seek(0)
-
-    st.download_button(
-        label="📥 Descargar tarifario filtrado (Excel)",
-        data=buffer_export,
-        file_name="tarifario_filtrado.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        key="download_filtrado_btn",
+    sql_export, params_export = construir_busqueda(st.session_state.get("filtros_busqueda", {}))
+
+    formato_export = st.selectbox(
+        "Formato",
+        formatos_disponibles(),
+        format_func=lambda f: FORMATOS[f][0],
+        key="formato_filtrado",
     )
+
+    panel_export("export_filtrado", sql_export, params_export, formato_export, "tarifario_filtrado")
 else:
     st.info("No hay datos filtrados para exportar.")
 
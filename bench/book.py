@@ -0,0 +1,171 @@
+"""
+Generador de tarifarios sintéticos con el esquema real de tarifario.db.
+
+    python -m bench.book /tmp/libro.db --filas 1000000 --versiones 3
+
+Cada carril (transportista + cliente + unidad + viaje + ruta) tiene N versiones
+con el mismo ID_TARIFA; solo la última queda ACTIVA = 1, como en la app.
+"""
+import argparse
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+
+from core.db import BASE_DIR
+
+BD_MODELO = BASE_DIR / "tarifario.db"
+LOTE_INSERT = 50_000
+
+COLUMNAS_INSERT = (
+    "ID_TARIFA", "VERSION", "ACTIVA", "FECHA_CAMBIO", "USUARIO_CAMBIO",
+    "TIPO_DE_OPERACION", "TIPO_DE_VIAJE", "TIPO_UNIDAD", "TRANSPORTISTA", "CLIENTE",
+    "PAIS_ORIGEN", "ESTADO_ORIGEN", "CIUDAD_ORIGEN",
+    "PAIS_DESTINO", "ESTADO_DESTINO", "CIUDAD_DESTINO",
+    "ID_PAIS_ORIGEN", "ID_ESTADO_ORIGEN", "ID_CIUDAD_ORIGEN",
+    "ID_PAIS_DESTINO", "ID_ESTADO_DESTINO", "ID_CIUDAD_DESTINO",
+    "PRECIO_VIAJE_SENCILLO", "PRECIO_VIAJE_REDONDO", "ALL_IN", "MONEDA",
+)
+
+
+def _copiar_esquema(destino: sqlite3.Connection, modelo: sqlite3.Connection) -> list[str]:
+    """Crea las tablas del modelo; regresa los CREATE INDEX para correrlos después de cargar."""
+    indices = []
+    for tipo, nombre, sql in modelo.execute(
+        "SELECT type, name, sql FROM sqlite_master WHERE sql IS NOT NULL ORDER BY type DESC"
+    ):
+        if nombre.startswith("sqlite_"):
+            continue
+        if tipo == "table":
+            destino.execute(sql)
+        elif tipo == "index":
+            indices.append(sql)
+    return indices
+
+
+def _copiar_catalogos(destino: sqlite3.Connection, modelo: sqlite3.Connection) -> None:
+    for tabla in ("CAT_PAISES", "CAT_ESTADOS_NEW", "CAT_CIUDADES", "CAT_TIPO_UNIDAD",
+                  "CAT_TIPO_OPERACION", "CAT_TIPO_VIAJE"):
+        filas = modelo.execute(f"SELECT * FROM {tabla}").fetchall()
+        if filas:
+            marcas = ", ".join("?" * len(filas[0]))
+            destino.executemany(f"INSERT INTO {tabla} VALUES ({marcas})", filas)
+
+
+def _ciudades(conn: sqlite3.Connection) -> list[tuple]:
+    return conn.execute(
+        """
+        SELECT P.ID_PAIS, P.PAIS, E.ID_ESTADO, E.ESTADO, C.ID_CIUDAD, C.CIUDAD
+        FROM CAT_CIUDADES C
+        JOIN CAT_ESTADOS_NEW E ON E.ID_ESTADO = C.ID_ESTADO
+        JOIN CAT_PAISES P ON P.ID_PAIS = E.ID_PAIS
+        ORDER BY C.ID_CIUDAD
+        """
+    ).fetchall()
+
+
+def crear_libro(
+    ruta,
+    filas: int = 100_000,
+    versiones: int = 3,
+    transportistas: int = 150,
+    clientes: int = 200,
+    semilla: int = 7,
+    modelo=BD_MODELO,
+) -> Path:
+    """
+    Crea (o reemplaza) un tarifario sintético en ruta con ~filas registros:
+    filas // versiones carriles, cada uno con `versiones` versiones.
+    Ciudades, estados, países, unidades y operaciones salen del catálogo real.
+    """
+    ruta = Path(ruta)
+    for sufijo in ("", "-wal", "-shm"):
+        Path(f"{ruta}{sufijo}").unlink(missing_ok=True)
+
+    rng = np.random.default_rng(semilla)
+    carriles = max(1, filas // versiones)
+
+    modelo_conn = sqlite3.connect(f"file:{modelo}?mode=ro", uri=True)
+    conn = sqlite3.connect(ruta, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("BEGIN")
+
+    indices = _copiar_esquema(conn, modelo_conn)
+    _copiar_catalogos(conn, modelo_conn)
+    nombres_trp = [f"TRANSPORTISTA {i:04d}" for i in range(transportistas)]
+    nombres_cli = [f"CLIENTE {i:04d}" for i in range(clientes)]
+    conn.executemany("INSERT INTO CAT_TRANSPORTISTAS (TRANSPORTISTA, ACTIVO) VALUES (?, 1)",
+                     [(n,) for n in nombres_trp])
+    conn.executemany("INSERT INTO CAT_CLIENTES (CLIENTE, ACTIVO) VALUES (?, 1)",
+                     [(n,) for n in nombres_cli])
+
+    ciudades = _ciudades(conn)
+    unidades = [r[0] for r in conn.execute("SELECT TIPO_UNIDAD FROM CAT_TIPO_UNIDAD WHERE TIPO_UNIDAD IS NOT NULL")]
+    operaciones = [r[0] for r in conn.execute("SELECT TIPO_OPERACION FROM CAT_TIPO_OPERACION")]
+    viajes = ["SENCILLO", "REDONDO"]
+    modelo_conn.close()
+
+    # Atributos por carril; las versiones repiten el carril con otro precio
+    trp = rng.integers(0, transportistas, carriles)
+    cli = rng.integers(0, clientes, carriles)
+    uni = rng.integers(0, len(unidades), carriles)
+    ope = rng.integers(0, len(operaciones), carriles)
+    via = rng.integers(0, len(viajes), carriles)
+    ori = rng.integers(0, len(ciudades), carriles)
+    des = rng.integers(0, len(ciudades), carriles)
+    all_in_base = rng.uniform(800, 8000, carriles)
+
+    def generar():
+        for c in range(carriles):
+            o, d = ciudades[ori[c]], ciudades[des[c]]
+            for v in range(1, versiones + 1):
+                all_in = round(all_in_base[c] * (1 + 0.03 * (v - 1)), 2)
+                yield (
+                    float(c + 1), v, int(v == versiones), f"2025-01-{v:02d} 00:00:00", "bench",
+                    operaciones[ope[c]], viajes[via[c]], unidades[uni[c]],
+                    nombres_trp[trp[c]], nombres_cli[cli[c]],
+                    o[1], o[3], o[5], d[1], d[3], d[5],
+                    o[0], o[2], o[4], d[0], d[2], d[4],
+                    round(all_in * 1.25, 2), round(all_in * 2.3, 2), all_in, "USD",
+                )
+
+    sql = (
+        f"INSERT INTO tarifario_estandar ({', '.join(COLUMNAS_INSERT)}) "
+        f"VALUES ({', '.join('?' * len(COLUMNAS_INSERT))})"
+    )
+    lote = []
+    for fila in generar():
+        lote.append(fila)
+        if len(lote) == LOTE_INSERT:
+            conn.executemany(sql, lote)
+            lote.clear()
+    if lote:
+        conn.executemany(sql, lote)
+
+    for sql_indice in indices:
+        conn.execute(sql_indice)
+    conn.execute("COMMIT")
+    conn.execute("PRAGMA journal_mode = DELETE")
+    conn.close()
+    return ruta
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("ruta")
+    parser.add_argument("--filas", type=int, default=100_000)
+    parser.add_argument("--versiones", type=int, default=3)
+    parser.add_argument("--transportistas", type=int, default=150)
+    parser.add_argument("--clientes", type=int, default=200)
+    parser.add_argument("--semilla", type=int, default=7)
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    crear_libro(args.ruta, args.filas, args.versiones, args.transportistas, args.clientes, args.semilla)
+    print(f"{args.ruta}: {args.filas:,} filas en {time.perf_counter() - inicio:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Prueba de estrés del versionado: varios procesos (cada uno con su hilo escritor)
+y varios hilos por proceso crean versiones de las MISMAS tarifas a la vez.
+
+    python -m bench.concurrencia --procesos 4 --hilos 8 --intentos 25
+    python -m bench.concurrencia --sin-verificar      # sin version_esperada: se pierden cambios
+
+Cada intento imita una pantalla: lee la versión activa, "piensa" unos ms y guarda
+con crear_nueva_version(version_esperada=la leída). Además, todos pelean por
+capturar como nueva la misma tarifa en un carril vacío.
+
+Al final revisa los invariantes sobre la BD y sale con código 1 si alguno falla:
+- ninguna (ID_TARIFA, VERSION) repetida y versiones consecutivas por tarifa
+- a lo más una fila ACTIVA por ID_TARIFA y por LANE_KEY
+- filas insertadas = guardados exitosos; tarifa_vigente al día
+- con verificación: ninguna actualización perdida y un solo alta en el carril nuevo
+"""
+import argparse
+import multiprocessing
+import random
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from bench.book import crear_libro
+from core import db, services
+from core.migrations import aplicar_migraciones
+
+SQL_VERSION_ACTIVA = "SELECT VERSION FROM tarifario_estandar WHERE ID_TARIFA = ? AND ACTIVA = 1"
+
+# Carril que nadie tiene: todos los hilos intentan darlo de alta a la vez
+CARRIL_NUEVO = {
+    "TRANSPORTISTA": "TRANSPORTISTA ESTRES",
+    "CLIENTE": "CLIENTE ESTRES",
+    "TIPO_UNIDAD": "CAJA SECA 53",
+    "PAIS_ORIGEN": "MEXICO",
+    "ESTADO_ORIGEN": "NUEVO LEON",
+    "CIUDAD_ORIGEN": "MONTERREY",
+    "PAIS_DESTINO": "ESTADOS UNIDOS",
+    "ESTADO_DESTINO": "TEXAS",
+    "CIUDAD_DESTINO": "LAREDO",
+}
+
+
+def _hilo(tarifas, intentos, verificar, semilla, cuenta, lock):
+    rng = random.Random(semilla)
+    local = {"ok": 0, "conflictos": 0, "errores": 0, "perdidas": 0, "altas_ok": 0, "altas_conflicto": 0}
+
+    # Alta del carril nuevo: solo una puede ganar
+    resultado = services.crear_nueva_version(
+        {**CARRIL_NUEVO, "ALL_IN": 1000.0, "PRECIO_VIAJE_SENCILLO": 1500.0},
+        version_esperada=None if verificar else services.SIN_VERIFICAR,
+        reemplazar_carril=not verificar,
+        usuario="estres",
+    )
+    local["altas_ok" if resultado.ok else "altas_conflicto"] += 1
+
+    for _ in range(intentos):
+        id_tarifa = rng.choice(tarifas)
+        with db.conexion_lectura() as conn:
+            version_leida = int(conn.execute(SQL_VERSION_ACTIVA, (id_tarifa,)).fetchone()[0])
+        time.sleep(rng.uniform(0, 0.003))  # el usuario "piensa"
+
+        try:
+            resultado = services.crear_nueva_version(
+                {"ALL_IN": round(rng.uniform(800, 8000), 2)},
+                id_tarifa=id_tarifa,
+                version_esperada=version_leida if verificar else services.SIN_VERIFICAR,
+                usuario="estres",
+                motivo="estres",
+            )
+        except Exception:
+            local["errores"] += 1
+            continue
+        if not resultado.ok:
+            local["conflictos"] += 1
+            continue
+        local["ok"] += 1
+        if resultado.version != version_leida + 1:  # se escribió encima de una versión que no vio
+            local["perdidas"] += 1
+
+    with lock:
+        for k, v in local.items():
+            cuenta[k] = cuenta.get(k, 0) + v
+
+
+def _proceso(args) -> dict:
+    ruta, tarifas, hilos, intentos, verificar, semilla = args
+    db.configurar(Path(ruta))
+    cuenta, lock = {}, threading.Lock()
+    trabajadores = [
+        threading.Thread(target=_hilo, args=(tarifas, intentos, verificar, semilla * 1000 + i, cuenta, lock))
+        for i in range(hilos)
+    ]
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+    cuenta["lotes_escritor"] = db.pool_stats().get("escritor", {}).get("lotes", 0)
+    return cuenta
+
+
+def revisar_invariantes(conn, total_ok: int, filas_antes: int, verificar: bool, cuenta: dict) -> list[str]:
+    fallas = []
+    repetidas = conn.execute(
+        """
+        SELECT COUNT(*) FROM (
+            SELECT 1 FROM tarifario_estandar WHERE ID_TARIFA IS NOT NULL
+            GROUP BY ID_TARIFA, VERSION HAVING COUNT(*) > 1
+        )
+        """
+    ).fetchone()[0]
+    if repetidas:
+        fallas.append(f"{repetidas} (ID_TARIFA, VERSION) repetidas")
+
+    huecos = conn.execute(
+        """
+        SELECT COUNT(*) FROM (
+            SELECT 1 FROM tarifario_estandar WHERE ID_TARIFA IS NOT NULL
+            GROUP BY ID_TARIFA HAVING MAX(VERSION) - MIN(VERSION) + 1 <> COUNT(*)
+        )
+        """
+    ).fetchone()[0]
+    if huecos:
+        fallas.append(f"{huecos} tarifas con versiones no consecutivas")
+
+    for columna in ("ID_TARIFA", "LANE_KEY"):
+        dobles = conn.execute(
+            f"""
+            SELECT COUNT(*) FROM (
+                SELECT 1 FROM tarifario_estandar WHERE ACTIVA = 1 AND {columna} IS NOT NULL
+                GROUP BY {columna} HAVING COUNT(*) > 1
+            )
+            """
+        ).fetchone()[0]
+        if dobles:
+            fallas.append(f"{dobles} {columna} con más de una fila ACTIVA")
+
+    filas = conn.execute("SELECT COUNT(*) FROM tarifario_estandar").fetchone()[0]
+    if filas - filas_antes != total_ok:
+        fallas.append(f"se insertaron {filas - filas_antes} filas para {total_ok} guardados exitosos")
+
+    vigentes = conn.execute("SELECT COUNT(*) FROM tarifa_vigente").fetchone()[0]
+    activas = conn.execute(
+        "SELECT COUNT(*) FROM tarifario_estandar WHERE ACTIVA = 1 AND ID_TARIFA IS NOT NULL"
+    ).fetchone()[0]
+    if vigentes != activas:
+        fallas.append(f"tarifa_vigente tiene {vigentes} filas y hay {activas} activas")
+
+    if verificar:
+        if cuenta.get("perdidas"):
+            fallas.append(f"{cuenta['perdidas']} actualizaciones perdidas con version_esperada")
+        if cuenta.get("altas_ok") != 1:
+            fallas.append(f"el carril nuevo se dio de alta {cuenta.get('altas_ok')} veces (debe ser 1)")
+    return fallas
+
+
+@dataclass
+class ResultadoEstres:
+    procesos: int
+    hilos: int
+    tarifas: int
+    intentos: int
+    verificar: bool
+    segundos: float
+    cuenta: dict
+    fallas: list[str] = field(default_factory=list)
+
+
+def correr(
+    procesos: int = 4,
+    hilos: int = 8,
+    intentos: int = 25,
+    tarifas: int = 5,
+    filas: int = 3_000,
+    verificar: bool = True,
+) -> ResultadoEstres:
+    """Corre la prueba sobre un libro sintético temporal y revisa los invariantes."""
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = Path(tmp) / "estres.db"
+        crear_libro(ruta, filas)
+        db.configurar(ruta)
+        aplicar_migraciones()
+        with db.conexion_lectura() as conn:
+            filas_antes = conn.execute("SELECT COUNT(*) FROM tarifario_estandar").fetchone()[0]
+            en_disputa = [
+                r[0] for r in conn.execute(
+                    "SELECT ID_TARIFA FROM tarifario_estandar WHERE ACTIVA = 1 ORDER BY ID_TARIFA LIMIT ?",
+                    (tarifas,),
+                )
+            ]
+        db.configurar(ruta)  # el escritor de este proceso no compite
+
+        # spawn: cada proceso abre sus propias conexiones y su propio hilo escritor
+        contexto = multiprocessing.get_context("spawn")
+        inicio = time.perf_counter()
+        with contexto.Pool(procesos) as pool:
+            parciales = pool.map(
+                _proceso,
+                [(str(ruta), en_disputa, hilos, intentos, verificar, p + 1) for p in range(procesos)],
+            )
+        segundos = time.perf_counter() - inicio
+
+        cuenta = {}
+        for parcial in parciales:
+            for k, v in parcial.items():
+                cuenta[k] = cuenta.get(k, 0) + v
+        total_ok = cuenta.get("ok", 0) + cuenta.get("altas_ok", 0)
+
+        with db.conexion_lectura() as conn:
+            fallas = revisar_invariantes(conn, total_ok, filas_antes, verificar, cuenta)
+        db.configurar(ruta)  # cierra las conexiones antes de borrar el directorio
+
+    return ResultadoEstres(
+        procesos=procesos,
+        hilos=hilos,
+        tarifas=len(en_disputa),
+        intentos=procesos * hilos * (intentos + 1),
+        verificar=verificar,
+        segundos=segundos,
+        cuenta=cuenta,
+        fallas=fallas,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--procesos", type=int, default=4)
+    parser.add_argument("--hilos", type=int, default=8, help="hilos por proceso")
+    parser.add_argument("--intentos", type=int, default=25, help="guardados por hilo")
+    parser.add_argument("--tarifas", type=int, default=5, help="tarifas en disputa")
+    parser.add_argument("--filas", type=int, default=3_000, help="tamaño del libro sintético")
+    parser.add_argument("--sin-verificar", action="store_true", help="guardar sin version_esperada")
+    args = parser.parse_args()
+
+    r = correr(args.procesos, args.hilos, args.intentos, args.tarifas, args.filas, not args.sin_verificar)
+    cuenta = r.cuenta
+    print(
+        f"{r.procesos} procesos x {r.hilos} hilos, {r.tarifas} tarifas en disputa "
+        f"({'con' if r.verificar else 'SIN'} version_esperada)"
+    )
+    print(f"intentos: {r.intentos:,} en {r.segundos:.2f} s ({r.intentos / r.segundos:,.0f}/s)")
+    print(
+        f"versiones ok: {cuenta.get('ok', 0):,} | conflictos: {cuenta.get('conflictos', 0):,} | "
+        f"errores: {cuenta.get('errores', 0):,} | actualizaciones perdidas: {cuenta.get('perdidas', 0):,}"
+    )
+    print(
+        f"alta del carril nuevo: {cuenta.get('altas_ok', 0)} ok, "
+        f"{cuenta.get('altas_conflicto', 0)} conflictos | lotes del escritor: {cuenta.get('lotes_escritor', 0):,}"
+    )
+
+    if r.fallas:
+        print("❌ " + "\n❌ ".join(r.fallas))
+        sys.exit(1)
+    print("✅ invariantes OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Benchmark de las rutas calientes de la app sobre tarifarios sintéticos.
+
+    python -m bench.hot_paths --filas 10000 100000 1000000
+    python -m bench.hot_paths --filas 100000 --comparar bench/resultados/base.json
+
+Escribe p50/p95 (ms) y RSS pico (MB) por ruta en JSON (--salida) para
+comparar entre versiones del código.
+"""
+import argparse
+import json
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from bench.book import crear_libro
+from core import db, jobs, services
+from core.lane_index import obtener_indice
+from core.migrations import aplicar_migraciones
+from core.export import formatos_disponibles
+from core.diff import diferencias
+from core.history import libro_a_fecha, tarifa_a_fecha
+from core.ranking import ranking_libro, top_k_por_carril
+from core.queries import SQL_VIGENTE_POR_CARRIL, construir_busqueda
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SALIDA_DEFAULT = Path(__file__).resolve().parent / "resultados" / "hot_paths.json"
+# Export completo a Excel (openpyxl write-only); arriba de esto la ruta se omite
+MAX_FILAS_EXCEL = 50_000
+
+# Export de la BD completa
+SQL_TARIFARIO_BASE = """
+SELECT * FROM tarifario_estandar
+"""
+
+# BLOQUE 0 de captura antes de tarifa_vigente: GROUP BY sobre todo el historial
+SQL_DEDUP_BLOQUE0 = """
+SELECT ID_TARIFA, TRANSPORTISTA, CLIENTE, TIPO_UNIDAD,
+       PAIS_ORIGEN, ESTADO_ORIGEN, CIUDAD_ORIGEN,
+       PAIS_DESTINO, ESTADO_DESTINO, CIUDAD_DESTINO, ALL_IN, ACTIVA
+FROM tarifario_estandar
+WHERE 1=1 AND ID_TARIFA IN (
+    SELECT MAX(ID_TARIFA)
+    FROM tarifario_estandar
+    GROUP BY
+        TRANSPORTISTA, CLIENTE, COALESCE(TIPO_UNIDAD,''),
+        PAIS_ORIGEN, ESTADO_ORIGEN, CIUDAD_ORIGEN,
+        PAIS_DESTINO, ESTADO_DESTINO, CIUDAD_DESTINO
+)
+ORDER BY ID_TARIFA DESC
+"""
+
+# BLOQUE 0 actual: tarifa vigente por carril desde tarifa_vigente
+SQL_VIGENTES_BLOQUE0 = f"""
+SELECT ID_TARIFA, TRANSPORTISTA, CLIENTE, TIPO_UNIDAD,
+       PAIS_ORIGEN, ESTADO_ORIGEN, CIUDAD_ORIGEN,
+       PAIS_DESTINO, ESTADO_DESTINO, CIUDAD_DESTINO, ALL_IN, ACTIVA
+FROM tarifario_estandar
+WHERE 1=1 AND id IN ({SQL_VIGENTE_POR_CARRIL})
+ORDER BY ID_TARIFA DESC
+"""
+
+# Igual que pages/3_Cotizacion.py con cliente + ruta seleccionados (ruta por ID_CIUDAD_*)
+SQL_COTIZACION = (
+    "SELECT * FROM tarifario_estandar WHERE 1=1 "
+    "AND CLIENTE=? AND ID_CIUDAD_ORIGEN IN (?) AND ID_CIUDAD_DESTINO IN (?) AND ACTIVA = 1"
+)
+
+# Cotización antes de los ids: ruta comparando nombres
+SQL_COTIZACION_TEXTO = (
+    "SELECT * FROM tarifario_estandar WHERE 1=1 "
+    "AND CLIENTE=? AND CIUDAD_ORIGEN=? AND CIUDAD_DESTINO=? AND ACTIVA = 1"
+)
+
+
+def rss_pico_mb() -> float | None:
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def medir(fn, repeticiones: int, preparar=None) -> dict:
+    tiempos = []
+    for i in range(repeticiones):
+        if preparar:
+            preparar(i)
+        inicio = time.perf_counter()
+        fn(i)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return {
+        "n": repeticiones,
+        "p50_ms": round(float(np.percentile(tiempos, 50)), 3),
+        "p95_ms": round(float(np.percentile(tiempos, 95)), 3),
+        "rss_pico_mb": rss_pico_mb(),
+    }
+
+
+def exportar(sql: str, params: tuple = (), formato: str = "xlsx") -> bytes:
+    """Como BLOQUE 8 de app.py: core.jobs genera el archivo (o lo reusa del caché) y se leen sus bytes."""
+    trabajo = jobs.enviar_export(sql, params, formato)
+    while not trabajo.terminado:
+        time.sleep(0.002)
+    if trabajo.estado == "error":
+        raise RuntimeError(trabajo.error)
+    return jobs.leer_resultado(trabajo.id)
+
+
+def correr_rutas(filas: int, repeticiones: int, directorio: Path) -> list[dict]:
+    ruta_bd = directorio / f"libro_{filas}.db"
+    inicio = time.perf_counter()
+    crear_libro(ruta_bd, filas)
+    print(f"\n{filas:,} filas | libro sintético: {time.perf_counter() - inicio:.1f} s")
+
+    db.configurar(ruta_bd)
+    aplicar_migraciones()
+
+    # Valores reales del libro para que los filtros encuentren filas
+    with db.conexion_lectura() as conn:
+        muestra = conn.execute(
+            "SELECT CLIENTE, TRANSPORTISTA, CIUDAD_ORIGEN, CIUDAD_DESTINO, ID_TARIFA, "
+            "ID_CIUDAD_ORIGEN, ID_CIUDAD_DESTINO, LANE_KEY "
+            "FROM tarifario_estandar WHERE ACTIVA = 1 ORDER BY id LIMIT 1"
+        ).fetchone()
+        max_tarifa = conn.execute("SELECT MAX(ID_TARIFA) FROM tarifario_estandar").fetchone()[0]
+    cliente, transportista, ciudad_o, ciudad_d, _, id_ciudad_o, id_ciudad_d, lane_key = muestra
+    filtros = {"cliente": cliente, "transportista": transportista}
+    rng = np.random.default_rng(11)
+
+    def lectura(sql, params=()):
+        with db.conexion_lectura() as conn:
+            return pd.read_sql(sql, conn, params=params)
+
+    def lectura_replica(sql, params=()):
+        with db.conexion_replica() as conn:
+            return pd.read_sql(sql, conn, params=params)
+
+    resultados = {}
+
+    resultados["cargar_bd_completa (frío)"] = medir(
+        lambda _: services.cargar_bd_completa(),
+        max(1, repeticiones // 3),
+        preparar=lambda _: services.cargar_bd_completa.clear(),
+    )
+    resultados["cargar_bd_completa (sin cambios)"] = medir(
+        lambda _: services.cargar_bd_completa(), repeticiones
+    )
+
+    # Primera copia de la réplica (cotización lee de ella)
+    resultados["copia de réplica"] = medir(lambda _: db.refrescar_replica(), 1)
+    obtener_indice()  # construcción fuera de la medición
+    resultados["filtro app.py (índice)"] = medir(lambda _: obtener_indice().buscar(filtros), repeticiones)
+
+    df_activas = services.cargar_bd_completa()
+    df_activas = df_activas[df_activas["ACTIVA"] == 1]
+    df_cliente = df_activas[df_activas["CLIENTE"] == cliente]
+    col_precio = services.obtener_columna_precio("Exportación", "SENCILLO")
+    resultados["calcular_mejor_opcion (cliente)"] = medir(
+        lambda _: services.calcular_mejor_opcion(df_cliente, col_precio), repeticiones
+    )
+    resultados["calcular_mejor_opcion (activas)"] = medir(
+        lambda _: services.calcular_mejor_opcion(df_activas, col_precio), max(1, repeticiones // 3)
+    )
+
+    resultados["top-3 por carril (cliente)"] = medir(lambda _: top_k_por_carril(df_cliente, 3), repeticiones)
+    resultados["mejor por carril (libro)"] = medir(
+        lambda _: ranking_libro(), max(1, repeticiones // 3), preparar=lambda _: ranking_libro.clear()
+    )
+
+    resultados["dedup BLOQUE 0 (GROUP BY)"] = medir(lambda _: lectura(SQL_DEDUP_BLOQUE0), max(1, repeticiones // 3))
+    resultados["vigentes BLOQUE 0 (tarifa_vigente)"] = medir(
+        lambda _: lectura(SQL_VIGENTES_BLOQUE0), max(1, repeticiones // 3)
+    )
+    resultados["query cotización (nombres)"] = medir(
+        lambda _: lectura(SQL_COTIZACION_TEXTO, (cliente, ciudad_o, ciudad_d)), repeticiones
+    )
+    resultados["query cotización (ids)"] = medir(
+        lambda _: lectura(SQL_COTIZACION, (cliente, id_ciudad_o, id_ciudad_d)), repeticiones
+    )
+    resultados["query cotización (ids, réplica)"] = medir(
+        lambda _: lectura_replica(SQL_COTIZACION, (cliente, id_ciudad_o, id_ciudad_d)), repeticiones
+    )
+
+    sql_busqueda, params_busqueda = construir_busqueda({"cliente": cliente})
+    resultados["export Excel (búsqueda)"] = medir(
+        lambda _: exportar(sql_busqueda, tuple(params_busqueda)),
+        max(1, repeticiones // 3),
+        preparar=lambda _: jobs.limpiar(),
+    )
+    if filas <= MAX_FILAS_EXCEL:
+        resultados["export Excel (BD completa)"] = medir(
+            lambda _: exportar(SQL_TARIFARIO_BASE), 1, preparar=lambda _: jobs.limpiar()
+        )
+        resultados["export Excel (BD completa, cache)"] = medir(
+            lambda _: exportar(SQL_TARIFARIO_BASE), repeticiones
+        )
+
+    for formato in formatos_disponibles():
+        if formato == "xlsx":
+            continue
+        resultados[f"export {formato} (BD completa)"] = medir(
+            lambda _: exportar(SQL_TARIFARIO_BASE, (), formato), 1, preparar=lambda _: jobs.limpiar()
+        )
+
+    # Auditoría (BLOQUE 6.5 de app.py): el libro sintético fecha la versión v el día v de enero 2025
+    services.cargar_bd_completa()
+    resultados["libro a fecha (memoria)"] = medir(
+        lambda i: libro_a_fecha(f"2025-01-{1 + i % 3:02d} 12:00:00"), repeticiones
+    )
+    # Peor caso del libro sintético: de la v1 a la v3 todos los carriles cambian de precio
+    resultados["diferencias entre fechas"] = medir(
+        lambda _: diferencias("2025-01-01 12:00:00", "2025-01-03 12:00:00"), repeticiones
+    )
+    resultados["tarifa a fecha (carril)"] = medir(
+        lambda i: tarifa_a_fecha(lane_key, f"2025-01-{1 + i % 3:02d} 12:00:00"), repeticiones
+    )
+
+    # Lo mismo que BLOQUE 5.5 de app.py: nueva versión con precios nuevos
+    tarifas = rng.integers(1, int(max_tarifa) + 1, repeticiones).astype(float)
+    precios = rng.uniform(1000, 9000, repeticiones).round(2)
+    resultados["escritura de versión"] = medir(
+        lambda i: services.crear_nueva_version(
+            {"PRECIO_VIAJE_SENCILLO": precios[i], "ALL_IN": precios[i] * 0.8},
+            id_tarifa=tarifas[i], usuario="bench", motivo="bench",
+        ),
+        repeticiones,
+    )
+    resultados["cargar_bd_completa (tras escrituras)"] = medir(
+        lambda _: services.cargar_bd_completa(), 1
+    )
+    resultados["copia de réplica (tras escrituras)"] = medir(lambda _: db.refrescar_replica(), 1)
+    resultados["filtro app.py (índice, tras escrituras)"] = medir(lambda _: obtener_indice().buscar(filtros), 1)
+    # DataFrame nuevo: vigencias y precios se vuelven a factorizar
+    resultados["diferencias entre fechas (tras escrituras)"] = medir(
+        lambda _: diferencias("2025-01-01 12:00:00", "2025-01-03 12:00:00"), 1
+    )
+
+    salida = []
+    print(f"{'ruta':<40}{'p50 (ms)':>12}{'p95 (ms)':>12}{'RSS pico (MB)':>15}")
+    for nombre, r in resultados.items():
+        print(f"{nombre:<40}{r['p50_ms']:>12.2f}{r['p95_ms']:>12.2f}{r['rss_pico_mb'] or 0:>15.1f}")
+        salida.append({"filas": filas, "ruta": nombre, **r})
+    return salida
+
+
+def comparar(actual: list[dict], base_json: Path) -> None:
+    base = {(r["filas"], r["ruta"]): r for r in json.loads(base_json.read_text())["resultados"]}
+    print(f"\nComparación contra {base_json} (p50, + = más lento)")
+    for r in actual:
+        previo = base.get((r["filas"], r["ruta"]))
+        if previo and previo["p50_ms"]:
+            cambio = (r["p50_ms"] / previo["p50_ms"] - 1) * 100
+            print(f"{r['filas']:>10,} {r['ruta']:<40}{previo['p50_ms']:>10.2f} -> {r['p50_ms']:>10.2f}  {cambio:+6.1f}%")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeticiones", type=int, default=15)
+    parser.add_argument("--salida", type=Path, default=SALIDA_DEFAULT)
+    parser.add_argument("--comparar", type=Path, help="JSON previo para comparar p50")
+    parser.add_argument("--directorio", type=Path, help="dónde crear los libros (default: temporal)")
+    args = parser.parse_args()
+
+    bd_original, exports_original = db.DB_PATH, jobs.DIRECTORIO_EXPORTS
+    with tempfile.TemporaryDirectory() as tmp:
+        directorio = args.directorio or Path(tmp)
+        directorio.mkdir(parents=True, exist_ok=True)
+        # Los exports medidos no tocan el caché de la app
+        jobs.DIRECTORIO_EXPORTS = directorio / "exports"
+        resultados = []
+        for filas in args.filas:
+            resultados += correr_rutas(filas, args.repeticiones, directorio)
+        db.configurar(bd_original)  # cierra conexiones antes de borrar el temporal
+        jobs.DIRECTORIO_EXPORTS = exports_original
+
+    args.salida.parent.mkdir(parents=True, exist_ok=True)
+    args.salida.write_text(json.dumps({
+        "meta": {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "pandas": pd.__version__,
+            "plataforma": platform.platform(),
+            "repeticiones": args.repeticiones,
+        },
+        "resultados": resultados,
+    }, indent=2, ensure_ascii=False))
+    print(f"\nResultados: {args.salida}")
+
+    if args.comparar:
+        comparar(resultados, args.comparar)
+
+
+if __name__ == "__main__":
+    main()
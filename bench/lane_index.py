@@ -0,0 +1,102 @@
+"""
+Benchmark: índice de carriles (bitsets) vs. máscaras pandas encadenadas.
+
+    python -m bench.lane_index --filas 100000 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from core.lane_index import IndiceCarriles
+from core.queries import COLUMNAS_RESULTADO, FILTROS_BUSQUEDA
+
+
+def generar_df(filas: int, semilla: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(semilla)
+
+    def elegir(prefijo: str, n: int) -> np.ndarray:
+        return np.array([f"{prefijo}{i}" for i in range(n)], dtype=object)[rng.integers(0, n, filas)]
+
+    df = pd.DataFrame({
+        "id": np.arange(1, filas + 1),
+        "ID_TARIFA": np.arange(1, filas + 1, dtype=float),
+        "VERSION": 1,
+        "CLIENTE": elegir("CLIENTE ", 200),
+        "TRANSPORTISTA": elegir("TRANSPORTISTA ", 150),
+        "TIPO_DE_OPERACION": elegir("OPERACION ", 9),
+        "TIPO_DE_VIAJE": elegir("VIAJE ", 3),
+        "TIPO_UNIDAD": elegir("UNIDAD ", 21),
+        "PAIS_ORIGEN": elegir("PAIS ", 3),
+        "ESTADO_ORIGEN": elegir("ESTADO ", 96),
+        "CIUDAD_ORIGEN": elegir("CIUDAD ", 450),
+        "PAIS_DESTINO": elegir("PAIS ", 3),
+        "ESTADO_DESTINO": elegir("ESTADO ", 96),
+        "CIUDAD_DESTINO": elegir("CIUDAD ", 450),
+        "PRECIO_VIAJE_SENCILLO": rng.uniform(1000, 9000, filas).round(2),
+        "PRECIO_VIAJE_REDONDO": rng.uniform(2000, 15000, filas).round(2),
+        "ALL_IN": rng.uniform(800, 8000, filas).round(2),
+    })
+    return df[COLUMNAS_RESULTADO]
+
+
+def mascaras_encadenadas(df: pd.DataFrame, filtros: dict) -> pd.DataFrame:
+    """Lo que hacía app.py: una máscara booleana (y un DataFrame nuevo) por filtro."""
+    for clave, valor in filtros.items():
+        if valor in (None, "", "Todos"):
+            continue
+        df = df[df[FILTROS_BUSQUEDA[clave]] == valor]
+    return df
+
+
+ESCENARIOS = {
+    "cliente": {"cliente": "CLIENTE 5"},
+    "cliente+transportista": {"cliente": "CLIENTE 5", "transportista": "TRANSPORTISTA 3"},
+    "ruta completa": {
+        "pais_origen": "PAIS 0", "estado_origen": "ESTADO 10", "ciudad_origen": "CIUDAD 20",
+        "pais_destino": "PAIS 1", "estado_destino": "ESTADO 11",
+    },
+    "todos los filtros": {
+        "cliente": "CLIENTE 5", "transportista": "TRANSPORTISTA 3", "tipo_operacion": "OPERACION 1",
+        "tipo_viaje": "VIAJE 0", "tipo_unidad": "UNIDAD 2", "pais_origen": "PAIS 0",
+    },
+}
+
+
+def medir(fn, repeticiones: int) -> float:
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fn()
+        tiempos.append(time.perf_counter() - inicio)
+    return float(np.median(tiempos)) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--filas", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--repeticiones", type=int, default=7)
+    args = parser.parse_args()
+
+    for filas in args.filas:
+        df = generar_df(filas)
+        inicio = time.perf_counter()
+        indice = IndiceCarriles(df)
+        construccion = (time.perf_counter() - inicio) * 1000
+        print(f"\n{filas:,} filas | construcción del índice: {construccion:.0f} ms")
+        print(f"{'escenario':<24}{'máscaras (ms)':>15}{'índice frío (ms)':>18}{'índice (ms)':>13}{'filas':>8}")
+
+        for nombre, filtros in ESCENARIOS.items():
+            mascaras = medir(lambda: mascaras_encadenadas(df, filtros), args.repeticiones)
+            for col in indice.columnas.values():
+                col.bitsets.clear()
+            frio = medir(lambda: indice.posiciones(filtros), 1)
+            caliente = medir(lambda: indice.posiciones(filtros), args.repeticiones)
+            n = len(indice.posiciones(filtros))
+            assert n == len(mascaras_encadenadas(df, filtros))
+            print(f"{nombre:<24}{mascaras:>15.2f}{frio:>18.2f}{caliente:>13.3f}{n:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Archivo de versiones viejas: las versiones inactivas que dejaron de valer hace
+más de RETENCION_DIAS se mueven de tarifario_estandar a tarifario_historial.
+
+La tabla caliente (la que leen el buscador, la cotización y la copia en memoria)
+deja de cargar historia; la vista tarifario_con_historial (UNION ALL de las dos)
+es la que leen los historiales, así que para ellos no cambia nada.
+
+    python -m core.archive --dias 365
+
+Nunca se archiva la última versión de un ID_TARIFA: MAX(VERSION) / MAX(ID_TARIFA)
+y la versión base de la edición siguen saliendo de la tabla caliente.
+"""
+import argparse
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from core import db
+from core.db import conexion_lectura, ejecutar_escritura
+from core.queries import FORMATO_FECHA
+from core.services import TABLA_TARIFARIO, cache_por_version
+
+TABLA_HISTORIAL = "tarifario_historial"
+VISTA_CON_HISTORIAL = "tarifario_con_historial"
+
+RETENCION_DIAS = 365
+# Filas por transacción del escritor: otras escrituras no esperan al archivo completo
+LOTE_ARCHIVO = 5_000
+
+SQL_CANDIDATAS_ARCHIVO = f"""
+SELECT t.id FROM {TABLA_TARIFARIO} t
+WHERE t.id > ? AND t.ACTIVA = 0 AND t.VIGENTE_HASTA < ?
+  AND (
+      t.ID_TARIFA IS NULL
+      OR t.VERSION < (SELECT MAX(m.VERSION) FROM {TABLA_TARIFARIO} m WHERE m.ID_TARIFA = t.ID_TARIFA)
+  )
+ORDER BY t.id
+LIMIT ?
+"""
+
+
+@dataclass
+class ResultadoArchivo:
+    corte: str
+    filas: int = 0
+    lotes: int = 0
+    segundos: float = 0.0
+    filas_activa_antes: int = 0
+    filas_activa_despues: int = 0
+    bytes_activa_antes: int | None = None
+    bytes_activa_despues: int | None = None
+    bytes_historial: int | None = None
+    scan_ms_antes: float | None = None
+    scan_ms_despues: float | None = None
+
+    @property
+    def bytes_ahorrados(self) -> int | None:
+        if self.bytes_activa_antes is None or self.bytes_activa_despues is None:
+            return None
+        return self.bytes_activa_antes - self.bytes_activa_despues
+
+
+# =====================================================
+# ESQUEMA (TABLA + VISTA)
+# =====================================================
+def _columnas(conn, tabla: str) -> list[str]:
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({tabla})")]
+
+
+def sincronizar_historial(conn) -> None:
+    """
+    Crea tarifario_historial con el esquema de tarifario_estandar (o le agrega
+    las columnas que migraciones posteriores sumaron a la caliente) y rehace la
+    vista con la lista explícita de columnas.
+    """
+    if not _columnas(conn, TABLA_HISTORIAL):
+        crear = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (TABLA_TARIFARIO,)
+        ).fetchone()[0]
+        # Mismo CREATE TABLE (tipos, defaults); los ids se copian tal cual
+        conn.execute(crear.replace(TABLA_TARIFARIO, TABLA_HISTORIAL, 1).replace(" AUTOINCREMENT", "", 1))
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS ix_historial_id_version ON {TABLA_HISTORIAL} (ID_TARIFA, VERSION)"
+        )
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS ix_historial_carril_vigencia ON {TABLA_HISTORIAL} (LANE_KEY, VIGENTE_DESDE)"
+        )
+    else:
+        tipos = {r[1]: r[2] for r in conn.execute(f"PRAGMA table_info({TABLA_TARIFARIO})")}
+        existentes = set(_columnas(conn, TABLA_HISTORIAL))
+        for columna, tipo in tipos.items():
+            if columna not in existentes:
+                conn.execute(f'ALTER TABLE {TABLA_HISTORIAL} ADD COLUMN "{columna}" {tipo}')
+
+    columnas = ", ".join(f'"{c}"' for c in _columnas(conn, TABLA_TARIFARIO))
+    conn.execute(f"DROP VIEW IF EXISTS {VISTA_CON_HISTORIAL}")
+    conn.execute(
+        f"""
+        CREATE VIEW {VISTA_CON_HISTORIAL} AS
+        SELECT {columnas} FROM {TABLA_TARIFARIO}
+        UNION ALL
+        SELECT {columnas} FROM {TABLA_HISTORIAL}
+        """
+    )
+
+
+# =====================================================
+# MEDICIONES
+# =====================================================
+def bytes_tabla(conn, tabla: str) -> int | None:
+    """Bytes de la tabla y sus índices (dbstat); None si SQLite se compiló sin dbstat."""
+    try:
+        return conn.execute(
+            """
+            SELECT COALESCE(SUM(d.pgsize), 0) FROM dbstat d
+            JOIN sqlite_master m ON m.name = d.name
+            WHERE m.tbl_name = ?
+            """,
+            (tabla,),
+        ).fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+
+
+def ms_recorrido(conn, tabla: str) -> float:
+    """Lo que cuesta un SELECT * completo de la tabla (lo que hacen la copia en memoria y los exports)."""
+    inicio = time.perf_counter()
+    cursor = conn.execute(f"SELECT * FROM {tabla}")
+    while cursor.fetchmany(LOTE_ARCHIVO):
+        pass
+    return (time.perf_counter() - inicio) * 1000
+
+
+def _medir(recorrido: bool) -> tuple[int, int | None, float | None]:
+    """(filas, bytes, ms de SELECT * completo) de la tabla caliente."""
+    with conexion_lectura() as conn:
+        filas = conn.execute(f"SELECT COUNT(*) FROM {TABLA_TARIFARIO}").fetchone()[0]
+        scan = ms_recorrido(conn, TABLA_TARIFARIO) if recorrido else None
+        return filas, bytes_tabla(conn, TABLA_TARIFARIO), scan
+
+
+# =====================================================
+# ARCHIVO
+# =====================================================
+def archivar(dias: int = RETENCION_DIAS, lote: int = LOTE_ARCHIVO, medir: bool = True) -> ResultadoArchivo:
+    """
+    Mueve a tarifario_historial las versiones inactivas con VIGENTE_HASTA anterior
+    a hoy - dias (salvo la última versión de cada ID_TARIFA), en lotes de `lote`
+    filas: cada lote es una transacción del escritor (INSERT en historial + DELETE).
+    medir=True reporta tamaño y tiempo de un recorrido completo antes / después.
+    """
+    corte = (datetime.now() - timedelta(days=dias)).strftime(FORMATO_FECHA)
+    resultado = ResultadoArchivo(corte=corte)
+    inicio = time.perf_counter()
+    resultado.filas_activa_antes, resultado.bytes_activa_antes, resultado.scan_ms_antes = _medir(medir)
+
+    ejecutar_escritura(sincronizar_historial)
+    with conexion_lectura() as conn:
+        columnas = ", ".join(f'"{c}"' for c in _columnas(conn, TABLA_TARIFARIO))
+
+    def mover_lote(conn, desde_id):
+        ids = [r[0] for r in conn.execute(SQL_CANDIDATAS_ARCHIVO, (desde_id, corte, lote))]
+        if not ids:
+            return 0, desde_id
+        marcas = ", ".join("?" * len(ids))
+        conn.execute(
+            f"INSERT INTO {TABLA_HISTORIAL} ({columnas}) "
+            f"SELECT {columnas} FROM {TABLA_TARIFARIO} WHERE id IN ({marcas})",
+            ids,
+        )
+        conn.execute(f"DELETE FROM {TABLA_TARIFARIO} WHERE id IN ({marcas})", ids)
+        return len(ids), ids[-1]
+
+    ultimo_id = 0
+    while True:
+        movidas, ultimo_id = ejecutar_escritura(lambda conn: mover_lote(conn, ultimo_id), timeout=None)
+        if not movidas:
+            break
+        resultado.filas += movidas
+        resultado.lotes += 1
+
+    resultado.filas_activa_despues, resultado.bytes_activa_despues, resultado.scan_ms_despues = _medir(medir)
+    with conexion_lectura() as conn:
+        resultado.bytes_historial = bytes_tabla(conn, TABLA_HISTORIAL)
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
+
+
+@cache_por_version(TABLA_HISTORIAL)
+def cargar_historial() -> pd.DataFrame:
+    """Versiones archivadas (en memoria solo cuando se consulta una fecha anterior al corte)."""
+    with conexion_lectura() as conn:
+        if not _columnas(conn, TABLA_HISTORIAL):
+            return pd.DataFrame()
+        return pd.read_sql(f"SELECT * FROM {TABLA_HISTORIAL} ORDER BY id", conn)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dias", type=int, default=RETENCION_DIAS, help="retención en la tabla caliente")
+    parser.add_argument("--lote", type=int, default=LOTE_ARCHIVO)
+    parser.add_argument("--sin-medir", action="store_true", help="no medir el recorrido antes / después")
+    args = parser.parse_args()
+
+    from core.migrations import aplicar_migraciones  # migrations importa este módulo
+
+    aplicar_migraciones()
+    r = archivar(args.dias, args.lote, medir=not args.sin_medir)
+    print(f"BD: {db.DB_PATH} | corte: {r.corte}")
+    print(f"archivadas: {r.filas:,} en {r.lotes} lotes, {r.segundos:.2f} s")
+    print(f"filas en {TABLA_TARIFARIO}: {r.filas_activa_antes:,} -> {r.filas_activa_despues:,}")
+    if r.bytes_ahorrados is not None:
+        print(
+            f"tamaño {TABLA_TARIFARIO}: {r.bytes_activa_antes / 2**20:,.1f} MB -> "
+            f"{r.bytes_activa_despues / 2**20:,.1f} MB ({TABLA_HISTORIAL}: {r.bytes_historial / 2**20:,.1f} MB)"
+        )
+    if r.scan_ms_antes is not None:
+        print(f"SELECT * completo: {r.scan_ms_antes:,.0f} ms -> {r.scan_ms_despues:,.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+
+import pandas as pd
+
+from core import db
+from core.db import conexion_lectura
+from core.queries import TABLAS_CATALOGO
+from core.services import TABLA_TARIFARIO, cache_por_version
+
+# tabla -> (columna id, columna nombre, columna padre, ¿tiene ACTIVO?)
+# Las tablas sin llave propia usan el rowid de SQLite como id.
+ESQUEMA_CATALOGOS = {
+    "CAT_CLIENTES": ("rowid", "CLIENTE", None, True),
+    "CAT_TRANSPORTISTAS": ("rowid", "TRANSPORTISTA", None, True),
+    "CAT_TIPO_OPERACION": ("rowid", "TIPO_OPERACION", None, False),
+    "CAT_TIPO_VIAJE": ("rowid", "TIPO_VIAJE", None, False),
+    "CAT_TIPO_UNIDAD": ("rowid", "TIPO_UNIDAD", None, False),
+    "CAT_PAISES": ("ID_PAIS", "PAIS", None, True),
+    "CAT_ESTADOS_NEW": ("ID_ESTADO", "ESTADO", "ID_PAIS", True),
+    "CAT_CIUDADES": ("ID_CIUDAD", "CIUDAD", "ID_ESTADO", True),
+}
+
+
+@dataclass(frozen=True)
+class Catalogo:
+    """Foto inmutable de una tabla de catálogo, ordenada por nombre."""
+
+    tabla: str
+    version: int
+    ids: tuple
+    nombres: tuple
+    padres: tuple
+    activos: tuple
+    nombres_activos: tuple
+    nombres_inactivos: tuple
+    id_por_nombre: MappingProxyType  # nombre -> id, o (id_padre, nombre) -> id si hay padre
+    nombre_por_id: MappingProxyType
+
+    def lista(self, solo_activos: bool = True) -> tuple:
+        return self.nombres_activos if solo_activos else self.nombres
+
+    def id_de(self, nombre, id_padre=None):
+        clave = nombre if id_padre is None else (id_padre, nombre)
+        return self.id_por_nombre.get(clave)
+
+    def ids_con_nombre(self, nombre) -> tuple:
+        """Todos los ids con ese nombre, bajo cualquier padre (activos o no)."""
+        return tuple(i for i, n in zip(self.ids, self.nombres) if n == nombre)
+
+    def a_dataframe(self, con_activo: bool = True) -> pd.DataFrame:
+        """Vista tabular para las pantallas de administración."""
+        _, col_nombre, _, tiene_activo = ESQUEMA_CATALOGOS[self.tabla]
+        datos = {col_nombre: list(self.nombres)}
+        if con_activo and tiene_activo:
+            datos["ACTIVO"] = list(self.activos)
+        return pd.DataFrame(datos)
+
+
+def _cargar(conn, tabla: str, version: int) -> Catalogo:
+    col_id, col_nombre, col_padre, tiene_activo = ESQUEMA_CATALOGOS[tabla]
+    filas = conn.execute(
+        f"""
+        SELECT {col_id}, {col_nombre}, {col_padre or 'NULL'}, {'ACTIVO' if tiene_activo else '1'}
+        FROM {tabla}
+        WHERE {col_nombre} IS NOT NULL
+        ORDER BY {col_nombre}
+        """
+    ).fetchall()
+
+    ids = tuple(f[0] for f in filas)
+    nombres = tuple(str(f[1]).strip() for f in filas)
+    padres = tuple(f[2] for f in filas)
+    activos = tuple(1 if f[3] is None else int(f[3]) for f in filas)  # ACTIVO DEFAULT 1
+
+    if col_padre:
+        id_por_nombre = {(p, n): i for i, n, p in zip(ids, nombres, padres)}
+    else:
+        id_por_nombre = {n: i for i, n in zip(ids, nombres)}
+
+    return Catalogo(
+        tabla=tabla,
+        version=version,
+        ids=ids,
+        nombres=nombres,
+        padres=padres,
+        activos=activos,
+        nombres_activos=tuple(n for n, a in zip(nombres, activos) if a == 1),
+        nombres_inactivos=tuple(n for n, a in zip(nombres, activos) if a == 0),
+        id_por_nombre=MappingProxyType(id_por_nombre),
+        nombre_por_id=MappingProxyType(dict(zip(ids, nombres))),
+    )
+
+
+_catalogos: dict = {}
+_catalogos_db = None
+_lock = threading.Lock()
+recargas = {tabla: 0 for tabla in TABLAS_CATALOGO}
+
+
+def obtener_catalogos() -> MappingProxyType:
+    """
+    Todos los catálogos, compartidos por todas las sesiones.
+    Una consulta a control_cambios por llamada; solo se recarga
+    el catálogo cuya VERSION cambió (p. ej. el que tocó una acción de admin).
+    """
+    global _catalogos, _catalogos_db
+    with _lock, conexion_lectura() as conn:
+        conn.execute("BEGIN")
+        try:
+            versiones = dict(conn.execute("SELECT TABLA, VERSION FROM control_cambios").fetchall())
+            if _catalogos_db != db.DB_PATH:
+                _catalogos, _catalogos_db = {}, db.DB_PATH
+
+            nuevos = dict(_catalogos)
+            for tabla in TABLAS_CATALOGO:
+                version = versiones.get(tabla, 0)
+                actual = nuevos.get(tabla)
+                if actual is None or actual.version != version:
+                    nuevos[tabla] = _cargar(conn, tabla, version)
+                    recargas[tabla] += 1
+            _catalogos = nuevos
+        finally:
+            conn.rollback()
+        return MappingProxyType(_catalogos)
+
+
+def catalogo(tabla: str) -> Catalogo:
+    return obtener_catalogos()[tabla]
+
+
+# =====================================================
+# VALORES PRESENTES EN EL TARIFARIO (dropdowns de cotización)
+# =====================================================
+@cache_por_version(TABLA_TARIFARIO)
+def valores_tarifario(columnas: tuple, solo_activas: bool = True) -> MappingProxyType:
+    """
+    Valores distintos de varias columnas de tarifario_estandar en UNA lectura
+    (antes: un SELECT DISTINCT + PRAGMA table_info por columna).
+    Columnas que no existen en la tabla regresan vacías.
+    """
+    with conexion_lectura() as conn:
+        existentes = {r[1] for r in conn.execute(f"PRAGMA table_info({TABLA_TARIFARIO})")}
+        pedidas = [c for c in columnas if c in existentes]
+        where = "WHERE ACTIVA = 1" if (solo_activas and "ACTIVA" in existentes) else ""
+        df = (
+            pd.read_sql(f"SELECT {', '.join(pedidas)} FROM {TABLA_TARIFARIO} {where}", conn)
+            if pedidas else pd.DataFrame()
+        )
+
+    valores = {}
+    for c in columnas:
+        if c in df.columns:
+            valores[c] = tuple(df[c].dropna().astype(str).unique())
+        else:
+            valores[c] = ()
+    return MappingProxyType(valores)
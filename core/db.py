@@ -1,9 +1,1007 @@
+import atexit
+import bisect
+import os
+import queue
+import re
 import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
-DB_PATH = BASE_DIR / "tarifario.db"
+DB_PATH = Path(os.environ.get("TARIFARIO_DB", BASE_DIR / "tarifario.db"))
 
-def get_connection():
-    return sqlite3.connect(DB_PATH)
+# Conexiones de lectura máximas por proceso (todas las sesiones Streamlit)
+POOL_LECTURA = 8
+# Segundos que un hilo espera una conexión libre antes de fallar
+POOL_TIMEOUT = 30.0
+# Trabajos de escritura máximos agrupados en una sola transacción
+LOTE_ESCRITURA = 64
+# Cada cuántos segundos se revisa si la réplica de lectura quedó vieja
+REFRESCO_REPLICA_S = 15.0
 
+# Medición de cada sentencia SQL (TARIFARIO_SQL_STATS=0 la apaga)
+INSTRUMENTAR_SQL = os.environ.get("TARIFARIO_SQL_STATS", "1") != "0"
+# Sentencias más lentas que esto se guardan (con su EXPLAIN QUERY PLAN en el diagnóstico)
+SQL_LENTA_MS = 250.0
+SQL_LENTAS_MAX = 50
+# Sentencias distintas que se agregan; las demás caen en "(otras)"
+SQL_SENTENCIAS_MAX = 500
+# Límites (ms) de las cubetas del histograma de latencia
+CUBETAS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+# Filas que se miden para estimar los bytes de un fetch grande
+MUESTRA_BYTES = 64
+
+PRAGMAS = {
+    "synchronous": "NORMAL",     # seguro con WAL; fsync solo en checkpoint
+    "cache_size": -32000,        # ~32 MB de caché de páginas por conexión
+    "mmap_size": 268435456,      # 256 MB de lectura vía mmap
+    "temp_store": "MEMORY",      # ORDER BY / GROUP BY temporales en RAM
+    "busy_timeout": 5000,
+    "foreign_keys": "ON",
+}
+
+
+# =====================================================
+# INSTRUMENTACIÓN DE SQL
+# =====================================================
+# Toda conexión de los pools y del escritor mide cada sentencia (tiempo de
+# execute + fetch, filas, bytes leídos y quién la mandó): pd.read_sql y
+# conn.execute pasan por aquí sin tocar a quien llama.
+
+
+class _Medicion:
+    __slots__ = ("sql", "params", "origen", "funcion", "ms", "filas", "bytes", "cuando")
+
+    def __init__(self, sql: str, params, origen: str, funcion: str):
+        self.sql = sql
+        self.params = params
+        self.origen = origen
+        self.funcion = funcion
+        self.ms = 0.0
+        self.filas = 0
+        self.bytes = 0
+        self.cuando = time.time()
+
+
+class _Agregado:
+    """Conteos y histograma de latencia de un grupo de sentencias."""
+
+    __slots__ = ("llamadas", "ms_total", "ms_max", "filas", "bytes", "cubetas", "funciones")
+
+    def __init__(self):
+        self.llamadas = 0
+        self.ms_total = 0.0
+        self.ms_max = 0.0
+        self.filas = 0
+        self.bytes = 0
+        self.cubetas = [0] * (len(CUBETAS_MS) + 1)
+        self.funciones: dict[str, int] = {}
+
+    def sumar(self, m: _Medicion) -> None:
+        self.llamadas += 1
+        self.ms_total += m.ms
+        self.ms_max = max(self.ms_max, m.ms)
+        self.filas += m.filas
+        self.bytes += m.bytes
+        self.cubetas[bisect.bisect_left(CUBETAS_MS, m.ms)] += 1
+        self.funciones[m.funcion] = self.funciones.get(m.funcion, 0) + 1
+
+    def fila(self) -> dict:
+        return {
+            "llamadas": self.llamadas,
+            "ms_total": round(self.ms_total, 2),
+            "ms_promedio": round(self.ms_total / self.llamadas, 3) if self.llamadas else 0.0,
+            "ms_max": round(self.ms_max, 2),
+            "filas": self.filas,
+            "bytes": self.bytes,
+            **dict(zip(ETIQUETAS_CUBETAS, self.cubetas)),
+            "funciones": ", ".join(sorted(self.funciones, key=self.funciones.get, reverse=True)[:3]),
+        }
+
+
+ETIQUETAS_CUBETAS = [f"≤{c} ms" for c in CUBETAS_MS] + [f">{CUBETAS_MS[-1]} ms"]
+
+_sql_lock = threading.Lock()
+_por_sentencia: dict[str, _Agregado] = {}
+_por_origen: dict[str, _Agregado] = {}
+_lentas: deque = deque(maxlen=SQL_LENTAS_MAX)
+_sql_desde = time.time()
+_planes: dict[str, str] = {}
+# Origen de los trabajos del escritor: la página que llamó a ejecutar_escritura()
+_contexto = threading.local()
+
+_RAIZ = str(BASE_DIR) + os.sep
+_ENVOLTURA = frozenset({"execute", "executemany", "executescript", "_iniciar_medicion", "_origen_sql"})
+_RE_ESPACIOS = re.compile(r"\s+")
+_RE_LISTA_IN = re.compile(r"\?(?:\s*,\s*\?)+")
+_RE_REGLA = re.compile(r"^#\s*[=\-]{5,}\s*$")
+
+
+@lru_cache(maxsize=2048)
+def _normalizar_sql(sql: str) -> str:
+    """Un renglón, y los IN (?, ?, …) de cualquier largo como una sola sentencia."""
+    return _RE_LISTA_IN.sub("?, …", _RE_ESPACIOS.sub(" ", sql).strip())
+
+
+@lru_cache(maxsize=64)
+def _bloques(archivo: str) -> tuple[list[int], list[str]]:
+    """Líneas y títulos de los encabezados '# =====' / '# TÍTULO' de una página."""
+    try:
+        lineas = Path(archivo).read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return [], []
+    numeros, titulos = [], []
+    for i in range(1, len(lineas)):
+        actual = lineas[i].strip()
+        if _RE_REGLA.match(lineas[i - 1].strip()) and actual.startswith("#") and not _RE_REGLA.match(actual):
+            numeros.append(i + 1)
+            titulos.append(actual.lstrip("# ").strip())
+    return numeros, titulos
+
+
+def _bloque(archivo: str, linea: int) -> str:
+    numeros, titulos = _bloques(archivo)
+    i = bisect.bisect_right(numeros, linea) - 1
+    return titulos[i] if i >= 0 else "inicio"
+
+
+# code object -> (archivo:función o None, ruta de la página o None); un dict.get por frame
+_frames: dict = {}
+
+
+def _clasificar(codigo) -> tuple[str | None, str | None]:
+    archivo = codigo.co_filename
+    if not archivo.startswith(_RAIZ) or "site-packages" in archivo:
+        return None, None
+    if archivo == __file__ and codigo.co_name in _ENVOLTURA:
+        return None, None
+    relativo = archivo[len(_RAIZ):]
+    pagina = archivo if relativo == "app.py" or relativo.startswith("pages" + os.sep) else None
+    return f"{relativo}:{codigo.co_name}", pagina
+
+
+def _origen_sql() -> tuple[str, str]:
+    """(página · bloque, archivo:función) de quien mandó la sentencia."""
+    funcion = None
+    f = sys._getframe(1)
+    while f is not None:
+        clase = _frames.get(f.f_code)
+        if clase is None:
+            clase = _frames[f.f_code] = _clasificar(f.f_code)
+        nombre, pagina = clase
+        if funcion is None:
+            funcion = nombre
+        if pagina is not None:
+            relativo = pagina[len(_RAIZ):]
+            return f"{relativo} · {_bloque(pagina, f.f_lineno)}", funcion
+        f = f.f_back
+    origen = getattr(_contexto, "origen", None) or f"(hilo {threading.current_thread().name})"
+    return origen, funcion or "?"
+
+
+def _iniciar_medicion(sql: str, params) -> _Medicion | None:
+    if sql.lstrip()[:7].upper() == "EXPLAIN":
+        return None  # los planes que pide el diagnóstico no cuentan
+    return _Medicion(sql, params, *_origen_sql())
+
+
+def _bytes_filas(filas) -> int:
+    """Bytes leídos estimados: texto / blobs por su largo, números 8; con muestra si son muchas filas."""
+    if not filas:
+        return 0
+    muestra = filas[:MUESTRA_BYTES]
+    total = 0
+    for fila in muestra:
+        for v in fila:
+            if v is not None:
+                total += len(v) if isinstance(v, (str, bytes)) else 8
+    return total * len(filas) // len(muestra)
+
+
+def _registrar(m: _Medicion) -> None:
+    sentencia = _normalizar_sql(m.sql)
+    with _sql_lock:
+        if sentencia not in _por_sentencia and len(_por_sentencia) >= SQL_SENTENCIAS_MAX:
+            sentencia = "(otras)"
+        for grupos, clave in ((_por_sentencia, sentencia), (_por_origen, m.origen)):
+            agregado = grupos.get(clave)
+            if agregado is None:
+                agregado = grupos[clave] = _Agregado()
+            agregado.sumar(m)
+        if m.ms >= SQL_LENTA_MS:
+            _lentas.append(m)
+
+
+class CursorInstrumentado(sqlite3.Cursor):
+    """
+    Cursor que mide cada sentencia. La medición queda abierta mientras se
+    leen filas y se registra al agotarse, al volver a ejecutar o al soltarse
+    el cursor. Las filas leídas iterando el cursor no se cuentan (medirlas
+    costaría una llamada de Python por fila); su tiempo tampoco.
+    """
+
+    _medicion: _Medicion | None = None
+
+    def _cerrar_medicion(self) -> None:
+        m = self._medicion
+        if m is not None:
+            self._medicion = None
+            _registrar(m)
+
+    def _medir(self, m: _Medicion | None, metodo, *args):
+        self._cerrar_medicion()
+        inicio = time.perf_counter()
+        try:
+            resultado = metodo(*args)
+        except Exception:
+            if m is not None:
+                m.ms = (time.perf_counter() - inicio) * 1000
+                _registrar(m)
+            raise
+        if m is not None:
+            m.ms = (time.perf_counter() - inicio) * 1000
+            if self.rowcount > 0:  # INSERT / UPDATE / DELETE: filas afectadas
+                m.filas = self.rowcount
+            self._medicion = m
+        return resultado
+
+    def execute(self, sql, params=()):
+        return self._medir(_iniciar_medicion(sql, params), super().execute, sql, params)
+
+    def executemany(self, sql, filas):
+        return self._medir(_iniciar_medicion(sql, None), super().executemany, sql, filas)
+
+    def executescript(self, script):
+        return self._medir(_iniciar_medicion(script, None), super().executescript, script)
+
+    def _leidas(self, inicio: float, filas, agotado: bool) -> None:
+        m = self._medicion
+        if m is None:
+            return
+        m.ms += (time.perf_counter() - inicio) * 1000
+        m.filas += len(filas)
+        m.bytes += _bytes_filas(filas)
+        if agotado:
+            self._cerrar_medicion()
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        fila = super().fetchone()
+        self._leidas(inicio, () if fila is None else (fila,), fila is None)
+        return fila
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        inicio = time.perf_counter()
+        filas = super().fetchmany(size)
+        self._leidas(inicio, filas, len(filas) < size)
+        return filas
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        filas = super().fetchall()
+        self._leidas(inicio, filas, True)
+        return filas
+
+    def close(self):
+        self._cerrar_medicion()
+        super().close()
+
+    def __del__(self):
+        self._cerrar_medicion()
+
+
+class ConexionInstrumentada(sqlite3.Connection):
+    """Conexión cuyos execute* pasan por CursorInstrumentado (los de sqlite3 no usan cursor())."""
+
+    def cursor(self, factory=CursorInstrumentado):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, filas):
+        return self.cursor().executemany(sql, filas)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+
+def _conectar(destino: str, **kwargs) -> sqlite3.Connection:
+    fabrica = ConexionInstrumentada if INSTRUMENTAR_SQL else sqlite3.Connection
+    return sqlite3.connect(destino, factory=fabrica, **kwargs)
+
+
+def _configurar_conexion(conn: sqlite3.Connection) -> None:
+    """Pragmas y row factory comunes; se aplican una sola vez por conexión."""
+    conn.row_factory = sqlite3.Row
+    for pragma, valor in PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma} = {valor}")
+
+
+def _activar_wal(db_path: Path) -> None:
+    """WAL es persistente en el archivo: basta activarlo una vez por proceso."""
+    conn = sqlite3.connect(str(db_path))
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+    finally:
+        conn.close()
+
+
+class ConnectionPool:
+    """
+    Pool acotado de conexiones SQLite.
+
+    - Una conexión prestada se reutiliza si el mismo hilo vuelve a pedirla
+      (llamadas anidadas no consumen otra conexión).
+    - Si no hay conexiones libres y ya se alcanzó el máximo, el hilo espera.
+    """
+
+    def __init__(self, db_path: Path, max_conexiones: int, solo_lectura: bool, inmutable: bool = False):
+        self.db_path = Path(db_path)
+        self.max_conexiones = max_conexiones
+        self.solo_lectura = solo_lectura
+        self.inmutable = inmutable
+        self._cerrado = False
+
+        self._libres: queue.LifoQueue = queue.LifoQueue()
+        self._creadas = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        self.hits = 0
+        self.misses = 0
+        self.esperas = 0
+        self.tiempo_espera = 0.0
+
+    def _abrir(self) -> sqlite3.Connection:
+        if self.solo_lectura:
+            # immutable=1: el archivo no cambia nunca (réplica); SQLite no toma locks ni busca WAL
+            modo = "mode=ro&immutable=1" if self.inmutable else "mode=ro"
+            conn = _conectar(
+                f"file:{self.db_path}?{modo}",
+                uri=True,
+                check_same_thread=False,
+            )
+        else:
+            conn = _conectar(str(self.db_path), check_same_thread=False)
+        _configurar_conexion(conn)
+        return conn
+
+    def _tomar(self) -> sqlite3.Connection:
+        try:
+            conn = self._libres.get_nowait()
+            with self._lock:
+                self.hits += 1
+            return conn
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._creadas < self.max_conexiones:
+                self._creadas += 1
+                self.misses += 1
+                crear = True
+            else:
+                crear = False
+
+        if crear:
+            try:
+                return self._abrir()
+            except Exception:
+                with self._lock:
+                    self._creadas -= 1
+                raise
+
+        inicio = time.perf_counter()
+        try:
+            conn = self._libres.get(timeout=POOL_TIMEOUT)
+        except queue.Empty:
+            raise TimeoutError(
+                f"Pool de conexiones agotado ({self.max_conexiones}) para {self.db_path}"
+            )
+        with self._lock:
+            self.esperas += 1
+            self.hits += 1
+            self.tiempo_espera += time.perf_counter() - inicio
+        return conn
+
+    def _devolver(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        if self._cerrado:
+            # Pool retirado (configurar() / réplica reemplazada): la conexión ya no vuelve
+            conn.close()
+            with self._lock:
+                self._creadas -= 1
+            return
+        self._libres.put(conn)
+
+    @contextmanager
+    def conexion(self):
+        prestada = getattr(self._local, "conn", None)
+        if prestada is not None:
+            self._local.profundidad += 1
+            try:
+                yield prestada
+            finally:
+                self._local.profundidad -= 1
+            return
+
+        conn = self._tomar()
+        self._local.conn = conn
+        self._local.profundidad = 1
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._local.profundidad = 0
+            self._devolver(conn)
+
+    def cerrar(self) -> None:
+        """Cierra las conexiones libres; las prestadas se cierran al devolverse."""
+        self._cerrado = True
+        while True:
+            try:
+                conn = self._libres.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._creadas -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max": self.max_conexiones,
+                "abiertas": self._creadas,
+                "libres": self._libres.qsize(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "esperas": self.esperas,
+                "tiempo_espera_s": round(self.tiempo_espera, 6),
+            }
+
+
+class EscritorSQLite(threading.Thread):
+    """
+    Hilo único dueño de la conexión de escritura.
+
+    Los trabajos (funciones que reciben la conexión) llegan por una cola;
+    los que se acumulan mientras se procesa un lote se agrupan en una sola
+    transacción BEGIN IMMEDIATE, cada uno dentro de su SAVEPOINT para que
+    un error no arrastre a los demás.
+    """
+
+    def __init__(self, db_path: Path):
+        super().__init__(name="tarifario-escritor", daemon=True)
+        self.db_path = Path(db_path)
+        self._cola: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+
+        self.lotes = 0
+        self.trabajos = 0
+        self.errores = 0
+        self.lote_max = 0
+
+    def enviar(self, fn) -> Future:
+        futuro: Future = Future()
+        # Las sentencias del trabajo se atribuyen a la página que lo mandó
+        origen = _origen_sql()[0] if INSTRUMENTAR_SQL else None
+        self._cola.put((fn, futuro, origen))
+        return futuro
+
+    def detener(self) -> None:
+        self._cola.put(None)
+        self.join(timeout=POOL_TIMEOUT)
+
+    def run(self) -> None:
+        conn = _conectar(str(self.db_path), isolation_level=None, check_same_thread=False)
+        _configurar_conexion(conn)
+        try:
+            while True:
+                primero = self._cola.get()
+                if primero is None:
+                    return
+
+                lote = [primero]
+                detener = False
+                while len(lote) < LOTE_ESCRITURA:
+                    try:
+                        siguiente = self._cola.get_nowait()
+                    except queue.Empty:
+                        break
+                    if siguiente is None:
+                        detener = True
+                        break
+                    lote.append(siguiente)
+
+                self._procesar(conn, lote)
+                if detener:
+                    return
+        finally:
+            conn.close()
+
+    def _procesar(self, conn: sqlite3.Connection, lote: list) -> None:
+        resultados = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except Exception as e:
+            for _, futuro, _ in lote:
+                futuro.set_exception(e)
+            return
+
+        for fn, futuro, origen in lote:
+            if not futuro.set_running_or_notify_cancel():
+                continue
+            _contexto.origen = origen
+            conn.execute("SAVEPOINT trabajo")
+            try:
+                resultado = fn(conn)
+                conn.execute("RELEASE trabajo")
+                resultados.append((futuro, resultado, None))
+            except Exception as e:
+                conn.execute("ROLLBACK TO trabajo")
+                conn.execute("RELEASE trabajo")
+                resultados.append((futuro, None, e))
+            finally:
+                _contexto.origen = None
+
+        try:
+            conn.execute("COMMIT")
+        except Exception as e:
+            conn.execute("ROLLBACK")
+            resultados = [(f, None, err or e) for f, _, err in resultados]
+
+        with self._lock:
+            self.lotes += 1
+            self.trabajos += len(resultados)
+            self.errores += sum(1 for _, _, err in resultados if err is not None)
+            self.lote_max = max(self.lote_max, len(resultados))
+
+        for futuro, resultado, err in resultados:
+            if err is not None:
+                futuro.set_exception(err)
+            else:
+                futuro.set_result(resultado)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "en_cola": self._cola.qsize(),
+                "lotes": self.lotes,
+                "trabajos": self.trabajos,
+                "errores": self.errores,
+                "lote_max": self.lote_max,
+                "trabajos_por_lote": round(self.trabajos / self.lotes, 2) if self.lotes else 0.0,
+            }
+
+
+class ReplicaLectura:
+    """
+    Copia de solo lectura de la BD para las pantallas que solo consultan.
+
+    Se arma con la API de backup de SQLite en otro archivo y se abre con
+    mode=ro&immutable=1: sin locks ni WAL, los recorridos largos no compiten
+    con el escritor. Cada refresco escribe un archivo nuevo y cambia de pool
+    de un golpe; la copia anterior se cierra y se borra cuando se devuelve la
+    última conexión que se pidió de ella.
+    Solo se copia de nuevo si PRAGMA data_version dice que alguien escribió.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._pool: ConnectionPool | None = None
+        self._ruta: Path | None = None
+        self._fuente: sqlite3.Connection | None = None
+        self._data_version = None
+        self._lock = threading.Lock()        # cambio de pool
+        self._lock_copia = threading.Lock()  # una copia a la vez
+        self._refrescando = False
+        self._ultimo_chequeo = 0.0
+        # Préstamos en curso por pool, y pools reemplazados que esperan su último préstamo
+        self._prestamos: dict[ConnectionPool, int] = {}
+        self._retirados: dict[ConnectionPool, Path] = {}
+
+        self.generacion = 0
+        self.copias = 0
+        self.sin_cambios = 0
+        self.tiempo_copia = 0.0
+        self.copiada_en = None
+        self.ultimo_error = None
+
+        self.huerfanas_borradas = self._borrar_huerfanas()
+
+    def _ruta_generacion(self, generacion: int) -> Path:
+        # Un archivo por proceso y generación: immutable exige que nadie lo reescriba
+        return self.db_path.with_name(f".{self.db_path.stem}.replica-{os.getpid()}-{generacion}.db")
+
+    def _borrar_huerfanas(self) -> int:
+        """Copias (.db / .tmp) que dejaron procesos que ya no existen (matados sin atexit)."""
+        patron = re.compile(rf"^\.{re.escape(self.db_path.stem)}\.replica-(\d+)-\d+\.(db|tmp)$")
+        borradas = 0
+        for ruta in self.db_path.parent.glob(f".{self.db_path.stem}.replica-*"):
+            m = patron.match(ruta.name)
+            if m is None or int(m.group(1)) == os.getpid() or _proceso_vivo(int(m.group(1))):
+                continue
+            _borrar(ruta)
+            borradas += not ruta.exists()
+        return borradas
+
+    def refrescar(self) -> bool:
+        """Copia la BD si cambió desde la última copia. Devuelve True si hubo copia nueva."""
+        with self._lock_copia:
+            if self._fuente is None:
+                self._fuente = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            version = self._fuente.execute("PRAGMA data_version").fetchone()[0]
+            if self._pool is not None and version == self._data_version:
+                self.sin_cambios += 1
+                return False
+
+            inicio = time.perf_counter()
+            generacion = self.generacion + 1
+            ruta = self._ruta_generacion(generacion)
+            temporal = ruta.with_suffix(".tmp")
+            destino = sqlite3.connect(str(temporal))
+            try:
+                # Un solo paso: la copia es un snapshot consistente (en WAL no bloquea al escritor)
+                self._fuente.backup(destino)
+                destino.execute("PRAGMA journal_mode = DELETE")
+            finally:
+                destino.close()
+            os.replace(temporal, ruta)
+
+            with self._lock:
+                anterior, ruta_anterior = self._pool, self._ruta
+                self._pool = ConnectionPool(ruta, POOL_LECTURA, solo_lectura=True, inmutable=True)
+                self._ruta = ruta
+                self._data_version = version
+                self.generacion = generacion
+                # Con préstamos en curso la copia anterior sigue viva hasta el último
+                if anterior is not None and self._prestamos.get(anterior):
+                    self._retirados[anterior] = ruta_anterior
+                    anterior = None
+            self.copias += 1
+            self.tiempo_copia += time.perf_counter() - inicio
+            self.copiada_en = time.time()
+
+        if anterior is not None:
+            anterior.cerrar()
+            _borrar(ruta_anterior)
+        return True
+
+    def _refrescar_en_fondo(self) -> None:
+        try:
+            self.refrescar()
+            self.ultimo_error = None
+        except Exception as e:
+            # Se sigue sirviendo la copia anterior
+            self.ultimo_error = str(e)
+        finally:
+            self._refrescando = False
+
+    def _prestar(self) -> ConnectionPool:
+        """El pool vigente, ya contado como prestado (se libera con _soltar)."""
+        if self._pool is None:
+            self.refrescar()  # la primera copia se espera: no hay otra que servir
+        ahora = time.monotonic()
+        with self._lock:
+            vencida = ahora - self._ultimo_chequeo >= REFRESCO_REPLICA_S and not self._refrescando
+            if vencida:
+                self._ultimo_chequeo = ahora
+                self._refrescando = True
+            pool = self._pool
+            self._prestamos[pool] = self._prestamos.get(pool, 0) + 1
+        if vencida:
+            threading.Thread(target=self._refrescar_en_fondo, name="tarifario-replica", daemon=True).start()
+        return pool
+
+    def _soltar(self, pool: ConnectionPool) -> None:
+        with self._lock:
+            restantes = self._prestamos[pool] - 1
+            if restantes:
+                self._prestamos[pool] = restantes
+                return
+            del self._prestamos[pool]
+            ruta = self._retirados.pop(pool, None)
+        if ruta is not None:
+            pool.cerrar()
+            _borrar(ruta)
+
+    @contextmanager
+    def conexion(self):
+        pool = self._prestar()
+        try:
+            with pool.conexion() as conn:
+                yield conn
+        finally:
+            self._soltar(pool)
+
+    def cerrar(self) -> None:
+        """Cierra todas las copias; las conexiones prestadas se cierran al devolverse."""
+        with self._lock_copia, self._lock:
+            retirados = list(self._retirados.items())
+            if self._pool is not None:
+                retirados.append((self._pool, self._ruta))
+            for pool, ruta in retirados:
+                pool.cerrar()
+                _borrar(ruta)
+            if self._fuente is not None:
+                self._fuente.close()
+            self._retirados.clear()
+            self._pool = self._ruta = self._fuente = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            pool = self._pool
+            return {
+                "generacion": self.generacion,
+                "copias": self.copias,
+                "sin_cambios": self.sin_cambios,
+                "tiempo_copia_s": round(self.tiempo_copia, 6),
+                "edad_s": round(time.time() - self.copiada_en, 1) if self.copiada_en else None,
+                "bytes": self._ruta.stat().st_size if self._ruta is not None else 0,
+                "retiradas_en_uso": len(self._retirados),
+                "huerfanas_borradas": self.huerfanas_borradas,
+                "ultimo_error": self.ultimo_error,
+                **(pool.stats() if pool is not None else {}),
+            }
+
+
+def _proceso_vivo(pid: int) -> bool:
+    """Si el proceso pid sigue corriendo (en duda se supone que sí: su copia no se toca)."""
+    if os.name == "nt":
+        # En Windows os.kill(pid, 0) no pregunta: manda una señal / termina el proceso
+        import ctypes
+
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return kernel32.GetLastError() == 5  # acceso denegado: existe
+        try:
+            codigo = ctypes.c_ulong()
+            kernel32.GetExitCodeProcess(handle, ctypes.byref(codigo))
+            return codigo.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _borrar(ruta: Path | None) -> None:
+    """Borra una copia retirada (en Windows puede seguir abierta: se intenta y ya)."""
+    if ruta is None:
+        return
+    try:
+        ruta.unlink(missing_ok=True)
+    except OSError:
+        pass
+
+
+_pools: dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+_escritor: EscritorSQLite | None = None
+_replica: ReplicaLectura | None = None
+_wal_listo = False
+
+
+def _asegurar_wal() -> None:
+    global _wal_listo
+    if not _wal_listo:
+        _activar_wal(DB_PATH)
+        _wal_listo = True
+
+
+def _pool(nombre: str) -> ConnectionPool:
+    pool = _pools.get(nombre)
+    if pool is not None:
+        return pool
+    with _pools_lock:
+        if nombre not in _pools:
+            _asegurar_wal()
+            _pools[nombre] = ConnectionPool(DB_PATH, POOL_LECTURA, solo_lectura=True)
+        return _pools[nombre]
+
+
+def _obtener_escritor() -> EscritorSQLite:
+    global _escritor
+    if _escritor is not None:
+        return _escritor
+    with _pools_lock:
+        if _escritor is None:
+            _asegurar_wal()
+            _escritor = EscritorSQLite(DB_PATH)
+            _escritor.start()
+        return _escritor
+
+
+def _obtener_replica() -> ReplicaLectura:
+    global _replica
+    if _replica is not None:
+        return _replica
+    with _pools_lock:
+        if _replica is None:
+            _asegurar_wal()
+            _replica = ReplicaLectura(DB_PATH)
+        return _replica
+
+
+@contextmanager
+def conexion_lectura():
+    """Presta una conexión de solo lectura del pool."""
+    with _pool("lectura").conexion() as conn:
+        yield conn
+
+
+@contextmanager
+def conexion_replica():
+    """
+    Conexión a la réplica de solo lectura (cotización): puede ir hasta
+    REFRESCO_REPLICA_S (más lo que tarde la copia) detrás de la BD. Lo que tiene
+    que ver la última escritura usa conexion_lectura().
+    """
+    with _obtener_replica().conexion() as conn:
+        yield conn
+
+
+def refrescar_replica() -> bool:
+    """Fuerza la copia si la BD cambió (benchmarks / pruebas / tras una carga masiva)."""
+    return _obtener_replica().refrescar()
+
+
+def ejecutar_escritura(fn, timeout: float | None = POOL_TIMEOUT):
+    """
+    Ejecuta fn(conn) en el hilo escritor y devuelve su resultado.
+    Si fn lanza una excepción, su SAVEPOINT se revierte y se propaga aquí.
+    Pasado timeout (p. ej. detrás de una importación grande) el trabajo se cancela si
+    aún no empezó y sale TimeoutError: no se escribió nada y se puede reintentar.
+    Si ya empezó se espera a que termine: nunca se reporta error de algo que sí se guardó.
+    """
+    escritor = _obtener_escritor()
+    if threading.current_thread() is escritor:
+        raise RuntimeError("ejecutar_escritura() no puede anidarse dentro de un trabajo de escritura")
+    futuro = escritor.enviar(fn)
+    try:
+        return futuro.result(timeout=timeout)
+    except TimeoutError:
+        if futuro.cancel():
+            raise TimeoutError(
+                f"El escritor siguió ocupado {timeout:.0f} s; el trabajo se canceló sin escribir nada"
+            ) from None
+        return futuro.result()
+
+
+def enviar_escritura(fn) -> Future:
+    """Encola fn(conn) en el hilo escritor sin esperarlo (mantenimiento: nadie lee el resultado)."""
+    return _obtener_escritor().enviar(fn)
+
+
+def escribir(query: str, params: tuple = ()) -> int:
+    """Atajo para una sola sentencia; devuelve filas afectadas."""
+    return ejecutar_escritura(lambda conn: conn.execute(query, params).rowcount)
+
+
+def escribir_muchos(query: str, filas) -> int:
+    """executemany en una sola transacción; devuelve filas afectadas."""
+    return ejecutar_escritura(lambda conn: conn.executemany(query, filas).rowcount)
+
+
+def _detener_escritor() -> None:
+    global _escritor
+    if _escritor is not None:
+        _escritor.detener()
+        _escritor = None
+
+
+def _cerrar_replica() -> None:
+    global _replica
+    if _replica is not None:
+        _replica.cerrar()
+        _replica = None
+
+
+atexit.register(_detener_escritor)
+atexit.register(_cerrar_replica)
+
+
+def configurar(db_path: Path) -> None:
+    """Apunta el pool a otra BD (benchmarks / pruebas). Cierra las conexiones libres."""
+    global DB_PATH, _wal_listo
+    _detener_escritor()
+    _cerrar_replica()
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.cerrar()
+        _pools.clear()
+        DB_PATH = Path(db_path)
+        _wal_listo = False
+
+
+def pool_stats() -> dict:
+    """Contadores del pool de lectura (hits / misses / esperas), de la réplica y del escritor."""
+    stats = {nombre: pool.stats() for nombre, pool in list(_pools.items())}
+    if _replica is not None:
+        stats["replica"] = _replica.stats()
+    if _escritor is not None:
+        stats["escritor"] = _escritor.stats()
+    return stats
+
+
+# =====================================================
+# DIAGNÓSTICO DE SQL
+# =====================================================
+def estadisticas_sql() -> dict:
+    """
+    Lo medido desde el arranque (o desde limpiar_estadisticas_sql()):
+    por sentencia y por página · bloque, con histograma de latencia
+    (ETIQUETAS_CUBETAS) y las funciones que más la mandan.
+    """
+    with _sql_lock:
+        por_sentencia = [{"sentencia": k, **a.fila()} for k, a in _por_sentencia.items()]
+        por_origen = [{"origen": k, **a.fila()} for k, a in _por_origen.items()]
+    return {
+        "desde": _sql_desde,
+        "por_sentencia": sorted(por_sentencia, key=lambda r: r["ms_total"], reverse=True),
+        "por_origen": sorted(por_origen, key=lambda r: r["ms_total"], reverse=True),
+    }
+
+
+_EXPLICABLES = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def plan_consulta(sql: str, params=()) -> str:
+    """EXPLAIN QUERY PLAN de la sentencia (una vez por sentencia normalizada)."""
+    sentencia = _normalizar_sql(sql)
+    plan = _planes.get(sentencia)
+    if plan is not None:
+        return plan
+    if not sentencia.upper().startswith(_EXPLICABLES):
+        return ""
+    try:
+        with conexion_lectura() as conn:
+            filas = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or ()).fetchall()
+        plan = " | ".join(r[3] for r in filas)
+    except sqlite3.Error as e:
+        # p. ej. executemany (sin parámetros guardados) o tablas temporales
+        plan = f"(sin plan: {e})"
+    _planes[sentencia] = plan
+    return plan
+
+
+def sentencias_lentas() -> list[dict]:
+    """Las últimas SQL_LENTAS_MAX sentencias de SQL_LENTA_MS o más, con su plan."""
+    with _sql_lock:
+        lentas = list(_lentas)
+    return [
+        {
+            "cuando": time.strftime("%H:%M:%S", time.localtime(m.cuando)),
+            "ms": round(m.ms, 1),
+            "filas": m.filas,
+            "bytes": m.bytes,
+            "origen": m.origen,
+            "funcion": m.funcion,
+            "sentencia": _normalizar_sql(m.sql),
+            "plan": plan_consulta(m.sql, m.params),
+        }
+        for m in reversed(lentas)
+    ]
+
+
+def limpiar_estadisticas_sql() -> None:
+    global _sql_desde
+    with _sql_lock:
+        _por_sentencia.clear()
+        _por_origen.clear()
+        _lentas.clear()
+        _sql_desde = time.time()
@@ -0,0 +1,247 @@
+"""
+Diferencias de tarifario entre dos momentos: qué carriles entraron, salieron
+o cambiaron de precio, con deltas de ALL_IN, precio y margen.
+
+Cada lado es una fecha (el libro a esa fecha, de la copia en memoria del
+historial) o un snapshot: un archivo exportado desde BLOQUE 6 de app.py.
+Los dos libros se alinean por LANE_KEY con un índice hash, sin ordenar ni
+hacer merge de DataFrames completos: solo se arman las filas que cambiaron.
+"""
+import io
+import threading
+
+import numpy as np
+import pandas as pd
+
+from core.history import filas_a_fecha, historia_a_fecha, normalizar_fecha
+from core.queries import COLUMNAS_CARRIL_TARIFA
+from core.ranking import precio_usado
+from core.services import clave_carril
+
+try:
+    import pyarrow as pa
+except ImportError:  # sin pyarrow los snapshots parquet / arrow no se pueden leer
+    pa = None
+
+NUEVO = "NUEVO"
+ELIMINADO = "ELIMINADO"
+CAMBIO_PRECIO = "CAMBIO DE PRECIO"
+
+# Menos de medio centavo no es un cambio de precio (redondeos de Excel / CSV)
+TOLERANCIA = 0.005
+
+# Lo que se necesita de un snapshot para calcular ALL_IN, precio usado y margen
+COLUMNAS_PRECIO = ("ALL_IN", "PRECIO_VIAJE_SENCILLO", "PRECIO_VIAJE_REDONDO", "TIPO_DE_OPERACION", "TIPO_DE_VIAJE")
+# Cómo se identifica el carril en el reporte (del lado que existe)
+COLUMNAS_DESCRIPCION = ["ID_TARIFA", *COLUMNAS_CARRIL_TARIFA, "MONEDA"]
+
+
+# LANE_KEY / ALL_IN / precio usado del último DataFrame de cargar_bd_completa():
+# se recalculan solo cuando el DataFrame cambia (igual que las vigencias de core.history)
+_valores = (None, None)
+_lock = threading.Lock()
+
+
+def _numerico(serie: pd.Series) -> np.ndarray:
+    return pd.to_numeric(serie, errors="coerce").to_numpy(dtype=float)
+
+
+def _calcular_valores(df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    return (
+        df["LANE_KEY"].to_numpy(dtype="int64"),
+        _numerico(df["ALL_IN"]),
+        precio_usado(df),
+    )
+
+
+def _valores_libro(df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    global _valores
+    with _lock:
+        base, valores = _valores
+        if base is not df:
+            valores = _calcular_valores(df)
+            _valores = (df, valores)
+        return valores
+
+
+# =====================================================
+# SNAPSHOTS (ARCHIVOS EXPORTADOS)
+# =====================================================
+def leer_snapshot(archivo, nombre: str) -> pd.DataFrame:
+    """
+    Un archivo exportado (.xlsx, .csv.gz, .csv, .parquet, .arrow) como libro:
+    solo filas activas (si trae ACTIVA) y una por carril, con LANE_KEY.
+    """
+    nombre = nombre.lower()
+    if nombre.endswith((".parquet", ".arrow")) and pa is None:
+        raise ValueError("Para leer snapshots .parquet / .arrow hace falta pyarrow.")
+    if nombre.endswith((".xlsx", ".xlsm")):
+        df = pd.read_excel(archivo)
+    elif nombre.endswith(".parquet"):
+        df = pd.read_parquet(archivo)
+    elif nombre.endswith(".arrow"):
+        datos = archivo.read() if hasattr(archivo, "read") else open(archivo, "rb").read()
+        df = pa.ipc.open_file(io.BytesIO(datos)).read_all().to_pandas()
+    elif nombre.endswith((".csv.gz", ".csv")):
+        df = pd.read_csv(archivo, compression="gzip" if nombre.endswith(".gz") else None, low_memory=False)
+    else:
+        raise ValueError(f"Formato de snapshot no reconocido: {nombre}")
+    return libro_de_snapshot(df)
+
+
+def libro_de_snapshot(df: pd.DataFrame) -> pd.DataFrame:
+    faltantes = [c for c in COLUMNAS_PRECIO if c not in df.columns]
+    if faltantes:
+        raise ValueError(f"Al snapshot le faltan columnas: {', '.join(faltantes)}")
+
+    if "ACTIVA" in df.columns:
+        df = df[pd.to_numeric(df["ACTIVA"], errors="coerce").to_numpy() == 1]
+
+    # LANE_KEY se recalcula de las columnas del carril: Excel la guarda como double
+    # y un CSV con vacíos la vuelve float, y en los dos casos pierde dígitos
+    sin_carril = [c for c in COLUMNAS_CARRIL_TARIFA if c not in df.columns]
+    if not sin_carril:
+        claves = [clave_carril(v) for v in df[list(COLUMNAS_CARRIL_TARIFA)].itertuples(index=False)]
+        df = df.assign(LANE_KEY=np.array(claves, dtype="int64"))
+    elif "LANE_KEY" not in df.columns or not pd.api.types.is_integer_dtype(df["LANE_KEY"]):
+        raise ValueError(f"Al snapshot le falta LANE_KEY o las columnas del carril: {', '.join(sin_carril)}")
+
+    # Igual que libro_a_fecha: si el carril viene repetido gana la última fila
+    return df[~df["LANE_KEY"].duplicated(keep="last").to_numpy()].reset_index(drop=True)
+
+
+# =====================================================
+# DIFERENCIAS
+# =====================================================
+def _lado(origen, historia: pd.DataFrame):
+    """(DataFrame, posiciones del libro, valores) para una fecha o un snapshot ya leído."""
+    if isinstance(origen, pd.DataFrame):
+        return origen, np.arange(len(origen)), _calcular_valores(origen)
+    return historia, filas_a_fecha(historia, origen), _valores_libro(historia)
+
+
+def _margen(precio: np.ndarray, all_in: np.ndarray) -> np.ndarray:
+    """(precio - ALL_IN) / precio, como calcular_margenes(); NaN sin precio válido."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where((precio > 0) & (all_in > 0), (precio - all_in) / precio, np.nan)
+
+
+def _distintos(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return ~np.isclose(a, b, rtol=0, atol=TOLERANCIA, equal_nan=True)
+
+
+def _descripcion(df: pd.DataFrame, filas: np.ndarray) -> pd.DataFrame:
+    columnas = [c for c in COLUMNAS_DESCRIPCION if c in df.columns]
+    return df.iloc[filas, df.columns.get_indexer(columnas)].reset_index(drop=True)
+
+
+def _version(df: pd.DataFrame, filas: np.ndarray) -> np.ndarray:
+    """VERSION de las filas del libro, en el orden del libro (NaN si el snapshot no la trae)."""
+    if "VERSION" not in df.columns:
+        return np.full(len(filas), np.nan)
+    return _numerico(df["VERSION"].iloc[filas])
+
+
+def diferencias(antes, despues) -> pd.DataFrame:
+    """
+    Carriles que cambiaron entre `antes` y `despues` (cada uno una fecha o un
+    libro de leer_snapshot). Una fila por carril con CAMBIO (NUEVO / ELIMINADO /
+    CAMBIO DE PRECIO), la descripción del carril y los valores antes / después
+    de ALL_IN, PRECIO (el que usa el buscador) y MARGEN con sus deltas.
+    """
+    # Las dos fechas salen de la misma copia en memoria (con archivo si la más vieja lo necesita)
+    fechas = [normalizar_fecha(o) for o in (antes, despues) if not isinstance(o, pd.DataFrame)]
+    historia = historia_a_fecha(min(fechas)) if fechas else None
+    df_a, filas_a, (clave_a, all_in_a, precio_a) = _lado(antes, historia)
+    df_b, filas_b, (clave_b, all_in_b, precio_b) = _lado(despues, historia)
+    clave_a, all_in_a, precio_a = clave_a[filas_a], all_in_a[filas_a], precio_a[filas_a]
+    clave_b, all_in_b, precio_b = clave_b[filas_b], all_in_b[filas_b], precio_b[filas_b]
+
+    # Cada libro trae un carril una sola vez: get_indexer es un lookup hash O(n)
+    en_a = pd.Index(clave_a).get_indexer(clave_b)
+    nuevos = np.flatnonzero(en_a < 0)
+    comunes_b = np.flatnonzero(en_a >= 0)
+    comunes_a = en_a[comunes_b]
+    sigue = np.zeros(len(clave_a), dtype=bool)
+    sigue[comunes_a] = True
+    eliminados = np.flatnonzero(~sigue)
+
+    cambio = _distintos(all_in_a[comunes_a], all_in_b[comunes_b]) | _distintos(
+        precio_a[comunes_a], precio_b[comunes_b]
+    )
+    cambios_a, cambios_b = comunes_a[cambio], comunes_b[cambio]
+
+    n_cambios, n_nuevos, n_eliminados = len(cambios_b), len(nuevos), len(eliminados)
+    total = n_cambios + n_nuevos + n_eliminados
+    # Orden del reporte: cambios de precio, nuevos, eliminados
+    filas_despues = np.concatenate([cambios_b, nuevos])
+
+    def _antes(valores):
+        salida = np.full(total, np.nan)
+        salida[:n_cambios] = valores[cambios_a]
+        salida[n_cambios + n_nuevos:] = valores[eliminados]
+        return salida
+
+    def _despues(valores):
+        salida = np.full(total, np.nan)
+        salida[:n_cambios + n_nuevos] = valores[filas_despues]
+        return salida
+
+    descripcion = pd.concat(
+        [
+            _descripcion(df_b, filas_b[filas_despues]),
+            _descripcion(df_a, filas_a[eliminados]),
+        ],
+        ignore_index=True,
+    )
+
+    all_in_antes, all_in_despues = _antes(all_in_a), _despues(all_in_b)
+    precio_antes, precio_despues = _antes(precio_a), _despues(precio_b)
+    margen_antes = _margen(precio_antes, all_in_antes)
+    margen_despues = _margen(precio_despues, all_in_despues)
+    version_antes = _antes(_version(df_a, filas_a))
+    version_despues = _despues(_version(df_b, filas_b))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delta_pct = np.where(all_in_antes > 0, (all_in_despues - all_in_antes) / all_in_antes * 100, np.nan)
+
+    reporte = pd.DataFrame(
+        {
+            "CAMBIO": pd.Categorical.from_codes(
+                np.repeat([0, 1, 2], [n_cambios, n_nuevos, n_eliminados]), [CAMBIO_PRECIO, NUEVO, ELIMINADO]
+            ),
+            "LANE_KEY": np.concatenate([clave_b[filas_despues], clave_a[eliminados]]),
+        }
+    )
+    reporte = pd.concat([reporte, descripcion], axis=1)
+    return reporte.assign(
+        VERSION_ANTES=pd.array(version_antes, dtype="Int64"),
+        VERSION_DESPUES=pd.array(version_despues, dtype="Int64"),
+        ALL_IN_ANTES=all_in_antes,
+        ALL_IN_DESPUES=all_in_despues,
+        DELTA_ALL_IN=all_in_despues - all_in_antes,
+        DELTA_ALL_IN_PCT=delta_pct,
+        PRECIO_ANTES=precio_antes,
+        PRECIO_DESPUES=precio_despues,
+        DELTA_PRECIO=precio_despues - precio_antes,
+        MARGEN_ANTES=margen_antes,
+        MARGEN_DESPUES=margen_despues,
+        DELTA_MARGEN=margen_despues - margen_antes,
+    )
+
+
+def resumen(reporte: pd.DataFrame) -> dict:
+    """Conteos por tipo de cambio y deltas promedio de los cambios de precio (None si no hay con qué)."""
+    cambios = reporte[reporte["CAMBIO"] == CAMBIO_PRECIO]
+
+    def _promedio(columna):
+        valor = cambios[columna].mean()
+        return None if pd.isna(valor) else float(valor)
+
+    return {
+        "cambios_precio": len(cambios),
+        "nuevos": int((reporte["CAMBIO"] == NUEVO).sum()),
+        "eliminados": int((reporte["CAMBIO"] == ELIMINADO).sum()),
+        "delta_all_in_pct_promedio": _promedio("DELTA_ALL_IN_PCT"),
+        "delta_margen_promedio": _promedio("DELTA_MARGEN"),
+    }
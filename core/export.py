@@ -0,0 +1,165 @@
+import csv
+import gzip
+import io
+
+from openpyxl import Workbook
+
+from core.db import conexion_lectura
+from core.services import TABLA_TARIFARIO, cache_por_version
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # sin pyarrow solo quedan Excel y CSV
+    pa = pq = None
+
+MIME_EXCEL = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# Filas por fetchmany(): memoria acotada sin importar el tamaño del tarifario
+LOTE_EXPORT = 5_000
+
+# formato -> (etiqueta, extensión, mime, requiere pyarrow)
+FORMATOS = {
+    "xlsx": ("Excel (.xlsx)", "xlsx", MIME_EXCEL, False),
+    "csv.gz": ("CSV comprimido (.csv.gz)", "csv.gz", "application/gzip", False),
+    "parquet": ("Parquet (.parquet)", "parquet", "application/vnd.apache.parquet", True),
+    "arrow": ("Arrow IPC (.arrow)", "arrow", "application/vnd.apache.arrow.file", True),
+}
+
+
+def formatos_disponibles() -> list[str]:
+    return [f for f, (_, _, _, requiere_arrow) in FORMATOS.items() if pa is not None or not requiere_arrow]
+
+
+def _lotes(cursor, progreso=None):
+    """fetchmany() en bloques; progreso(n) se llama con las filas de cada bloque ya escrito."""
+    while True:
+        filas = cursor.fetchmany(LOTE_EXPORT)
+        if not filas:
+            return
+        yield filas
+        if progreso:
+            progreso(len(filas))
+
+
+# =====================================================
+# ESCRITORES (cursor -> archivo, en streaming)
+# =====================================================
+def escribir_excel(cursor, destino, progreso=None, hoja: str = "Tarifario") -> int:
+    """
+    Vuelca un cursor a un .xlsx con openpyxl en modo write-only:
+    las filas se escriben en streaming, nunca se arma el libro completo en memoria.
+    Devuelve cuántas filas se escribieron.
+    """
+    libro = Workbook(write_only=True)
+    ws = libro.create_sheet(hoja)
+    ws.append([d[0] for d in cursor.description])
+
+    total = 0
+    for filas in _lotes(cursor, progreso):
+        for fila in filas:
+            ws.append(tuple(fila))
+        total += len(filas)
+
+    libro.save(destino)
+    return total
+
+
+def escribir_csv_gz(cursor, destino, progreso=None) -> int:
+    total = 0
+    with gzip.GzipFile(fileobj=destino, mode="wb", compresslevel=6) as gz:
+        texto = io.TextIOWrapper(gz, encoding="utf-8", newline="")
+        escritor = csv.writer(texto)
+        escritor.writerow([d[0] for d in cursor.description])
+        for filas in _lotes(cursor, progreso):
+            escritor.writerows(filas)
+            total += len(filas)
+        texto.flush()
+        texto.detach()
+    return total
+
+
+_TIPOS_ARROW = {"INTEGER": "int64", "REAL": "float64"}
+
+
+@cache_por_version(TABLA_TARIFARIO)
+def _columnas_con_texto(columnas: tuple) -> frozenset:
+    """
+    SQLite deja guardar texto en columnas REAL (p. ej. REMARK); esas columnas
+    se exportan como string para que el esquema Arrow no truene a mitad del archivo.
+    """
+    if not columnas:
+        return frozenset()
+    sumas = ", ".join(f"SUM(typeof({c}) = 'text')" for c in columnas)
+    with conexion_lectura() as conn:
+        conteos = conn.execute(f"SELECT {sumas} FROM {TABLA_TARIFARIO}").fetchone()
+    return frozenset(c for c, n in zip(columnas, conteos) if n)
+
+
+def esquema_arrow(cursor):
+    """Esquema a partir de los tipos declarados en tarifario_estandar (texto por default)."""
+    nombres = [d[0] for d in cursor.description]
+    with conexion_lectura() as conn:
+        declarados = {r[1]: (r[2] or "").upper() for r in conn.execute(f"PRAGMA table_info({TABLA_TARIFARIO})")}
+    numericas = tuple(n for n in nombres if declarados.get(n) in _TIPOS_ARROW and n != "id")
+    con_texto = _columnas_con_texto(numericas)
+
+    campos = []
+    for n in nombres:
+        if n == "id":
+            tipo = pa.int64()
+        elif n in numericas and n not in con_texto:
+            tipo = pa.from_numpy_dtype(_TIPOS_ARROW[declarados[n]])
+        else:
+            tipo = pa.string()
+        campos.append(pa.field(n, tipo))
+    return pa.schema(campos)
+
+
+def _lotes_arrow(cursor, schema, progreso=None):
+    texto = [i for i, campo in enumerate(schema) if campo.type == pa.string()]
+    for filas in _lotes(cursor, progreso):
+        columnas = [list(c) for c in zip(*filas)]
+        for i in texto:
+            columnas[i] = [None if v is None else str(v) for v in columnas[i]]
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(c, type=campo.type) for c, campo in zip(columnas, schema)], schema=schema
+        )
+
+
+def escribir_parquet(cursor, destino, progreso=None) -> int:
+    schema = esquema_arrow(cursor)
+    total = 0
+    with pq.ParquetWriter(destino, schema, compression="zstd") as escritor:
+        for lote in _lotes_arrow(cursor, schema, progreso):
+            escritor.write_batch(lote)
+            total += lote.num_rows
+    return total
+
+
+def escribir_arrow(cursor, destino, progreso=None) -> int:
+    schema = esquema_arrow(cursor)
+    total = 0
+    with pa.ipc.new_file(destino, schema) as escritor:
+        for lote in _lotes_arrow(cursor, schema, progreso):
+            escritor.write_batch(lote)
+            total += lote.num_rows
+    return total
+
+
+ESCRITORES = {
+    "xlsx": escribir_excel,
+    "csv.gz": escribir_csv_gz,
+    "parquet": escribir_parquet,
+    "arrow": escribir_arrow,
+}
+
+
+# =====================================================
+# EXPORTACIÓN (el caché por versión de datos está en core.jobs)
+# =====================================================
+def exportar_a_archivo(sql: str, params: tuple, formato: str, destino, progreso=None) -> int:
+    """Escribe la consulta en destino (ruta o archivo binario). Devuelve filas escritas."""
+    if formato not in formatos_disponibles():
+        raise ValueError(f"Formato no disponible: {formato} (¿falta pyarrow?)")
+    with conexion_lectura() as conn:
+        return ESCRITORES[formato](conn.execute(sql, tuple(params)), destino, progreso)
@@ -0,0 +1,141 @@
+import threading
+from bisect import bisect_left
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from core.catalogs import obtener_catalogos
+
+TABLAS_GEOGRAFIA = ("CAT_PAISES", "CAT_ESTADOS_NEW", "CAT_CIUDADES")
+
+
+@dataclass(frozen=True)
+class Nivel:
+    """
+    Un nivel del árbol (países, estados o ciudades), solo registros activos.
+    Filas ordenadas por (padre, nombre): los hijos de un padre son un rango
+    contiguo [inicio, fin) y dentro del rango los nombres están ordenados.
+    """
+
+    ids: tuple
+    nombres: tuple
+    rangos: MappingProxyType  # id_padre -> (inicio, fin)
+
+    def hijos(self, id_padre=None) -> tuple:
+        """Nombres de los hijos de id_padre, ya ordenados. O(1) + copia del rango."""
+        inicio, fin = self.rangos.get(id_padre, (0, 0))
+        return self.nombres[inicio:fin]
+
+    def _buscar(self, nombre, id_padre):
+        inicio, fin = self.rangos.get(id_padre, (0, 0))
+        if not isinstance(nombre, str):
+            return None, inicio
+        i = bisect_left(self.nombres, nombre, inicio, fin)
+        if i < fin and self.nombres[i] == nombre:
+            return i, inicio
+        return None, inicio
+
+    def id_de(self, nombre, id_padre=None):
+        """Nombre -> id dentro del padre, con búsqueda binaria. None si no existe."""
+        i, _ = self._buscar(nombre, id_padre)
+        return None if i is None else self.ids[i]
+
+    def posicion(self, nombre, id_padre=None, default: int = 0) -> int:
+        """Índice de nombre dentro de hijos(id_padre) (para el index= de un selectbox)."""
+        i, inicio = self._buscar(nombre, id_padre)
+        return default if i is None else i - inicio
+
+
+def _construir_nivel(catalogo) -> Nivel:
+    filas = sorted(
+        (padre, nombre, id_)
+        for id_, nombre, padre, activo in zip(
+            catalogo.ids, catalogo.nombres, catalogo.padres, catalogo.activos
+        )
+        if activo == 1
+    )
+    rangos = {}
+    for i, (padre, _, _) in enumerate(filas):
+        inicio, _ = rangos.get(padre, (i, i))
+        rangos[padre] = (inicio, i + 1)
+    return Nivel(
+        ids=tuple(f[2] for f in filas),
+        nombres=tuple(f[1] for f in filas),
+        rangos=MappingProxyType(rangos),
+    )
+
+
+@dataclass(frozen=True)
+class ArbolGeografico:
+    """País -> estado -> ciudad, construido una vez por versión de los catálogos."""
+
+    fuentes: tuple  # snapshots de catálogo con los que se construyó
+    paises: Nivel
+    estados: Nivel
+    ciudades: Nivel
+
+
+_arbol: ArbolGeografico | None = None
+_lock = threading.Lock()
+
+
+def obtener_arbol() -> ArbolGeografico:
+    """Árbol compartido; se reconstruye solo si cambió alguno de los tres catálogos."""
+    global _arbol
+    catalogos = obtener_catalogos()
+    fuentes = tuple(catalogos[t] for t in TABLAS_GEOGRAFIA)
+    with _lock:
+        if _arbol is None or any(a is not b for a, b in zip(_arbol.fuentes, fuentes)):
+            # Solo se reconstruye el nivel cuyo catálogo cambió
+            niveles = [
+                _construir_nivel(fuente)
+                if _arbol is None or _arbol.fuentes[i] is not fuente
+                else (_arbol.paises, _arbol.estados, _arbol.ciudades)[i]
+                for i, fuente in enumerate(fuentes)
+            ]
+            _arbol = ArbolGeografico(fuentes, *niveles)
+        return _arbol
+
+
+# =====================================================
+# IDS DE GEOGRAFÍA EN tarifario_estandar
+# =====================================================
+LADOS = ("ORIGEN", "DESTINO")
+# (nivel, catálogo, columna nombre, columna id, columna padre) en orden país -> estado -> ciudad
+NIVELES_GEOGRAFIA = (
+    ("PAIS", "CAT_PAISES", "PAIS", "ID_PAIS", None),
+    ("ESTADO", "CAT_ESTADOS_NEW", "ESTADO", "ID_ESTADO", "ID_PAIS"),
+    ("CIUDAD", "CAT_CIUDADES", "CIUDAD", "ID_CIUDAD", "ID_ESTADO"),
+)
+
+
+def completar_ids_geografia(conn) -> int:
+    """
+    Resuelve ID_PAIS_/ID_ESTADO_/ID_CIUDAD_ ORIGEN/DESTINO contra los catálogos:
+    un UPDATE ... FROM por nivel y lado, cada nivel bajo el id ya resuelto del padre.
+    Solo toca filas sin id cuyo nombre existe, así que repetirlo no genera cambios.
+    Devuelve cuántos ids se llenaron.
+    """
+    llenados = 0
+    for lado in LADOS:
+        for nivel, tabla, col_nombre, col_id, col_padre in NIVELES_GEOGRAFIA:
+            bajo_padre = f"AND c.{col_padre} = t.{col_padre}_{lado}" if col_padre else ""
+            llenados += conn.execute(
+                f"""
+                UPDATE tarifario_estandar AS t
+                SET ID_{nivel}_{lado} = c.{col_id}
+                FROM {tabla} AS c
+                WHERE t.ID_{nivel}_{lado} IS NULL
+                  AND t.{nivel}_{lado} IS NOT NULL
+                  AND c.{col_nombre} = TRIM(t.{nivel}_{lado})
+                  {bajo_padre}
+                """
+            ).rowcount
+    return llenados
+
+
+def ids_sin_resolver(conn) -> dict:
+    """Filas con nombre pero sin id, por columna (nombres que no están en el catálogo)."""
+    columnas = [f"{nivel}_{lado}" for lado in LADOS for nivel, *_ in NIVELES_GEOGRAFIA]
+    sumas = ", ".join(f"SUM({c} IS NOT NULL AND ID_{c} IS NULL)" for c in columnas)
+    conteos = conn.execute(f"SELECT {sumas} FROM tarifario_estandar").fetchone()
+    return {c: int(n or 0) for c, n in zip(columnas, conteos)}
@@ -0,0 +1,146 @@
+"""
+Tarifario "a una fecha": qué versión valía en cada carril en un momento dado.
+
+Cada versión vale en [VIGENTE_DESDE, VIGENTE_HASTA) (migración 8); la activa
+queda abierta hasta FECHA_ABIERTA. Las fechas son texto en FORMATO_FECHA,
+así que comparar texto es comparar tiempo.
+
+Las versiones archivadas (core.archive) terminaron todas antes del corte: una
+fecha posterior se resuelve solo con la tabla caliente.
+"""
+import threading
+from datetime import date, datetime, time
+
+import numpy as np
+import pandas as pd
+
+from core.archive import cargar_historial
+from core.db import conexion_lectura
+from core.queries import (
+    COLUMNAS_RESULTADO,
+    FECHA_ABIERTA,
+    FECHA_INICIAL,
+    FORMATO_FECHA,
+    SQL_HISTORIAL_CARRIL,
+    SQL_VERSION_A_FECHA,
+)
+from core.services import cargar_bd_completa
+
+FIN_DEL_DIA = time(23, 59, 59)
+
+# Lo que muestran las pantallas de auditoría: la grilla de resultados + carril y vigencia
+COLUMNAS_A_FECHA = COLUMNAS_RESULTADO + ["LANE_KEY", "VIGENTE_DESDE", "VIGENTE_HASTA"]
+
+
+def normalizar_fecha(valor) -> str:
+    """
+    date / datetime / Timestamp / texto -> FORMATO_FECHA.
+    Un día sin hora ('2026-01-13' o un date) es el tarifario al cierre de ese día.
+    """
+    if isinstance(valor, str) and len(valor.strip()) == 10:
+        valor = date.fromisoformat(valor.strip())
+    if isinstance(valor, date) and not isinstance(valor, datetime):
+        valor = datetime.combine(valor, FIN_DEL_DIA)
+    return pd.Timestamp(valor).strftime(FORMATO_FECHA)
+
+
+# Vigencias del último DataFrame de cargar_bd_completa() factorizadas: códigos por
+# fila + fechas distintas como texto de ancho fijo (comparar '<U19' es vectorizado;
+# las fechas centinela 0001 / 9999 no caben en datetime64[ns]). Una fecha se compara
+# contra las distintas, no contra cada fila. Se recalculan solo cuando el DataFrame cambia.
+_vigencias = (None, None, None)
+_lock = threading.Lock()
+
+
+def _factorizar(serie: pd.Series, nula: str) -> tuple[np.ndarray, np.ndarray]:
+    codigos, distintas = pd.factorize(serie)
+    # El código de NULL es -1: cae en la última posición, la fecha que le toca
+    return codigos, np.append(np.asarray(distintas, dtype="U19"), nula)
+
+
+def _arreglos_vigencia(df: pd.DataFrame) -> tuple[tuple, tuple]:
+    global _vigencias
+    with _lock:
+        base, desde, hasta = _vigencias
+        if base is not df:
+            desde = _factorizar(df["VIGENTE_DESDE"], FECHA_INICIAL)
+            hasta = _factorizar(df["VIGENTE_HASTA"], FECHA_ABIERTA)
+            _vigencias = (df, desde, hasta)
+        return desde, hasta
+
+
+def mascara_a_fecha(df: pd.DataFrame, fecha) -> np.ndarray:
+    """Filas de df (la copia en memoria del tarifario) vigentes en fecha."""
+    momento = np.str_(normalizar_fecha(fecha))
+    (codigos_desde, desde), (codigos_hasta, hasta) = _arreglos_vigencia(df)
+    return (desde <= momento)[codigos_desde] & (hasta > momento)[codigos_hasta]
+
+
+# Tabla caliente + archivo, armado solo para fechas anteriores al corte del archivo
+_con_archivo = (None, None, None, None)  # (df, historial, frontera, combinado)
+
+
+def historia_a_fecha(fecha) -> pd.DataFrame:
+    """
+    La copia en memoria que cubre fecha: cargar_bd_completa(), más las versiones
+    archivadas si alguna seguía vigente en fecha (ordenado por id, como la copia).
+    """
+    global _con_archivo
+    df = cargar_bd_completa()
+    historial = cargar_historial()
+    if historial.empty:
+        return df
+    with _lock:
+        base, archivado, frontera, combinado = _con_archivo
+        if archivado is not historial:
+            frontera = historial["VIGENTE_HASTA"].max()
+        if normalizar_fecha(fecha) >= frontera:
+            _con_archivo = (base, historial, frontera, combinado)
+            return df
+        if base is not df or archivado is not historial:
+            combinado = pd.concat([historial, df], ignore_index=True).sort_values("id", ignore_index=True)
+        _con_archivo = (df, historial, frontera, combinado)
+        return combinado
+
+
+def filas_a_fecha(df: pd.DataFrame, fecha) -> np.ndarray:
+    """Posiciones de df vigentes en fecha, una por carril (LANE_KEY)."""
+    filas = np.flatnonzero(mascara_a_fecha(df, fecha))
+    # Historia previa a LANE_KEY puede traer dos versiones del carril en la misma
+    # fecha: gana la más reciente (df viene ordenado por id)
+    if "LANE_KEY" in df.columns:
+        repetidas = pd.Series(df["LANE_KEY"].to_numpy()[filas]).duplicated(keep="last").to_numpy()
+        if repetidas.any():
+            filas = filas[~repetidas]
+    return filas
+
+
+def libro_a_fecha(fecha, columnas=None) -> pd.DataFrame:
+    """
+    El tarifario como estaba en fecha: una versión por carril (LANE_KEY).
+    Sale de la copia en memoria del historial, sin ir a la BD: cada fecha
+    es un par de comparaciones vectorizadas.
+    """
+    df = historia_a_fecha(fecha)
+    filas = filas_a_fecha(df, fecha)
+    if columnas is None:
+        return df.iloc[filas]
+    return df.iloc[filas, df.columns.get_indexer([c for c in columnas if c in df.columns])]
+
+
+def tarifa_a_fecha(lane_key: int, fecha) -> dict | None:
+    """Versión de un carril vigente en fecha (None si no había), por el índice (LANE_KEY, VIGENTE_DESDE)."""
+    momento = normalizar_fecha(fecha)
+    with conexion_lectura() as conn:
+        cur = conn.execute(SQL_VERSION_A_FECHA, (lane_key, momento))
+        fila = cur.fetchone()
+        if fila is None:
+            return None
+        version = dict(zip((d[0] for d in cur.description), fila))
+    return version if version["VIGENTE_HASTA"] > momento else None
+
+
+def historial_carril(lane_key: int) -> pd.DataFrame:
+    """Todas las versiones de un carril con su vigencia, de la más vieja a la actual."""
+    with conexion_lectura() as conn:
+        return pd.read_sql(SQL_HISTORIAL_CARRIL, conn, params=(lane_key,))
@@ -0,0 +1,568 @@
+import csv
+import io
+import time
+import unicodedata
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+from core.catalogs import ESQUEMA_CATALOGOS, obtener_catalogos
+from core.db import conexion_lectura, ejecutar_escritura
+from core.geography import completar_ids_geografia, obtener_arbol
+from core.queries import COLUMNAS_CARRIL_TARIFA, FECHA_ABIERTA, SQL_DESACTIVAR_CARRIL
+from core.services import ahora, clave_carril, siguiente_id_tarifa
+
+# Filas por lote al leer el archivo (memoria acotada aunque la hoja sea grande)
+LOTE_IMPORT = 5_000
+# Arriba de esto se rechaza el archivo completo: partirlo en varios
+MAX_FILAS_IMPORT = 100_000
+# LANE_KEY por consulta al buscar las versiones activas que se reemplazan
+LOTE_CLAVES = 500
+
+SIN_CLIENTE = "SIN CLIENTE"
+VIAJES = ("SENCILLO", "REDONDO")
+MONEDAS = ("MXN", "USD")
+OPERACIONES_DEFAULT = ("EXPORTACIÓN", "IMPORTACIÓN")  # igual que BLOQUE A sin catálogo
+
+COLUMNAS_OBLIGATORIAS = (
+    "TRANSPORTISTA", "TIPO_DE_OPERACION", "TIPO_DE_VIAJE", "TIPO_UNIDAD",
+    "PAIS_ORIGEN", "ESTADO_ORIGEN", "CIUDAD_ORIGEN",
+    "PAIS_DESTINO", "ESTADO_DESTINO", "CIUDAD_DESTINO",
+)
+# ALL_IN = suma de costos (BLOQUE E.1); una columna ALL_IN en el archivo se ignora
+COLUMNAS_COSTO = (
+    "USA_FREIGHT", "MEXICAN_FREIGHT", "CROSSING", "BORDER_CROSSING",
+    "ADUANAS_ARANCELES", "INSURANCE", "PEAJES", "MANIOBRAS",
+)
+COLUMNAS_NUMERICAS = COLUMNAS_COSTO + (
+    "PRECIO_VIAJE_SENCILLO", "PRECIO_VIAJE_REDONDO",
+    "TARIFA_VIAJE_SENCILLO", "TARIFA_VIAJE_REDONDO", "TARIFA_VIAJE_FULL",
+    "COSTO_DE_WAITING_CHARGE", "FREE_TIME", "TRUCKING_CANCEL_FEE",
+)
+COLUMNAS_BANDERA = ("TEAM_DRIVER", "WAITING")
+COLUMNAS_TEXTO_LIBRE = (
+    "REMARK", "REQUERIMIENTO", "DIRECCION_DE_RECOLECCION", "DESTINO_EMPRESA", "DESTINO_DIRECCION",
+)
+COLUMNAS_PLANTILLA = (
+    COLUMNAS_OBLIGATORIAS + ("CLIENTE", "MONEDA") + COLUMNAS_NUMERICAS + COLUMNAS_BANDERA + COLUMNAS_TEXTO_LIBRE
+)
+
+COLUMNAS_GEO_IDS = (
+    "ID_PAIS_ORIGEN", "ID_ESTADO_ORIGEN", "ID_CIUDAD_ORIGEN",
+    "ID_PAIS_DESTINO", "ID_ESTADO_DESTINO", "ID_CIUDAD_DESTINO",
+)
+# Mismo registro que BLOQUE E.5 de captura; ID_TARIFA / VERSION se fijan al escribir
+COLUMNAS_INSERT = (
+    ("RESPONSABLE", "DESTINO", "ALL_IN", "LANE_KEY", "ID_TARIFA", "VERSION", "ACTIVA",
+     "FECHA_CAMBIO", "VIGENTE_DESDE", "VIGENTE_HASTA", "USUARIO_CAMBIO", "MOTIVO_CAMBIO", "CLIENTE", "MONEDA")
+    + COLUMNAS_OBLIGATORIAS + COLUMNAS_GEO_IDS + COLUMNAS_NUMERICAS + COLUMNAS_BANDERA + COLUMNAS_TEXTO_LIBRE
+)
+SQL_INSERT_IMPORT = (
+    f"INSERT INTO tarifario_estandar ({', '.join(COLUMNAS_INSERT)}) "
+    f"VALUES ({', '.join('?' * len(COLUMNAS_INSERT))})"
+)
+
+
+def _normalizar_encabezado(nombre) -> str:
+    """'País origen ' -> 'PAIS_ORIGEN'."""
+    texto = unicodedata.normalize("NFKD", str(nombre or "")).encode("ascii", "ignore").decode()
+    return "_".join(texto.replace("-", " ").replace("/", " ").upper().split())
+
+
+def _texto(serie: pd.Series) -> pd.Series:
+    """
+    Texto comparable contra catálogo: sin espacios de más y en mayúsculas (None si viene vacío).
+    Se normalizan solo los valores distintos (pocos por columna) y se reparten con take().
+    """
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=True)
+    normalizados = np.array([" ".join(str(v).split()).upper() or None for v in unicos] + [None], dtype=object)
+    return pd.Series(normalizados[codigos], index=serie.index, dtype=object)
+
+
+# =====================================================
+# LECTURA EN STREAMING
+# =====================================================
+def _filas_excel(archivo):
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        yield from libro.active.iter_rows(values_only=True)
+    finally:
+        libro.close()
+
+
+def _filas_csv(archivo):
+    texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+    try:
+        muestra = texto.read(4096)
+        texto.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t")
+        except csv.Error:
+            dialecto = csv.excel
+        yield from csv.reader(texto, dialecto)
+    finally:
+        texto.detach()  # el archivo subido sigue siendo de quien lo abrió
+
+
+def leer_lotes(archivo, nombre: str, tamano: int = LOTE_IMPORT, obligatorias: tuple = COLUMNAS_OBLIGATORIAS):
+    """
+    Recorre la hoja / CSV y entrega DataFrames de hasta `tamano` filas con
+    encabezados normalizados y la columna FILA (número de fila en el archivo).
+    """
+    es_excel = nombre.lower().endswith((".xlsx", ".xlsm"))
+    filas = _filas_excel(archivo) if es_excel else _filas_csv(archivo)
+    encabezado = [_normalizar_encabezado(c) for c in next(filas, ())]
+    if not any(encabezado):
+        raise ValueError("El archivo no tiene encabezados.")
+    faltantes = [c for c in obligatorias if c not in encabezado]
+    if faltantes:
+        raise ValueError(f"Faltan columnas obligatorias: {', '.join(faltantes)}")
+
+    ancho = len(encabezado)
+    lote, numeros = [], []
+    for numero, fila in enumerate(filas, start=2):
+        if not any(v is not None and str(v).strip() for v in fila):
+            continue
+        if numero - 1 > MAX_FILAS_IMPORT:
+            raise ValueError(f"El archivo tiene más de {MAX_FILAS_IMPORT:,} filas; divídelo en varios.")
+        fila = tuple(fila[:ancho])
+        lote.append(fila + (None,) * (ancho - len(fila)))
+        numeros.append(numero)
+        if len(lote) == tamano:
+            yield pd.DataFrame(lote, columns=encabezado).assign(FILA=numeros)
+            lote, numeros = [], []
+    if lote:
+        yield pd.DataFrame(lote, columns=encabezado).assign(FILA=numeros)
+
+
+# =====================================================
+# VALIDACIÓN (VECTORIZADA POR LOTE)
+# =====================================================
+def _mapa_mayusculas(nombres) -> dict:
+    """NOMBRE EN MAYÚSCULAS -> nombre tal como está en el catálogo."""
+    return {" ".join(str(n).split()).upper(): n for n in nombres}
+
+
+def _mapa_nivel(nivel) -> dict:
+    """(id_padre, NOMBRE) -> (id, nombre) de un nivel del árbol geográfico (solo activos)."""
+    mapa = {}
+    for padre, (inicio, fin) in nivel.rangos.items():
+        for i in range(inicio, fin):
+            mapa[(padre, " ".join(nivel.nombres[i].split()).upper())] = (nivel.ids[i], nivel.nombres[i])
+    return mapa
+
+
+@dataclass
+class Referencias:
+    """Foto de catálogos y carriles activos contra la que se valida todo el archivo."""
+
+    transportistas: dict
+    clientes: dict
+    operaciones: dict
+    unidades: dict
+    paises: dict
+    estados: dict
+    ciudades: dict
+    carriles_activos: frozenset
+
+    @classmethod
+    def cargar(cls) -> "Referencias":
+        catalogos = obtener_catalogos()
+        arbol = obtener_arbol()
+        with conexion_lectura() as conn:
+            activos = frozenset(
+                r[0] for r in conn.execute(
+                    "SELECT LANE_KEY FROM tarifario_estandar WHERE ACTIVA = 1 AND LANE_KEY IS NOT NULL"
+                )
+            )
+        return cls(
+            transportistas=_mapa_mayusculas(catalogos["CAT_TRANSPORTISTAS"].lista()),
+            clientes=_mapa_mayusculas((SIN_CLIENTE,) + catalogos["CAT_CLIENTES"].lista()),
+            operaciones=_mapa_mayusculas(catalogos["CAT_TIPO_OPERACION"].lista() or OPERACIONES_DEFAULT),
+            unidades=_mapa_mayusculas(catalogos["CAT_TIPO_UNIDAD"].lista()),
+            paises=_mapa_nivel(arbol.paises),
+            estados=_mapa_nivel(arbol.estados),
+            ciudades=_mapa_nivel(arbol.ciudades),
+            carriles_activos=activos,
+        )
+
+
+def _resolver_geografia(df: pd.DataFrame, refs: Referencias, lado: str, reglas: list) -> None:
+    """País -> estado -> ciudad del lado, cada nivel bajo el id del padre. Escribe nombres e ids."""
+    id_padre = pd.Series([None] * len(df), index=df.index, dtype=object)
+    for nivel, mapa in (("PAIS", refs.paises), ("ESTADO", refs.estados), ("CIUDAD", refs.ciudades)):
+        col = f"{nivel}_{lado}"
+        claves = _texto(df[col])
+        encontrados = [
+            mapa.get((padre, nombre)) if nombre is not None else None
+            for padre, nombre in zip(id_padre, claves)
+        ]
+        ids = pd.Series([e[0] if e else None for e in encontrados], index=df.index, dtype=object)
+        df[col] = [e[1] if e else None for e in encontrados]
+        df[f"ID_{col}"] = ids
+        # Solo se reporta el primer nivel que falla (sin país no hay estado que buscar)
+        falta = ids.isna() if nivel == "PAIS" else ids.isna() & id_padre.notna()
+        reglas.append((falta, f"{col.replace('_', ' ').capitalize()} no existe en el catálogo (o está inactivo)"))
+        id_padre = ids
+
+
+@dataclass
+class ResultadoImportacion:
+    aceptadas: pd.DataFrame
+    rechazadas: pd.DataFrame  # FILA, MOTIVO y las columnas del archivo
+    reemplazar_activas: bool
+    filas_leidas: int
+    segundos_validacion: float
+    nuevas_versiones: int = 0
+    insertadas: int = 0
+    segundos_escritura: float = 0.0
+    archivo: str = ""
+    avisos: list = field(default_factory=list)
+
+    @property
+    def filas_por_segundo(self) -> float:
+        segundos = self.segundos_validacion + self.segundos_escritura
+        return self.filas_leidas / segundos if segundos else 0.0
+
+
+def validar_lote(df: pd.DataFrame, refs: Referencias, vistas: set, reemplazar_activas: bool = True):
+    """
+    Reglas de captura (catálogos, E.3, ALL_IN de E.1, duplicados) sobre un lote.
+    vistas: LANE_KEY ya aceptadas en lotes anteriores (carril repetido en el archivo).
+    Devuelve (aceptadas, rechazadas).
+    """
+    original = df.copy()
+    df = df.copy()
+    for col in ("CLIENTE", "MONEDA") + COLUMNAS_NUMERICAS + COLUMNAS_BANDERA + COLUMNAS_TEXTO_LIBRE:
+        if col not in df.columns:
+            df[col] = None
+    reglas = []
+
+    # --- Catálogos (texto normalizado -> nombre canónico) ---
+    df["CLIENTE"] = _texto(df["CLIENTE"]).fillna(SIN_CLIENTE)
+    for col, mapa, motivo in (
+        ("TRANSPORTISTA", refs.transportistas, "Transportista no existe o está inactivo"),
+        ("CLIENTE", refs.clientes, "Cliente no existe o está inactivo"),
+        ("TIPO_DE_OPERACION", refs.operaciones, "Tipo de operación no existe en el catálogo"),
+        ("TIPO_UNIDAD", refs.unidades, "Tipo de unidad no existe en el catálogo"),
+    ):
+        df[col] = _texto(df[col]).map(mapa)
+        reglas.append((df[col].isna(), motivo))
+
+    df["TIPO_DE_VIAJE"] = _texto(df["TIPO_DE_VIAJE"])
+    reglas.append((~df["TIPO_DE_VIAJE"].isin(VIAJES).fillna(False), "Tipo de viaje debe ser SENCILLO o REDONDO"))
+    df["MONEDA"] = _texto(df["MONEDA"]).fillna("MXN")
+    reglas.append((~df["MONEDA"].isin(MONEDAS).fillna(False), "Moneda debe ser MXN o USD"))
+
+    for lado in ("ORIGEN", "DESTINO"):
+        _resolver_geografia(df, refs, lado, reglas)
+
+    # --- Números: vacío = 0; texto o negativo se rechaza ---
+    for col in COLUMNAS_NUMERICAS:
+        crudo = df[col]
+        valor = pd.to_numeric(crudo, errors="coerce")
+        vacio = crudo.isna() | (crudo.astype("string").str.strip() == "").fillna(True)
+        reglas.append((valor.isna() & ~vacio, f"{col} no es numérico"))
+        reglas.append(((valor < 0).fillna(False), f"{col} negativo"))
+        df[col] = valor.fillna(0.0).astype(float)
+    df["FREE_TIME"] = df["FREE_TIME"].astype(int)
+    for col in COLUMNAS_BANDERA:
+        df[col] = _texto(df[col]).isin(("1", "SI", "SÍ", "TRUE", "X", "VERDADERO")).astype(int)
+    for col in COLUMNAS_TEXTO_LIBRE:
+        df[col] = df[col].astype("string").str.strip().fillna("").astype(object)
+
+    # --- BLOQUE E.1 / E.3 ---
+    df["ALL_IN"] = df[list(COLUMNAS_COSTO)].sum(axis=1)
+    reglas.append(
+        ((df["PRECIO_VIAJE_SENCILLO"] == 0) & (df["PRECIO_VIAJE_REDONDO"] == 0),
+         "Debes capturar al menos un PRECIO (sencillo o redondo)")
+    )
+    reglas.append((df["ALL_IN"] == 0, "Debes capturar el ALL IN (costos)"))
+
+    # --- Motivos: una matriz filas x reglas; el texto solo se arma para las rechazadas ---
+    fallas = np.column_stack([pd.Series(m).fillna(True).to_numpy(dtype=bool) for m, _ in reglas])
+    textos = [motivo for _, motivo in reglas]
+    motivos = np.full(len(df), "", dtype=object)
+    for i in np.flatnonzero(fallas.any(axis=1)):
+        motivos[i] = "; ".join(t for t, f in zip(textos, fallas[i]) if f)
+    validas = motivos == ""
+
+    # --- Duplicados (solo filas que pasaron las reglas) ---
+    claves = np.zeros(len(df), dtype=np.int64)
+    columnas_carril = df[list(COLUMNAS_CARRIL_TARIFA)].to_numpy(dtype=object)
+    for i in np.flatnonzero(validas):
+        claves[i] = clave_carril(columnas_carril[i])
+    df["LANE_KEY"] = claves
+
+    for i in np.flatnonzero(validas):
+        clave = int(claves[i])
+        if clave in vistas:
+            motivos[i] = "Carril repetido en el archivo (se conserva la primera fila)"
+        elif not reemplazar_activas and clave in refs.carriles_activos:
+            motivos[i] = "Ya existe una tarifa ACTIVA para esta ruta y proveedor"
+        else:
+            vistas.add(clave)
+    validas = motivos == ""
+
+    aceptadas = df.loc[validas].assign(
+        NUEVA_VERSION=df.loc[validas, "LANE_KEY"].isin(refs.carriles_activos).to_numpy(),
+        DESTINO=df.loc[validas, "DESTINO_EMPRESA"],
+    )
+    # Las rechazadas se reportan tal como venían (texto: pueden traer "abc" en un costo)
+    rechazadas = original.loc[~validas].astype("string").assign(
+        FILA=original.loc[~validas, "FILA"], MOTIVO=motivos[~validas]
+    )
+    return aceptadas, rechazadas
+
+
+def validar_archivo(archivo, nombre: str, reemplazar_activas: bool = True) -> ResultadoImportacion:
+    """Lee el archivo en lotes y valida cada lote contra una misma foto de catálogos."""
+    inicio = time.perf_counter()
+    refs = Referencias.cargar()
+    vistas: set = set()
+    aceptadas, rechazadas, leidas = [], [], 0
+    for lote in leer_lotes(archivo, nombre):
+        ok, mal = validar_lote(lote, refs, vistas, reemplazar_activas)
+        aceptadas.append(ok)
+        rechazadas.append(mal)
+        leidas += len(lote)
+
+    aceptadas = pd.concat(aceptadas, ignore_index=True) if aceptadas else pd.DataFrame(columns=COLUMNAS_INSERT)
+    rechazadas = pd.concat(rechazadas, ignore_index=True) if rechazadas else pd.DataFrame(columns=["FILA", "MOTIVO"])
+    if not rechazadas.empty:
+        rechazadas = rechazadas[["FILA", "MOTIVO"] + [c for c in rechazadas.columns if c not in ("FILA", "MOTIVO")]]
+    return ResultadoImportacion(
+        aceptadas=aceptadas,
+        rechazadas=rechazadas,
+        reemplazar_activas=reemplazar_activas,
+        filas_leidas=leidas,
+        segundos_validacion=time.perf_counter() - inicio,
+        nuevas_versiones=int(aceptadas["NUEVA_VERSION"].sum()) if "NUEVA_VERSION" in aceptadas else 0,
+        archivo=nombre,
+    )
+
+
+# =====================================================
+# ESCRITURA (UNA SOLA TRANSACCIÓN)
+# =====================================================
+def importar(resultado: ResultadoImportacion, usuario: str = "IMPORTACION") -> ResultadoImportacion:
+    """
+    Escribe todas las filas aceptadas en un solo trabajo del hilo escritor, con la
+    regla de services.crear_nueva_version(): la activa de cada carril pasa a historial
+    y la fila nueva hereda su ID_TARIFA con la siguiente VERSION; carriles nuevos
+    reciben ID_TARIFA consecutivos desde MAX(ID_TARIFA) + 1 y entran con VERSION 1.
+    Si algo falla no se escribe nada.
+    """
+    df = resultado.aceptadas
+    if df.empty:
+        return resultado
+    inicio = time.perf_counter()
+    claves = [int(k) for k in df["LANE_KEY"]]
+    fecha = ahora()
+    motivo = f"Importación masiva: {resultado.archivo}"[:200]
+    datos = df.assign(
+        RESPONSABLE=1, ACTIVA=1, FECHA_CAMBIO=fecha, VIGENTE_DESDE=fecha, VIGENTE_HASTA=FECHA_ABIERTA,
+        USUARIO_CAMBIO=usuario, MOTIVO_CAMBIO=motivo,
+    )
+
+    def _escribir(conn):
+        previas = {}
+        for i in range(0, len(claves), LOTE_CLAVES):
+            trozo = claves[i:i + LOTE_CLAVES]
+            previas.update(
+                (k, (t, v)) for k, t, v in conn.execute(
+                    f"""
+                    SELECT LANE_KEY, ID_TARIFA, VERSION FROM tarifario_estandar
+                    WHERE ACTIVA = 1 AND LANE_KEY IN ({', '.join('?' * len(trozo))})
+                    """,
+                    trozo,
+                )
+            )
+        if previas and not resultado.reemplazar_activas:
+            raise ValueError("Otra captura activó alguno de estos carriles después de validar; vuelve a validar.")
+
+        # Siguiente VERSION de cada tarifa heredada: MAX(VERSION), no la de la activa
+        heredados = list({t for t, _ in previas.values() if t is not None})
+        ultima = {}
+        for i in range(0, len(heredados), LOTE_CLAVES):
+            trozo = heredados[i:i + LOTE_CLAVES]
+            ultima.update(
+                conn.execute(
+                    f"""
+                    SELECT ID_TARIFA, MAX(VERSION) FROM tarifario_estandar
+                    WHERE ID_TARIFA IN ({', '.join('?' * len(trozo))})
+                    GROUP BY ID_TARIFA
+                    """,
+                    trozo,
+                )
+            )
+
+        siguiente = siguiente_id_tarifa(conn)
+        id_tarifa, version = [], []
+        for k in claves:
+            previa = previas.get(k, (None, None))[0]
+            if previa is None:
+                previa, siguiente = siguiente, siguiente + 1
+            id_tarifa.append(previa)
+            version.append(int(ultima.get(previa) or 0) + 1)
+
+        conn.executemany(SQL_DESACTIVAR_CARRIL, [(fecha, k) for k in previas])
+        filas = datos.assign(LANE_KEY=claves, ID_TARIFA=id_tarifa, VERSION=version)[list(COLUMNAS_INSERT)]
+        conn.executemany(SQL_INSERT_IMPORT, filas.astype(object).where(filas.notna(), None).itertuples(index=False))
+        return len(previas)
+
+    resultado.nuevas_versiones = ejecutar_escritura(_escribir, timeout=None)
+    resultado.insertadas = len(df)
+    resultado.segundos_escritura = time.perf_counter() - inicio
+    return resultado
+
+
+def plantilla_csv() -> bytes:
+    """Encabezados que entiende la importación (CSV vacío para llenar)."""
+    return (",".join(COLUMNAS_PLANTILLA) + "\n").encode("utf-8-sig")
+
+
+# =====================================================
+# IMPORTACIÓN DE CATÁLOGOS
+# =====================================================
+# Catálogos de una columna: nombre en pantalla -> tabla (columna y ACTIVO salen de ESQUEMA_CATALOGOS)
+CATALOGOS_PLANOS = {
+    "Clientes": "CAT_CLIENTES",
+    "Transportistas": "CAT_TRANSPORTISTAS",
+    "Tipos de operación": "CAT_TIPO_OPERACION",
+    "Tipos de viaje": "CAT_TIPO_VIAJE",
+    "Tipos de unidad": "CAT_TIPO_UNIDAD",
+}
+GEOGRAFIA = "Geografía (país / estado / ciudad)"
+
+
+@dataclass
+class ResultadoCatalogo:
+    filas_leidas: int = 0
+    nuevos: dict = field(default_factory=dict)  # tabla -> registros insertados
+    existentes: int = 0  # ya estaban (sin importar mayúsculas / espacios)
+    rechazadas: list = field(default_factory=list)  # (fila, motivo)
+    ids_tarifario: int = 0  # ids de geografía resueltos en tarifario_estandar
+    segundos: float = 0.0
+
+
+def _nombre(valor) -> str:
+    """Igual que las altas de una en una: sin espacios de más y en mayúsculas."""
+    return " ".join(str(valor).split()).upper() if valor is not None else ""
+
+
+def _nombres_existentes(conn, tabla: str, col_padre: str | None = None) -> dict:
+    """(padre, NOMBRE) o NOMBRE -> id, con UNA consulta (nada de SELECT por fila)."""
+    col_id, col_nombre, _, _ = ESQUEMA_CATALOGOS[tabla]
+    filas = conn.execute(
+        f"SELECT {col_id}, {col_nombre}, {col_padre or 'NULL'} FROM {tabla} WHERE {col_nombre} IS NOT NULL"
+    )
+    if col_padre:
+        return {(padre, _nombre(n)): i for i, n, padre in filas}
+    return {_nombre(n): i for i, n, _ in filas}
+
+
+def _insertar_nuevos(conn, tabla: str, columnas: tuple, filas: list) -> int:
+    """executemany con ON CONFLICT DO NOTHING: lo que ya exista (índice UNIQUE) no truena."""
+    if not filas:
+        return 0
+    _, _, _, tiene_activo = ESQUEMA_CATALOGOS[tabla]
+    marcas = ("?",) * len(columnas)
+    if tiene_activo:
+        columnas, marcas = columnas + ("ACTIVO",), marcas + ("1",)
+    return conn.executemany(
+        f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join(marcas)}) ON CONFLICT DO NOTHING",
+        filas,
+    ).rowcount
+
+
+def importar_catalogo(archivo, nombre: str, catalogo: str) -> ResultadoCatalogo:
+    """
+    Alta masiva de un catálogo de una columna (la columna se llama como en la
+    tabla, p. ej. CLIENTE, o NOMBRE). Todo en una sola transacción.
+    """
+    inicio = time.perf_counter()
+    tabla = CATALOGOS_PLANOS[catalogo]
+    _, col_nombre, _, _ = ESQUEMA_CATALOGOS[tabla]
+    resultado = ResultadoCatalogo()
+
+    nombres = {}  # NOMBRE -> primera fila donde aparece (conserva el orden del archivo)
+    for lote in leer_lotes(archivo, nombre, obligatorias=()):
+        columna = col_nombre if col_nombre in lote.columns else "NOMBRE"
+        if columna not in lote.columns:
+            raise ValueError(f"Falta la columna {col_nombre} (o NOMBRE).")
+        resultado.filas_leidas += len(lote)
+        for fila, valor in zip(lote["FILA"], lote[columna]):
+            valor = _nombre(valor)
+            if not valor:
+                resultado.rechazadas.append((fila, f"{col_nombre} vacío"))
+            else:
+                nombres.setdefault(valor, fila)
+
+    def _escribir(conn):
+        existentes = _nombres_existentes(conn, tabla)
+        nuevos = [(n,) for n in nombres if n not in existentes]
+        return len(nombres) - len(nuevos), _insertar_nuevos(conn, tabla, (col_nombre,), nuevos)
+
+    resultado.existentes, resultado.nuevos[tabla] = ejecutar_escritura(_escribir, timeout=None)
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
+
+
+def importar_geografia(archivo, nombre: str) -> ResultadoCatalogo:
+    """
+    Archivo jerárquico con columnas PAIS, ESTADO, CIUDAD (ESTADO / CIUDAD pueden
+    venir vacíos para dar de alta solo el nivel de arriba). Los ids de los padres
+    se resuelven con mapas en memoria: un executemany por nivel + una consulta
+    para leer los ids recién creados. Al final se resuelven los ids de geografía
+    de las tarifas que esperaban estos nombres (misma transacción).
+    """
+    inicio = time.perf_counter()
+    resultado = ResultadoCatalogo()
+    rutas = {}  # (PAIS, ESTADO, CIUDAD) -> primera fila
+    for lote in leer_lotes(archivo, nombre, obligatorias=("PAIS",)):
+        resultado.filas_leidas += len(lote)
+        estados = lote["ESTADO"] if "ESTADO" in lote.columns else [None] * len(lote)
+        ciudades = lote["CIUDAD"] if "CIUDAD" in lote.columns else [None] * len(lote)
+        for fila, pais, estado, ciudad in zip(lote["FILA"], lote["PAIS"], estados, ciudades):
+            pais, estado, ciudad = _nombre(pais), _nombre(estado), _nombre(ciudad)
+            if not pais:
+                resultado.rechazadas.append((fila, "PAIS vacío"))
+            elif ciudad and not estado:
+                resultado.rechazadas.append((fila, "CIUDAD sin ESTADO"))
+            else:
+                rutas.setdefault((pais, estado, ciudad), fila)
+
+    def _escribir(conn):
+        nuevos, existentes = {}, 0
+
+        paises = _nombres_existentes(conn, "CAT_PAISES")
+        pendientes = list(dict.fromkeys(p for p, _, _ in rutas if p not in paises))
+        existentes += len({p for p, _, _ in rutas}) - len(pendientes)
+        nuevos["CAT_PAISES"] = _insertar_nuevos(conn, "CAT_PAISES", ("PAIS",), [(p,) for p in pendientes])
+        if pendientes:
+            paises = _nombres_existentes(conn, "CAT_PAISES")
+
+        estados = _nombres_existentes(conn, "CAT_ESTADOS_NEW", "ID_PAIS")
+        claves = {(paises[p], e) for p, e, _ in rutas if e}
+        pendientes = [k for k in claves if k not in estados]
+        existentes += len(claves) - len(pendientes)
+        nuevos["CAT_ESTADOS_NEW"] = _insertar_nuevos(
+            conn, "CAT_ESTADOS_NEW", ("ID_PAIS", "ESTADO"), sorted(pendientes)
+        )
+        if pendientes:
+            estados = _nombres_existentes(conn, "CAT_ESTADOS_NEW", "ID_PAIS")
+
+        ciudades = _nombres_existentes(conn, "CAT_CIUDADES", "ID_ESTADO")
+        claves = {(estados[(paises[p], e)], c) for p, e, c in rutas if c}
+        pendientes = [k for k in claves if k not in ciudades]
+        existentes += len(claves) - len(pendientes)
+        nuevos["CAT_CIUDADES"] = _insertar_nuevos(conn, "CAT_CIUDADES", ("ID_ESTADO", "CIUDAD"), sorted(pendientes))
+
+        return nuevos, existentes, completar_ids_geografia(conn)
+
+    resultado.nuevos, resultado.existentes, resultado.ids_tarifario = ejecutar_escritura(_escribir, timeout=None)
+    resultado.segundos = time.perf_counter() - inicio
+    return resultado
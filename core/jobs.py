@@ -0,0 +1,218 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from core.db import BASE_DIR, conexion_lectura
+from core.export import FORMATOS, exportar_a_archivo
+from core.services import TABLA_TARIFARIO, token_datos
+
+# Archivos terminados; se comparten entre sesiones (y entre procesos de streamlit)
+DIRECTORIO_EXPORTS = Path(os.environ.get("TARIFARIO_EXPORTS", BASE_DIR / ".exports"))
+# Hilos que generan archivos a la vez (lectura de SQLite + escritura del formato)
+MAX_HILOS_EXPORT = 2
+# Trabajos pendientes (en cola + generando); arriba de esto se rechaza el envío
+MAX_EN_COLA = 8
+# Tamaño máximo del directorio de exports; se borra el menos usado primero
+MAX_BYTES_EXPORTS = 512 * 1024 * 1024
+# Trabajos terminados que se recuerdan en memoria (el archivo sigue en disco)
+VIGENCIA_TRABAJO_S = 3600
+
+
+@dataclass
+class Trabajo:
+    """Una exportación en segundo plano. La actualiza solo el hilo que la genera."""
+
+    id: str
+    clave: str
+    peticion: tuple  # (sql, params, formato) tal como se pidió
+    estado: str = "en_cola"  # en_cola | generando | listo | error
+    filas: int = 0
+    total: int = 0
+    ruta: Path | None = None
+    error: str | None = None
+    creado: float = field(default_factory=time.time)
+
+    @property
+    def formato(self) -> str:
+        return self.peticion[2]
+
+    @property
+    def terminado(self) -> bool:
+        return self.estado in ("listo", "error")
+
+    @property
+    def progreso(self) -> float:
+        if self.estado == "listo":
+            return 1.0
+        return min(self.filas / self.total, 1.0) if self.total else 0.0
+
+
+_ejecutor = ThreadPoolExecutor(max_workers=MAX_HILOS_EXPORT, thread_name_prefix="export")
+_trabajos: dict[str, Trabajo] = {}
+_por_clave: dict[str, str] = {}  # clave de la petición -> id del trabajo vigente
+_lock = threading.Lock()
+_contadores = {"enviados": 0, "reusados": 0, "desde_disco": 0, "generados": 0, "errores": 0, "desalojados": 0}
+
+
+def clave_export(sql: str, params: tuple, formato: str) -> str:
+    """Misma consulta + filtros + formato + versión de datos -> mismo archivo."""
+    token = token_datos((TABLA_TARIFARIO,))
+    return hashlib.sha256(repr((token, sql, tuple(params), formato)).encode()).hexdigest()[:32]
+
+
+def _ruta_archivo(clave: str, formato: str) -> Path:
+    return DIRECTORIO_EXPORTS / f"{clave}.{FORMATOS[formato][1]}"
+
+
+# =====================================================
+# CACHÉ EN DISCO (LRU POR TAMAÑO)
+# =====================================================
+def _archivos_cache() -> list[os.DirEntry]:
+    if not DIRECTORIO_EXPORTS.exists():
+        return []
+    with os.scandir(DIRECTORIO_EXPORTS) as entradas:
+        return [e for e in entradas if e.is_file() and not e.name.startswith(".")]
+
+
+def _tocar(ruta: Path) -> None:
+    """Marca el archivo como recién usado (la LRU ordena por mtime)."""
+    try:
+        os.utime(ruta)
+    except FileNotFoundError:
+        pass
+
+
+def desalojar(max_bytes: int = MAX_BYTES_EXPORTS) -> int:
+    """Borra los archivos menos usados hasta quedar bajo max_bytes. Siempre deja el más reciente."""
+    archivos = sorted(_archivos_cache(), key=lambda e: e.stat().st_mtime)
+    total = sum(e.stat().st_size for e in archivos)
+    borrados = 0
+    for entrada in archivos[:-1]:
+        if total <= max_bytes:
+            break
+        total -= entrada.stat().st_size
+        Path(entrada.path).unlink(missing_ok=True)
+        borrados += 1
+    _contadores["desalojados"] += borrados
+    return borrados
+
+
+# =====================================================
+# EJECUCIÓN
+# =====================================================
+def _generar(trabajo: Trabajo) -> None:
+    sql, params, formato = trabajo.peticion
+    destino = _ruta_archivo(trabajo.clave, formato)
+    temporal = DIRECTORIO_EXPORTS / f".{trabajo.id}.tmp"
+    trabajo.estado = "generando"
+    try:
+        with conexion_lectura() as conn:
+            trabajo.total = conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+
+        def avance(n: int) -> None:
+            trabajo.filas += n
+
+        with open(temporal, "wb") as archivo:
+            exportar_a_archivo(sql, params, formato, archivo, progreso=avance)
+        # Rename atómico: nadie ve un archivo a medias
+        os.replace(temporal, destino)
+        trabajo.ruta = destino
+        trabajo.estado = "listo"
+        _contadores["generados"] += 1
+        desalojar()
+    except Exception as e:
+        temporal.unlink(missing_ok=True)
+        trabajo.error = str(e)
+        trabajo.estado = "error"
+        _contadores["errores"] += 1
+
+
+def _purgar() -> None:
+    limite = time.time() - VIGENCIA_TRABAJO_S
+    for id_, t in list(_trabajos.items()):
+        if t.terminado and t.creado < limite:
+            del _trabajos[id_]
+            if _por_clave.get(t.clave) == id_:
+                del _por_clave[t.clave]
+
+
+def enviar_export(sql: str, params: tuple = (), formato: str = "xlsx") -> Trabajo:
+    """
+    Encola la exportación y regresa su Trabajo sin esperar.
+    Si otra sesión ya pidió lo mismo (en curso o en disco) se reusa ese resultado.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconocido: {formato}")
+    params = tuple(params)
+    clave = clave_export(sql, params, formato)
+    destino = _ruta_archivo(clave, formato)
+
+    with _lock:
+        _purgar()
+        _contadores["enviados"] += 1
+        previo = _trabajos.get(_por_clave.get(clave))
+        if previo is not None and previo.estado != "error" and (not previo.terminado or destino.exists()):
+            _contadores["reusados"] += 1
+            return previo
+
+        trabajo = Trabajo(id=uuid.uuid4().hex, clave=clave, peticion=(sql, params, formato))
+        if destino.exists():
+            _tocar(destino)
+            trabajo.ruta, trabajo.estado = destino, "listo"
+            _contadores["desde_disco"] += 1
+        else:
+            pendientes = sum(not t.terminado for t in _trabajos.values())
+            if pendientes >= MAX_EN_COLA:
+                raise RuntimeError("Hay demasiadas exportaciones en curso; intenta de nuevo en unos segundos.")
+            DIRECTORIO_EXPORTS.mkdir(parents=True, exist_ok=True)
+            _ejecutor.submit(_generar, trabajo)
+
+        _trabajos[trabajo.id] = trabajo
+        _por_clave[clave] = trabajo.id
+        return trabajo
+
+
+def obtener_trabajo(id_trabajo: str | None) -> Trabajo | None:
+    return _trabajos.get(id_trabajo) if id_trabajo else None
+
+
+def leer_resultado(id_trabajo: str) -> bytes:
+    """Bytes del archivo terminado (para download_button con data=callable)."""
+    trabajo = _trabajos[id_trabajo]
+    if trabajo.estado != "listo":
+        raise RuntimeError(f"La exportación {id_trabajo} no está lista ({trabajo.estado})")
+    _tocar(trabajo.ruta)
+    return trabajo.ruta.read_bytes()
+
+
+def limpiar() -> int:
+    """Olvida los trabajos terminados y borra los archivos del caché (benchmarks / pruebas)."""
+    with _lock:
+        for id_, t in list(_trabajos.items()):
+            if t.terminado:
+                del _trabajos[id_]
+                if _por_clave.get(t.clave) == id_:
+                    del _por_clave[t.clave]
+    archivos = _archivos_cache()
+    for entrada in archivos:
+        Path(entrada.path).unlink(missing_ok=True)
+    return len(archivos)
+
+
+def stats() -> dict:
+    with _lock:
+        estados = {}
+        for t in _trabajos.values():
+            estados[t.estado] = estados.get(t.estado, 0) + 1
+    archivos = _archivos_cache()
+    return {
+        **_contadores,
+        "trabajos": estados,
+        "archivos": len(archivos),
+        "mb_en_disco": round(sum(e.stat().st_size for e in archivos) / (1024 * 1024), 1),
+    }
@@ -0,0 +1,247 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from core import db
+from core.queries import COLUMNAS_RESULTADO, FILTROS_BUSQUEDA, SIN_FILTRO, SQL_MARCAS_TARIFARIO
+from core.services import BitacoraPodada, leer_delta, podar_bitacora, registrar_lector
+
+COLUMNAS_CATEGORICAS = list(FILTROS_BUSQUEDA.values())
+COLUMNAS_NUMERICAS = [c for c in COLUMNAS_RESULTADO if c not in COLUMNAS_CATEGORICAS]
+
+# Bitsets empaquetados que se conservan por columna (LRU); el resto se recalcula
+BITSETS_POR_COLUMNA = 256
+# Con más de esta fracción de filas muertas el índice se compacta (se rearma con las vivas)
+FRACCION_MUERTAS_MAX = 0.25
+
+
+class _Columna:
+    """Códigos categóricos de una columna + bitsets por valor (calculados al vuelo)."""
+
+    def __init__(self, valores):
+        codigos, categorias = pd.factorize(pd.Series(valores, dtype=object))
+        self.codigos = codigos.astype(np.int32)
+        self.categorias = list(categorias)
+        self.codigo_por_valor = {v: i for i, v in enumerate(self.categorias)}
+        self.bitsets: OrderedDict = OrderedDict()
+
+    def codificar(self, valores) -> np.ndarray:
+        """Códigos para filas nuevas; agrega categorías que no existían."""
+        codigos = np.empty(len(valores), dtype=np.int32)
+        for i, v in enumerate(valores):
+            if v is None or (isinstance(v, float) and np.isnan(v)):
+                codigos[i] = -1
+                continue
+            codigo = self.codigo_por_valor.get(v)
+            if codigo is None:
+                codigo = len(self.categorias)
+                self.categorias.append(v)
+                self.codigo_por_valor[v] = codigo
+            codigos[i] = codigo
+        return codigos
+
+    def agregar(self, valores) -> None:
+        self.codigos = np.concatenate([self.codigos, self.codificar(valores)])
+        self.bitsets.clear()
+
+    def bitset(self, valor) -> np.ndarray | None:
+        codigo = self.codigo_por_valor.get(valor)
+        if codigo is None:
+            return None
+        bits = self.bitsets.get(codigo)
+        if bits is None:
+            bits = np.packbits(self.codigos == codigo)
+            self.bitsets[codigo] = bits
+            if len(self.bitsets) > BITSETS_POR_COLUMNA:
+                self.bitsets.popitem(last=False)
+        else:
+            self.bitsets.move_to_end(codigo)
+        return bits
+
+    def decodificar(self, posiciones: np.ndarray) -> np.ndarray:
+        categorias = np.array(self.categorias + [None], dtype=object)
+        return categorias[self.codigos[posiciones]]  # -1 cae en el None final
+
+
+class IndiceCarriles:
+    """
+    Índice columnar de solo lectura sobre las tarifas ACTIVAS.
+
+    Cada filtro del buscador es un bitset empaquetado (1 bit por fila);
+    una búsqueda es un AND vectorizado de esos bitsets más el de filas vivas.
+    Las filas desactivadas se marcan como muertas; cuando pasan de FRACCION_MUERTAS_MAX
+    el índice se compacta para que cada versión escrita no lo haga crecer para siempre.
+    Se arma y se pone al día desde la BD principal (no la réplica, que puede ir atrasada):
+    una búsqueda justo después de guardar una versión ya la ve como la activa.
+    """
+
+    def __init__(self, df: pd.DataFrame, max_id: int = 0, max_seq: int = 0):
+        self._lock = threading.RLock()
+        self.max_id = max_id
+        self.max_seq = max_seq
+        self.db_path = None  # BD de la que lee (desde_bd); sin ella no cuenta para podar la bitácora
+        self.filas_refrescadas = 0
+        self.refrescos = 0
+        self.compactaciones = 0
+        self._cargar(df)
+
+    def _cargar(self, df: pd.DataFrame) -> None:
+        self.columnas = {c: _Columna(df[c].to_numpy(dtype=object)) for c in COLUMNAS_CATEGORICAS}
+        self.numericas = {c: pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=float) for c in COLUMNAS_NUMERICAS}
+        self.ids = df["id"].to_numpy(dtype=np.int64)
+        self.vivas = np.ones(len(df), dtype=bool)
+        self._vivas_bits = np.packbits(self.vivas)
+
+    @staticmethod
+    def _leer_activas(conn) -> tuple[pd.DataFrame, int, int]:
+        max_id, max_seq = conn.execute(SQL_MARCAS_TARIFARIO).fetchone()
+        df = pd.read_sql(
+            f"SELECT {', '.join(COLUMNAS_RESULTADO)} FROM tarifario_estandar "
+            "WHERE ACTIVA = 1 AND id <= ? ORDER BY id",
+            conn,
+            params=(max_id,),
+        )
+        return df, max_id, max_seq
+
+    @classmethod
+    def desde_bd(cls) -> "IndiceCarriles":
+        with db.conexion_lectura() as conn:
+            conn.execute("BEGIN")
+            df, max_id, max_seq = cls._leer_activas(conn)
+            conn.rollback()
+        indice = cls(df, max_id, max_seq)
+        indice.db_path = db.DB_PATH
+        registrar_lector(indice)
+        return indice
+
+    def __len__(self) -> int:
+        return int(self.vivas.sum())
+
+    # -------------------------------------------------
+    # BÚSQUEDA
+    # -------------------------------------------------
+    def posiciones(self, filtros: dict) -> np.ndarray:
+        with self._lock:
+            resultado = self._vivas_bits.copy()
+            for clave, valor in filtros.items():
+                if valor in SIN_FILTRO:
+                    continue
+                bits = self.columnas[FILTROS_BUSQUEDA[clave]].bitset(valor)
+                if bits is None:
+                    return np.empty(0, dtype=np.int64)
+                np.bitwise_and(resultado, bits, out=resultado)
+            # Solo se desempacan los bytes con algún bit encendido
+            bytes_con_filas = np.flatnonzero(resultado)
+            bits = np.unpackbits(resultado[bytes_con_filas]).reshape(-1, 8).astype(bool)
+            pos = (bytes_con_filas[:, None] * 8 + np.arange(8))[bits]
+            return pos[pos < len(self.ids)]
+
+    def buscar(self, filtros: dict) -> pd.DataFrame:
+        """Mismo contrato que construir_busqueda(): filas activas, columnas de resultado, orden por id."""
+        with self._lock:
+            pos = self.posiciones(filtros)
+            pos = pos[np.argsort(self.ids[pos], kind="stable")]
+            return self._filas(pos)
+
+    def _filas(self, pos: np.ndarray) -> pd.DataFrame:
+        with self._lock:
+            datos = {}
+            for c in COLUMNAS_RESULTADO:
+                if c in self.columnas:
+                    datos[c] = self.columnas[c].decodificar(pos)
+                elif c == "id":
+                    datos[c] = self.ids[pos]
+                else:
+                    datos[c] = self.numericas[c][pos]
+            return pd.DataFrame(datos, columns=COLUMNAS_RESULTADO)
+
+    # -------------------------------------------------
+    # ACTUALIZACIÓN INCREMENTAL
+    # -------------------------------------------------
+    def aplicar(self, nuevas: pd.DataFrame, ids_cambiados) -> None:
+        """Marca como muertas las filas cambiadas y agrega las activas nuevas/cambiadas."""
+        with self._lock:
+            ids_cambiados = np.asarray(list(ids_cambiados), dtype=np.int64)
+            if len(ids_cambiados):
+                self.vivas[np.isin(self.ids, ids_cambiados)] = False
+
+            if len(nuevas):
+                for c, col in self.columnas.items():
+                    col.agregar(nuevas[c].to_numpy(dtype=object))
+                for c in self.numericas:
+                    valores = pd.to_numeric(nuevas[c], errors="coerce").to_numpy(dtype=float)
+                    self.numericas[c] = np.concatenate([self.numericas[c], valores])
+                self.ids = np.concatenate([self.ids, nuevas["id"].to_numpy(dtype=np.int64)])
+                self.vivas = np.concatenate([self.vivas, np.ones(len(nuevas), dtype=bool)])
+
+            self.filas_refrescadas += len(nuevas) + len(ids_cambiados)
+            if (~self.vivas).sum() > FRACCION_MUERTAS_MAX * len(self.vivas):
+                self.compactar()
+            else:
+                self._vivas_bits = np.packbits(self.vivas)
+
+    def compactar(self) -> None:
+        """Rearma columnas, códigos y bitsets solo con las filas vivas (las categorías sin filas se van)."""
+        with self._lock:
+            self._cargar(self._filas(np.flatnonzero(self.vivas)))
+            self.compactaciones += 1
+
+    def refrescar(self) -> int:
+        """
+        Trae solo lo nuevo: filas con id > último id visto y filas registradas
+        en tarifario_cambios (UPDATE/DELETE) desde el último SEQ visto.
+        Devuelve cuántas filas se leyeron.
+        """
+        with db.conexion_lectura() as conn:
+            conn.execute("BEGIN")
+            try:
+                nuevas, cambiados, max_id, max_seq = leer_delta(
+                    conn, self.max_id, self.max_seq, ", ".join(COLUMNAS_RESULTADO), solo_activas=True
+                )
+                leidas = 0 if nuevas is None else len(nuevas) + len(cambiados)
+                if nuevas is not None:
+                    self.aplicar(nuevas, [i for i in cambiados if i <= self.max_id])
+            except BitacoraPodada:
+                # Otro proceso podó cambios que no se leyeron: se rearma completo
+                nuevas, max_id, max_seq = self._leer_activas(conn)
+                leidas = len(nuevas)
+                with self._lock:
+                    self._cargar(nuevas)
+            finally:
+                conn.rollback()
+        if nuevas is not None:
+            self.max_id, self.max_seq = max_id, max_seq
+            self.refrescos += 1
+        podar_bitacora()
+        return leidas
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "filas": len(self.ids),
+                "vivas": len(self),
+                "max_id": self.max_id,
+                "max_seq": self.max_seq,
+                "refrescos": self.refrescos,
+                "filas_refrescadas": self.filas_refrescadas,
+                "compactaciones": self.compactaciones,
+            }
+
+
+_indice: IndiceCarriles | None = None
+_indice_db = None
+_lock = threading.Lock()
+
+
+def obtener_indice() -> IndiceCarriles:
+    """Índice compartido por todas las sesiones; se pone al día en cada llamada (O(1) si no hubo cambios)."""
+    global _indice, _indice_db
+    with _lock:
+        if _indice is None or _indice_db != db.DB_PATH:
+            _indice = IndiceCarriles.desde_bd()
+            _indice_db = db.DB_PATH
+        else:
+            _indice.refrescar()
+        return _indice
@@ -0,0 +1,602 @@
+import logging
+import re
+import threading
+
+import pandas as pd
+
+from core import db
+from core.queries import (
+    COLUMNAS_CARRIL_TARIFA,
+    CONSULTAS_CRITICAS,
+    FECHA_ABIERTA,
+    FECHA_INICIAL,
+    FORMATO_FECHA,
+    TABLAS_CATALOGO,
+    SQL_CARRILES_DUPLICADOS,
+    SQL_DESACTIVAR_CARRIL,
+    TABLA_FECHAS,
+)
+from core.archive import TABLA_HISTORIAL, sincronizar_historial
+from core.geography import completar_ids_geografia
+from core.services import ahora, clave_carril
+
+log = logging.getLogger(__name__)
+
+def _crear_triggers_control(conn, tablas) -> None:
+    """Cualquier INSERT/UPDATE/DELETE en la tabla sube su VERSION en control_cambios."""
+    for tabla in tablas:
+        conn.execute("INSERT OR IGNORE INTO control_cambios (TABLA, VERSION) VALUES (?, 0)", (tabla,))
+        for evento in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS trg_control_{tabla.lower()}_{evento.lower()}
+                AFTER {evento} ON {tabla}
+                BEGIN
+                    UPDATE control_cambios SET VERSION = VERSION + 1 WHERE TABLA = '{tabla}';
+                END
+                """
+            )
+
+
+def _registrar_clave_carril(conn) -> None:
+    conn.create_function(
+        "clave_carril", len(COLUMNAS_CARRIL_TARIFA), lambda *valores: clave_carril(valores), deterministic=True
+    )
+
+
+def _agregar_lane_key(conn) -> None:
+    """
+    LANE_KEY en todas las filas con un solo UPDATE. clave_carril() se registra
+    solo en esta conexión (ningún trigger la usa: otras herramientas pueden
+    seguir abriendo la BD); fila por fila con executemany es ~8x más lento en WAL.
+    """
+    columnas = {r[1] for r in conn.execute("PRAGMA table_info(tarifario_estandar)")}
+    if "LANE_KEY" not in columnas:
+        conn.execute("ALTER TABLE tarifario_estandar ADD COLUMN LANE_KEY INTEGER")
+
+    _registrar_clave_carril(conn)
+    conn.execute(
+        f"""
+        UPDATE tarifario_estandar
+        SET LANE_KEY = clave_carril({', '.join(COLUMNAS_CARRIL_TARIFA)})
+        WHERE LANE_KEY IS NULL
+        """
+    )
+
+
+def asegurar_unica_activa(conn) -> int:
+    """
+    Crea ux_tarifario_carril_activa si cada carril tiene a lo más una tarifa activa.
+    Si no, regresa cuántos carriles la repiten y no toca nada: son tarifas de
+    producción y se resuelven a mano (BLOQUE 2 de catálogos las lista).
+    """
+    duplicados = conn.execute(f"SELECT COUNT(*) FROM ({SQL_CARRILES_DUPLICADOS})").fetchone()[0]
+    if duplicados == 0:
+        conn.execute(
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS ux_tarifario_carril_activa
+            ON tarifario_estandar (LANE_KEY)
+            WHERE ACTIVA = 1
+            """
+        )
+    return duplicados
+
+
+def falta_unica_activa() -> bool:
+    """True si ux_tarifario_carril_activa no existe (carriles con activas duplicadas)."""
+    with db.conexion_lectura() as conn:
+        return not conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'ux_tarifario_carril_activa'"
+        ).fetchone()
+
+
+def carriles_duplicados(conn) -> pd.DataFrame:
+    """Carriles con más de una tarifa ACTIVA (vacío = el índice único ya puede existir)."""
+    return pd.read_sql(SQL_CARRILES_DUPLICADOS, conn)
+
+
+def _recalcular_vigente(fila: str) -> str:
+    """Sentencias de trigger que recalculan la fila vigente del carril de fila (NEW / OLD)."""
+    return f"""
+        DELETE FROM tarifa_vigente WHERE LANE_KEY = {fila}.LANE_KEY;
+        INSERT INTO tarifa_vigente (LANE_KEY, ID_TARIFA, ID_FILA)
+        SELECT LANE_KEY, ID_TARIFA, id FROM tarifario_estandar
+        WHERE LANE_KEY = {fila}.LANE_KEY AND ACTIVA = 1 AND ID_TARIFA IS NOT NULL
+        ORDER BY ID_TARIFA DESC, VERSION DESC, id DESC
+        LIMIT 1;
+    """
+
+
+def _crear_tarifa_vigente(conn) -> None:
+    """
+    tarifa_vigente: una fila por LANE_KEY con la tarifa ACTIVA de mayor ID_TARIFA
+    (las filas sin ID_TARIFA no se pueden versionar y quedan fuera, como con MAX()).
+    Si un carril aún tiene activas duplicadas queda la misma que regresa SQL_ACTIVA_CARRIL.
+    Los triggers la actualizan en la misma transacción que cada INSERT / UPDATE / DELETE
+    de tarifario_estandar, así que todas las páginas la mantienen sin tocar su código.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS tarifa_vigente (
+            LANE_KEY INTEGER PRIMARY KEY,
+            ID_TARIFA REAL,
+            ID_FILA INTEGER NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO tarifa_vigente (LANE_KEY, ID_TARIFA, ID_FILA)
+        SELECT LANE_KEY, ID_TARIFA, id FROM (
+            SELECT LANE_KEY, ID_TARIFA, id, ROW_NUMBER() OVER (
+                PARTITION BY LANE_KEY ORDER BY ID_TARIFA DESC, VERSION DESC, id DESC
+            ) AS N
+            FROM tarifario_estandar
+            WHERE ACTIVA = 1 AND ID_TARIFA IS NOT NULL AND LANE_KEY IS NOT NULL
+        )
+        WHERE N = 1
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tarifa_vigente_insert
+        AFTER INSERT ON tarifario_estandar
+        WHEN NEW.LANE_KEY IS NOT NULL
+        BEGIN {_recalcular_vigente("NEW")} END
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tarifa_vigente_update
+        AFTER UPDATE OF ACTIVA, ID_TARIFA, LANE_KEY ON tarifario_estandar
+        BEGIN {_recalcular_vigente("OLD")} {_recalcular_vigente("NEW")} END
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tarifa_vigente_delete
+        AFTER DELETE ON tarifario_estandar
+        WHEN OLD.LANE_KEY IS NOT NULL
+        BEGIN {_recalcular_vigente("OLD")} END
+        """
+    )
+
+
+def completar_lane_keys(conn) -> int:
+    """
+    LANE_KEY para filas insertadas fuera de la app (sin clave). Una fila activa
+    desplaza a la activa que ya tenga su carril, como una versión nueva.
+    """
+    filas = conn.execute(
+        f"""
+        SELECT id, ACTIVA, VIGENTE_DESDE, {', '.join(COLUMNAS_CARRIL_TARIFA)}
+        FROM tarifario_estandar WHERE LANE_KEY IS NULL ORDER BY id
+        """
+    ).fetchall()
+    for id_, activa, desde, *valores in filas:
+        clave = clave_carril(valores)
+        if activa == 1:
+            conn.execute(SQL_DESACTIVAR_CARRIL, (desde or ahora(), clave))
+        conn.execute("UPDATE tarifario_estandar SET LANE_KEY = ? WHERE id = ?", (clave, id_))
+    return len(filas)
+
+
+def _renumerar_versiones_repetidas(conn) -> None:
+    """
+    Tarifas con dos filas en la misma VERSION (dos guardados que leyeron el mismo
+    MAX(VERSION)): sus versiones se renumeran 1..n en orden de captura.
+    """
+    conn.execute(
+        """
+        UPDATE tarifario_estandar AS t
+        SET VERSION = r.N
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY ID_TARIFA ORDER BY VERSION, id) AS N
+            FROM tarifario_estandar
+            WHERE ID_TARIFA IN (
+                SELECT ID_TARIFA FROM tarifario_estandar
+                WHERE ID_TARIFA IS NOT NULL AND VERSION IS NOT NULL
+                GROUP BY ID_TARIFA, VERSION
+                HAVING COUNT(*) > 1
+            )
+        ) AS r
+        WHERE t.id = r.id AND t.VERSION IS NOT r.N
+        """
+    )
+
+
+COLUMNAS_FECHA = ("FECHA_CAMBIO", "FECHA_VIGENCIA_INI", "FECHA_VIGENCIA_FIN")
+
+
+def _texto_fecha(fecha) -> str | None:
+    return fecha.strftime(FORMATO_FECHA) if pd.notna(fecha) else None
+
+
+def _interpretar_fechas(conn) -> None:
+    """
+    Las columnas de fecha no se reescriben. Lo que SQLite no entiende (13/01/2026...)
+    se lee con pandas, día primero, y queda en fechas_interpretadas: de ahí sale la
+    vigencia. AMBIGUA = 1 si leída mes primero es otra fecha (ALTERNATIVA: 03/04/2026);
+    FECHA NULL = no se pudo leer.
+    """
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {TABLA_FECHAS} (
+            COLUMNA TEXT NOT NULL,
+            TEXTO TEXT NOT NULL,
+            FECHA TEXT,
+            ALTERNATIVA TEXT,
+            AMBIGUA INTEGER NOT NULL DEFAULT 0,
+            FILAS INTEGER NOT NULL,
+            PRIMARY KEY (COLUMNA, TEXTO)
+        )
+        """
+    )
+    for columna in COLUMNAS_FECHA:
+        textos = conn.execute(
+            f"""
+            SELECT {columna}, COUNT(*) FROM tarifario_estandar
+            WHERE {columna} IS NOT NULL AND trim({columna}) <> '' AND datetime({columna}) IS NULL
+            GROUP BY {columna}
+            """
+        ).fetchall()
+        if not textos:
+            continue
+        serie = pd.Series([str(t) for t, _ in textos], dtype=str)
+        dia = pd.to_datetime(serie, dayfirst=True, format="mixed", errors="coerce")
+        mes = pd.to_datetime(serie, dayfirst=False, format="mixed", errors="coerce")
+        filas = []
+        for (texto, cuantas), d, m in zip(textos, dia, mes):
+            ambigua = pd.notna(d) and pd.notna(m) and d != m
+            filas.append((columna, texto, _texto_fecha(d), _texto_fecha(m) if ambigua else None, int(ambigua), cuantas))
+        conn.executemany(
+            f"""
+            INSERT OR REPLACE INTO {TABLA_FECHAS} (COLUMNA, TEXTO, FECHA, ALTERNATIVA, AMBIGUA, FILAS)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            filas,
+        )
+
+
+def _fecha_leida(columna: str) -> str:
+    """Expresión SQL: la fecha de la columna en FORMATO_FECHA (SQLite o fechas_interpretadas)."""
+    return (
+        f"COALESCE(datetime({columna}), (SELECT f.FECHA FROM {TABLA_FECHAS} f "
+        f"WHERE f.COLUMNA = '{columna}' AND f.TEXTO = {columna}))"
+    )
+
+
+def _agregar_vigencias(conn) -> None:
+    """
+    VIGENTE_DESDE = FECHA_CAMBIO (o el inicio de vigencia comercial, o FECHA_INICIAL),
+    leídas como en _interpretar_fechas;
+    VIGENTE_HASTA = la siguiente versión del carril, abierta si es la activa.
+    Una inactiva sin siguiente no dice cuándo se desactivó: cierra hoy.
+    """
+    columnas = {r[1] for r in conn.execute("PRAGMA table_info(tarifario_estandar)")}
+    for columna in ("VIGENTE_DESDE", "VIGENTE_HASTA"):
+        if columna not in columnas:
+            conn.execute(f"ALTER TABLE tarifario_estandar ADD COLUMN {columna} TEXT")
+
+    conn.execute(
+        f"""
+        UPDATE tarifario_estandar
+        SET VIGENTE_DESDE = COALESCE({_fecha_leida("FECHA_CAMBIO")}, {_fecha_leida("FECHA_VIGENCIA_INI")}, ?)
+        WHERE VIGENTE_DESDE IS NULL
+        """,
+        (FECHA_INICIAL,),
+    )
+    conn.execute(
+        """
+        UPDATE tarifario_estandar AS t
+        SET VIGENTE_HASTA = CASE
+            WHEN t.ACTIVA = 1 THEN :abierta
+            ELSE MAX(t.VIGENTE_DESDE, COALESCE(s.SIGUIENTE, :hoy))
+        END
+        FROM (
+            SELECT id, LEAD(VIGENTE_DESDE) OVER (PARTITION BY LANE_KEY ORDER BY VIGENTE_DESDE, id) AS SIGUIENTE
+            FROM tarifario_estandar
+        ) AS s
+        WHERE t.id = s.id AND t.VIGENTE_HASTA IS NULL
+        """,
+        {"abierta": FECHA_ABIERTA, "hoy": ahora()},
+    )
+
+
+def _crear_triggers_vigencia(conn) -> None:
+    """
+    Para lo que no escribe la app (que ya fija la vigencia): una fila insertada sin
+    VIGENTE_DESDE la toma de FECHA_CAMBIO o de la hora actual, y un cambio de ACTIVA
+    que no toca VIGENTE_HASTA la cierra ahora (o la reabre si se reactivó).
+    """
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_vigencia_insert
+        AFTER INSERT ON tarifario_estandar
+        WHEN NEW.VIGENTE_DESDE IS NULL
+        BEGIN
+            UPDATE tarifario_estandar
+            SET VIGENTE_DESDE = COALESCE(datetime(NEW.FECHA_CAMBIO), datetime('now', 'localtime')),
+                VIGENTE_HASTA = CASE WHEN NEW.ACTIVA = 1 THEN '{FECHA_ABIERTA}'
+                    ELSE COALESCE(datetime(NEW.FECHA_CAMBIO), datetime('now', 'localtime')) END
+            WHERE id = NEW.id;
+        END
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_vigencia_activa
+        AFTER UPDATE OF ACTIVA ON tarifario_estandar
+        WHEN NEW.ACTIVA IS NOT OLD.ACTIVA AND NEW.VIGENTE_HASTA IS OLD.VIGENTE_HASTA
+        BEGIN
+            UPDATE tarifario_estandar
+            SET VIGENTE_HASTA = CASE WHEN NEW.ACTIVA = 1 THEN '{FECHA_ABIERTA}'
+                ELSE MAX(VIGENTE_DESDE, datetime('now', 'localtime')) END
+            WHERE id = NEW.id;
+        END
+        """
+    )
+
+
+# Cada migración: (versión, descripción, pasos). Un paso es una sentencia SQL
+# o una función que recibe la conexión de escritura. Nunca editar una
+# migración ya publicada: agregar una nueva con la siguiente versión.
+MIGRACIONES = [
+    (
+        1,
+        "Índices para búsquedas por carril, ID_TARIFA y filtros de cotización",
+        [
+            """
+            CREATE INDEX IF NOT EXISTS ix_tarifario_id_version
+            ON tarifario_estandar (ID_TARIFA, VERSION)
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS ix_tarifario_ruta_activa
+            ON tarifario_estandar (
+                TRANSPORTISTA, TIPO_UNIDAD,
+                PAIS_ORIGEN, ESTADO_ORIGEN, CIUDAD_ORIGEN,
+                PAIS_DESTINO, ESTADO_DESTINO, CIUDAD_DESTINO
+            )
+            WHERE ACTIVA = 1
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS ix_tarifario_carril
+            ON tarifario_estandar (
+                TRANSPORTISTA, CLIENTE, COALESCE(TIPO_UNIDAD,''),
+                PAIS_ORIGEN, ESTADO_ORIGEN, CIUDAD_ORIGEN,
+                PAIS_DESTINO, ESTADO_DESTINO, CIUDAD_DESTINO,
+                ID_TARIFA
+            )
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS ix_tarifario_cliente_activa
+            ON tarifario_estandar (CLIENTE, TRANSPORTISTA)
+            WHERE ACTIVA = 1
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS ix_tarifario_ciudades_activa
+            ON tarifario_estandar (CIUDAD_ORIGEN, CIUDAD_DESTINO)
+            WHERE ACTIVA = 1
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS ix_tarifario_destino_activa
+            ON tarifario_estandar (CIUDAD_DESTINO)
+            WHERE ACTIVA = 1
+            """,
+        ],
+    ),
+    (
+        2,
+        "Bitácora de cambios (UPDATE/DELETE) de tarifario_estandar para refrescos incrementales",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS tarifario_cambios (
+                SEQ INTEGER PRIMARY KEY AUTOINCREMENT,
+                ID_FILA INTEGER NOT NULL
+            )
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_tarifario_cambios_update
+            AFTER UPDATE ON tarifario_estandar
+            BEGIN
+                INSERT INTO tarifario_cambios (ID_FILA) VALUES (NEW.id);
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_tarifario_cambios_delete
+            AFTER DELETE ON tarifario_estandar
+            BEGIN
+                INSERT INTO tarifario_cambios (ID_FILA) VALUES (OLD.id);
+            END
+            """,
+        ],
+    ),
+    (
+        3,
+        "Contador de versión por tabla de catálogo (token de caché)",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS control_cambios (
+                TABLA TEXT PRIMARY KEY,
+                VERSION INTEGER NOT NULL DEFAULT 0
+            )
+            """,
+            lambda conn: _crear_triggers_control(conn, TABLAS_CATALOGO),
+        ],
+    ),
+    (
+        4,
+        "LANE_KEY (hash del carril normalizado) + tarifa_vigente por carril + índice único de la versión activa por carril",
+        [
+            _agregar_lane_key,
+            """
+            CREATE INDEX IF NOT EXISTS ix_tarifario_lane_key
+            ON tarifario_estandar (LANE_KEY)
+            """,
+            _crear_tarifa_vigente,
+            # Si hay carriles con dos activas no se desactiva nada: el índice queda pendiente
+            asegurar_unica_activa,
+        ],
+    ),
+    (
+        5,
+        "IDs de país/estado/ciudad resueltos contra catálogos + índices de ruta sobre enteros",
+        [
+            completar_ids_geografia,
+            # La ruta se filtra por ID_CIUDAD_*; el duplicado ya va por LANE_KEY
+            "DROP INDEX IF EXISTS ix_tarifario_ruta_activa",
+            "DROP INDEX IF EXISTS ix_tarifario_ciudades_activa",
+            "DROP INDEX IF EXISTS ix_tarifario_destino_activa",
+            """
+            CREATE INDEX IF NOT EXISTS ix_tarifario_ruta_ids_activa
+            ON tarifario_estandar (ID_CIUDAD_ORIGEN, ID_CIUDAD_DESTINO)
+            WHERE ACTIVA = 1
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS ix_tarifario_destino_id_activa
+            ON tarifario_estandar (ID_CIUDAD_DESTINO)
+            WHERE ACTIVA = 1
+            """,
+        ],
+    ),
+    (
+        6,
+        "Índice UNIQUE en CAT_TIPO_UNIDAD para altas masivas con ON CONFLICT DO NOTHING",
+        [
+            """
+            DELETE FROM CAT_TIPO_UNIDAD
+            WHERE TIPO_UNIDAD IS NOT NULL
+              AND rowid NOT IN (SELECT MIN(rowid) FROM CAT_TIPO_UNIDAD GROUP BY TIPO_UNIDAD)
+            """,
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS ux_tipo_unidad
+            ON CAT_TIPO_UNIDAD (TIPO_UNIDAD)
+            """,
+        ],
+    ),
+    (
+        7,
+        "Una sola fila por (ID_TARIFA, VERSION): dos versionados concurrentes no pueden chocar",
+        [
+            _renumerar_versiones_repetidas,
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS ux_tarifario_id_version
+            ON tarifario_estandar (ID_TARIFA, VERSION)
+            """,
+            # El UNIQUE cubre las mismas búsquedas
+            "DROP INDEX IF EXISTS ix_tarifario_id_version",
+        ],
+    ),
+    (
+        8,
+        "Fechas normalizadas + vigencia [VIGENTE_DESDE, VIGENTE_HASTA) por versión para consultas a una fecha",
+        [
+            _interpretar_fechas,
+            _agregar_vigencias,
+            _crear_triggers_vigencia,
+            """
+            CREATE INDEX IF NOT EXISTS ix_tarifario_carril_vigencia
+            ON tarifario_estandar (LANE_KEY, VIGENTE_DESDE)
+            """,
+            # El nuevo índice empieza por LANE_KEY: cubre las mismas búsquedas
+            "DROP INDEX IF EXISTS ix_tarifario_lane_key",
+        ],
+    ),
+    (
+        9,
+        "Archivo de versiones viejas: tarifario_historial + vista tarifario_con_historial",
+        [
+            sincronizar_historial,
+            lambda conn: _crear_triggers_control(conn, (TABLA_HISTORIAL,)),
+        ],
+    ),
+]
+
+_aplicadas_en: set = set()
+_lock = threading.Lock()
+
+
+def _aplicar_pendientes(conn) -> list[int]:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            VERSION INTEGER PRIMARY KEY,
+            DESCRIPCION TEXT NOT NULL,
+            APLICADA_EN TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+        """
+    )
+    hechas = {r[0] for r in conn.execute("SELECT VERSION FROM schema_migrations")}
+
+    aplicadas = []
+    for version, descripcion, pasos in MIGRACIONES:
+        if version in hechas:
+            continue
+        for paso in pasos:
+            if callable(paso):
+                paso(conn)
+            else:
+                conn.execute(paso)
+        conn.execute(
+            "INSERT INTO schema_migrations (VERSION, DESCRIPCION) VALUES (?, ?)",
+            (version, descripcion),
+        )
+        aplicadas.append(version)
+    return aplicadas
+
+
+def aplicar_migraciones() -> list[int]:
+    """
+    Aplica las migraciones pendientes (una vez por proceso y por BD).
+    Todas corren en una sola transacción del hilo escritor.
+    """
+    if db.DB_PATH in _aplicadas_en:
+        return []
+    with _lock:
+        if db.DB_PATH in _aplicadas_en:
+            return []
+
+        # Además de las migraciones: LANE_KEY e ids de geografía de filas que llegaron
+        # sin ellos (insertadas fuera de la app; las de la app ya traen ambos), y el
+        # índice único de activas si quedó pendiente por carriles duplicados
+        def trabajo(conn):
+            aplicadas = _aplicar_pendientes(conn)
+            if completar_lane_keys(conn):
+                completar_ids_geografia(conn)
+            duplicados = 0
+            if not conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'ux_tarifario_carril_activa'"
+            ).fetchone():
+                duplicados = asegurar_unica_activa(conn)
+            return aplicadas, duplicados
+
+        aplicadas, duplicados = db.ejecutar_escritura(trabajo, timeout=None)
+        if duplicados:
+            # Sin el índice, importaciones y escritores externos pueden dejar dos activas en un carril
+            log.warning(
+                "%s: %d carriles con más de una tarifa activa; ux_tarifario_carril_activa sigue "
+                "pendiente (Catálogos > Diagnóstico)",
+                db.DB_PATH, duplicados,
+            )
+        _aplicadas_en.add(db.DB_PATH)
+        return aplicadas
+
+
+_SCAN_SIN_INDICE = re.compile(r"^SCAN tarifario_(estandar|historial)(?! USING)")
+
+
+def verificar_planes() -> list[dict]:
+    """
+    EXPLAIN QUERY PLAN de cada consulta crítica.
+    usa_indice = False si alguna parte recorre tarifario_estandar (o el historial) sin índice.
+    """
+    resultado = []
+    with db.conexion_lectura() as conn:
+        for nombre, (sql, params) in CONSULTAS_CRITICAS.items():
+            plan = [r[3] for r in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+            resultado.append({
+                "consulta": nombre,
+                "usa_indice": not any(_SCAN_SIN_INDICE.match(p) for p in plan),
+                "plan": " | ".join(plan),
+            })
+    return resultado
@@ -1,5 +1,267 @@
-SQL_TARIFARIO_BASE = """
+TABLAS_CATALOGO = (
+    "CAT_CLIENTES",
+    "CAT_TRANSPORTISTAS",
+    "CAT_TIPO_OPERACION",
+    "CAT_TIPO_VIAJE",
+    "CAT_TIPO_UNIDAD",
+    "CAT_PAISES",
+    "CAT_ESTADOS_NEW",
+    "CAT_CIUDADES",
+)
+
+# Marcas O(1) de cambio de tarifario_estandar: último id insertado y último SEQ de la bitácora
+SQL_MARCAS_TARIFARIO = """
+SELECT
+    (SELECT COALESCE(MAX(id), 0) FROM tarifario_estandar),
+    (SELECT COALESCE(MAX(SEQ), 0) FROM tarifario_cambios)
+"""
+
+# Primer SEQ que queda en la bitácora: si un lector va detrás, la poda se llevó cambios que no leyó
+SQL_PRIMER_SEQ_CAMBIOS = """
+SELECT MIN(SEQ) FROM tarifario_cambios
+"""
+
+# Poda de la bitácora hasta un SEQ ya leído por todos; la última fila se queda
+# (MAX(SEQ) es la marca de cambio de SQL_MARCAS_TARIFARIO y no debe retroceder)
+SQL_PODAR_CAMBIOS = """
+DELETE FROM tarifario_cambios
+WHERE SEQ <= ? AND SEQ < (SELECT MAX(SEQ) FROM tarifario_cambios)
+"""
+
+# BLOQUE E.4 (captura) y versionado: la tarifa ACTIVA del carril, si hay (una búsqueda en el índice).
+# Mientras un carril tenga activas duplicadas (ver carriles_duplicados) gana la misma que en tarifa_vigente
+SQL_ACTIVA_CARRIL = """
+SELECT id, ID_TARIFA, VERSION
+FROM tarifario_estandar
+WHERE LANE_KEY = ? AND ACTIVA = 1
+ORDER BY ID_TARIFA DESC, VERSION DESC, id DESC
+"""
+
+# Fechas de texto que SQLite no entiende, leídas por la migración 8 (las originales no se tocan)
+TABLA_FECHAS = "fechas_interpretadas"
+
+# Diagnóstico: las que se leyeron con duda (día/mes intercambiables) o no se pudieron leer
+SQL_FECHAS_DUDOSAS = f"""
+SELECT COLUMNA, TEXTO, FECHA, ALTERNATIVA, FILAS
+FROM {TABLA_FECHAS}
+WHERE AMBIGUA = 1 OR FECHA IS NULL
+ORDER BY COLUMNA, TEXTO
+"""
+
+# Diagnóstico: carriles con más de una tarifa ACTIVA (impiden crear ux_tarifario_carril_activa)
+SQL_CARRILES_DUPLICADOS = """
+SELECT
+    LANE_KEY,
+    COUNT(*) AS ACTIVAS,
+    GROUP_CONCAT(CAST(ID_TARIFA AS INTEGER), ', ') AS ID_TARIFAS,
+    GROUP_CONCAT(id, ', ') AS IDS,
+    MIN(TRANSPORTISTA) AS TRANSPORTISTA,
+    MIN(CLIENTE) AS CLIENTE,
+    MIN(TIPO_DE_OPERACION) AS TIPO_DE_OPERACION,
+    MIN(TIPO_DE_VIAJE) AS TIPO_DE_VIAJE,
+    MIN(CIUDAD_ORIGEN) AS CIUDAD_ORIGEN,
+    MIN(CIUDAD_DESTINO) AS CIUDAD_DESTINO
+FROM tarifario_estandar
+WHERE ACTIVA = 1 AND LANE_KEY IS NOT NULL
+GROUP BY LANE_KEY
+HAVING COUNT(*) > 1
+"""
+
+# Vigencia de cada versión: [VIGENTE_DESDE, VIGENTE_HASTA) como texto en FORMATO_FECHA
+# (el orden de texto es el orden de tiempo); la versión activa queda abierta hasta FECHA_ABIERTA
+FORMATO_FECHA = "%Y-%m-%d %H:%M:%S"
+FECHA_INICIAL = "0001-01-01 00:00:00"
+FECHA_ABIERTA = "9999-12-31 23:59:59"
+
+# Antes de insertar una versión: las activas del carril dejan de serlo (lo exige ux_tarifario_carril_activa)
+# y su vigencia termina en la fecha del cambio. Parámetros: (fecha, LANE_KEY)
+SQL_DESACTIVAR_CARRIL = """
+UPDATE tarifario_estandar SET ACTIVA = 0, VIGENTE_HASTA = ? WHERE LANE_KEY = ? AND ACTIVA = 1
+"""
+
+# Columnas que definen un carril de captura: LANE_KEY = services.clave_carril() de estas columnas
+COLUMNAS_CARRIL_TARIFA = (
+    "TRANSPORTISTA",
+    "CLIENTE",
+    "TIPO_UNIDAD",
+    "TIPO_DE_OPERACION",
+    "TIPO_DE_VIAJE",
+    "PAIS_ORIGEN",
+    "ESTADO_ORIGEN",
+    "CIUDAD_ORIGEN",
+    "PAIS_DESTINO",
+    "ESTADO_DESTINO",
+    "CIUDAD_DESTINO",
+)
+
+# BLOQUE 0 (captura): fila activa vigente por carril (LANE_KEY), mantenida por triggers
+# (migración 4); evita agrupar todo el historial por las columnas del carril.
+SQL_VIGENTE_POR_CARRIL = """
+SELECT ID_FILA FROM tarifa_vigente
+"""
+
+# BLOQUE 5.5 (app): historial de versiones de una tarifa. Los historiales leen
+# tarifario_con_historial: la tabla caliente + las versiones archivadas (core.archive)
+SQL_HISTORIAL_TARIFA = """
+SELECT
+    VERSION,
+    PRECIO_VIAJE_SENCILLO,
+    ALL_IN,
+    ACTIVA,
+    FECHA_CAMBIO,
+    VIGENTE_DESDE,
+    VIGENTE_HASTA,
+    USUARIO_CAMBIO,
+    MOTIVO_CAMBIO
+FROM tarifario_con_historial
+WHERE ID_TARIFA = ?
+ORDER BY VERSION DESC
+"""
+
+SQL_SIGUIENTE_VERSION = """
+SELECT COALESCE(MAX(VERSION), 0) + 1 FROM tarifario_estandar WHERE ID_TARIFA = ?
+"""
+
+# Versionado (services.crear_nueva_version): versión base de una tarifa, la activa si hay
+SQL_BASE_TARIFA = """
 SELECT * FROM tarifario_estandar
+WHERE ID_TARIFA = ?
+ORDER BY ACTIVA DESC, VERSION DESC, id DESC
+LIMIT 1
+"""
+
+SQL_SIGUIENTE_ID_TARIFA = """
+SELECT COALESCE(MAX(ID_TARIFA), 0) + 1 FROM tarifario_estandar
+"""
+
+# Parámetros: (fecha, ID_TARIFA)
+SQL_DESACTIVAR_TARIFA = """
+UPDATE tarifario_estandar SET ACTIVA = 0, VIGENTE_HASTA = ? WHERE ID_TARIFA = ? AND ACTIVA = 1
+"""
+
+# Consultas "a una fecha" (core.history): versión de un carril vigente en una fecha
+# y su historial, ambas por el índice (LANE_KEY, VIGENTE_DESDE)
+SQL_VERSION_A_FECHA = """
+SELECT * FROM tarifario_con_historial
+WHERE LANE_KEY = ? AND VIGENTE_DESDE <= ?
+ORDER BY VIGENTE_DESDE DESC, id DESC
+LIMIT 1
 """
 
+SQL_HISTORIAL_CARRIL = """
+SELECT
+    id,
+    ID_TARIFA,
+    VERSION,
+    ACTIVA,
+    VIGENTE_DESDE,
+    VIGENTE_HASTA,
+    PRECIO_VIAJE_SENCILLO,
+    PRECIO_VIAJE_REDONDO,
+    ALL_IN,
+    USUARIO_CAMBIO,
+    MOTIVO_CAMBIO
+FROM tarifario_con_historial
+WHERE LANE_KEY = ?
+ORDER BY VIGENTE_DESDE, id
+"""
+
+# Columnas que necesita la grilla de resultados, la edición (BLOQUE 5.5) y la exportación filtrada
+COLUMNAS_RESULTADO = [
+    "id",
+    "ID_TARIFA",
+    "VERSION",
+    "CLIENTE",
+    "TRANSPORTISTA",
+    "TIPO_DE_OPERACION",
+    "TIPO_DE_VIAJE",
+    "TIPO_UNIDAD",
+    "PAIS_ORIGEN",
+    "ESTADO_ORIGEN",
+    "CIUDAD_ORIGEN",
+    "PAIS_DESTINO",
+    "ESTADO_DESTINO",
+    "CIUDAD_DESTINO",
+    "PRECIO_VIAJE_SENCILLO",
+    "PRECIO_VIAJE_REDONDO",
+    "ALL_IN",
+]
+
+# Filtro del buscador -> columna de tarifario_estandar
+FILTROS_BUSQUEDA = {
+    "cliente": "CLIENTE",
+    "transportista": "TRANSPORTISTA",
+    "tipo_operacion": "TIPO_DE_OPERACION",
+    "tipo_viaje": "TIPO_DE_VIAJE",
+    "tipo_unidad": "TIPO_UNIDAD",
+    "pais_origen": "PAIS_ORIGEN",
+    "estado_origen": "ESTADO_ORIGEN",
+    "ciudad_origen": "CIUDAD_ORIGEN",
+    "pais_destino": "PAIS_DESTINO",
+    "estado_destino": "ESTADO_DESTINO",
+    "ciudad_destino": "CIUDAD_DESTINO",
+}
+
+# Valores que significan "no filtrar"
+SIN_FILTRO = (None, "", "Todos", "Todas")
+
+
+def construir_busqueda(
+    filtros: dict,
+    solo_activas: bool = True,
+    columnas: list[str] | None = None,
+) -> tuple[str, list]:
+    """
+    Convierte los filtros del buscador en un solo SELECT parametrizado.
+    "Todos" / "" no filtran. Devuelve (sql, params).
+    """
+    condiciones = []
+    params = []
+
+    if solo_activas:
+        condiciones.append("ACTIVA = 1")
+
+    for clave, valor in filtros.items():
+        if valor in SIN_FILTRO:
+            continue
+        condiciones.append(f"{FILTROS_BUSQUEDA[clave]} = ?")
+        params.append(valor)
+
+    where = " AND ".join(condiciones) if condiciones else "1=1"
+    sql = (
+        f"SELECT {', '.join(columnas or COLUMNAS_RESULTADO)} "
+        f"FROM tarifario_estandar WHERE {where} ORDER BY id"
+    )
+    return sql, params
+
 
+# Consultas calientes que deben resolverse con índice (ver core.migrations.verificar_planes)
+CONSULTAS_CRITICAS = {
+    "activa_carril": (SQL_ACTIVA_CARRIL, (0,)),
+    "vigente_por_carril": (
+        f"SELECT * FROM tarifario_estandar WHERE id IN ({SQL_VIGENTE_POR_CARRIL})",
+        (),
+    ),
+    "historial_tarifa": (SQL_HISTORIAL_TARIFA, (1,)),
+    "siguiente_version": (SQL_SIGUIENTE_VERSION, (1,)),
+    "base_tarifa": (SQL_BASE_TARIFA, (1,)),
+    "siguiente_id_tarifa": (SQL_SIGUIENTE_ID_TARIFA, ()),
+    "version_a_fecha": (SQL_VERSION_A_FECHA, (0, "2026-01-01 00:00:00")),
+    "historial_carril": (SQL_HISTORIAL_CARRIL, (0,)),
+    "cotizacion_cliente": (
+        "SELECT * FROM tarifario_estandar WHERE 1=1 AND CLIENTE=? AND ACTIVA = 1",
+        ("C",),
+    ),
+    "cotizacion_transportista": (
+        "SELECT * FROM tarifario_estandar WHERE 1=1 AND TRANSPORTISTA=? AND ACTIVA = 1",
+        ("T",),
+    ),
+    "cotizacion_ruta": (
+        "SELECT * FROM tarifario_estandar WHERE 1=1 AND ID_CIUDAD_ORIGEN IN (?) AND ID_CIUDAD_DESTINO IN (?) AND ACTIVA = 1",
+        (1, 2),
+    ),
+    "cotizacion_destino": (
+        "SELECT * FROM tarifario_estandar WHERE 1=1 AND ID_CIUDAD_DESTINO IN (?, ?) AND ACTIVA = 1",
+        (1, 2),
+    ),
+}
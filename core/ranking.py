@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+from core.services import (
+    OPERACIONES_PRECIO_SENCILLO,
+    TABLA_TARIFARIO,
+    cache_por_version,
+    cargar_bd_completa,
+)
+
+# Un carril = mismo servicio para el mismo cliente; compiten los transportistas
+COLUMNAS_CARRIL = (
+    "CLIENTE",
+    "TIPO_DE_OPERACION",
+    "TIPO_DE_VIAJE",
+    "TIPO_UNIDAD",
+    "PAIS_ORIGEN",
+    "ESTADO_ORIGEN",
+    "CIUDAD_ORIGEN",
+    "PAIS_DESTINO",
+    "ESTADO_DESTINO",
+    "CIUDAD_DESTINO",
+)
+
+
+def _numerico(serie: pd.Series) -> np.ndarray:
+    return pd.to_numeric(serie, errors="coerce").to_numpy(dtype=float)
+
+
+def _en_valores(serie: pd.Series, valores) -> np.ndarray:
+    """serie.str.strip().str.upper().isin(valores) normalizando solo los valores distintos."""
+    codigos, distintos = pd.factorize(serie)
+    dentro = pd.Series(distintos, dtype="string").str.strip().str.upper().isin(valores).to_numpy(dtype=bool)
+    # NULL (código -1) cae en el último lugar: no está en valores
+    return np.append(dentro, False)[codigos]
+
+
+def precio_usado(df: pd.DataFrame) -> np.ndarray:
+    """
+    obtener_columna_precio() fila por fila, vectorizado:
+    Exportación / Importación -> SENCILLO; REDONDO -> REDONDO; resto -> SENCILLO.
+    """
+    usa_redondo = ~_en_valores(df["TIPO_DE_OPERACION"], OPERACIONES_PRECIO_SENCILLO) & _en_valores(
+        df["TIPO_DE_VIAJE"], ("REDONDO",)
+    )
+    return np.where(
+        usa_redondo,
+        _numerico(df["PRECIO_VIAJE_REDONDO"]),
+        _numerico(df["PRECIO_VIAJE_SENCILLO"]),
+    )
+
+
+def calcular_margenes(df: pd.DataFrame, col_precio: str | None = None) -> pd.DataFrame:
+    """
+    Filas válidas (precio > 0 y ALL_IN > 0) con PRECIO_USADO, PROFIT y MARGEN.
+    col_precio fija la columna para todas las filas (como en el buscador);
+    sin ella se aplica la regla de cada fila.
+    """
+    precio = precio_usado(df) if col_precio is None else _numerico(df[col_precio])
+    all_in = _numerico(df["ALL_IN"])
+    valida = (precio > 0) & (all_in > 0)
+
+    precio, all_in = precio[valida], all_in[valida]
+    profit = precio - all_in
+    return df.loc[valida].assign(
+        ALL_IN=all_in,
+        PRECIO_USADO=precio,
+        PROFIT=profit,
+        MARGEN=profit / precio,
+    )
+
+
+def top_k_por_carril(df: pd.DataFrame, k: int = 3, col_precio: str | None = None) -> pd.DataFrame:
+    """
+    Los k transportistas más baratos (menor ALL_IN) de cada carril, con RANGO 1..k.
+    Sin ordenar el libro: k pasadas de mínimo por grupo, O(k·n).
+    """
+    validas = calcular_margenes(df, col_precio)
+    if validas.empty:
+        return validas.assign(RANGO=pd.Series(dtype="int64"))
+
+    codigos = validas.groupby(list(COLUMNAS_CARRIL), dropna=False, sort=False).ngroup().to_numpy()
+    costo = validas["ALL_IN"].to_numpy(dtype=float).copy()
+    posiciones, rangos = [], []
+
+    for rango in range(1, k + 1):
+        minimo = pd.Series(costo).groupby(codigos).transform("min").to_numpy()
+        candidatas = np.flatnonzero((costo == minimo) & np.isfinite(costo))
+        if candidatas.size == 0:
+            break
+        # Empates: la primera fila del carril gana, una por carril por pasada
+        _, primeras = np.unique(codigos[candidatas], return_index=True)
+        elegidas = candidatas[primeras]
+        posiciones.append(elegidas)
+        rangos.append(np.full(elegidas.size, rango))
+        costo[elegidas] = np.inf
+
+    posiciones = np.concatenate(posiciones)
+    rangos = np.concatenate(rangos)
+    orden = np.lexsort((rangos, codigos[posiciones]))  # solo sobre n_carriles·k filas
+    return validas.iloc[posiciones[orden]].assign(RANGO=rangos[orden]).reset_index(drop=True)
+
+
+def mejor_por_carril(df: pd.DataFrame, col_precio: str | None = None) -> pd.DataFrame:
+    return top_k_por_carril(df, k=1, col_precio=col_precio).drop(columns="RANGO")
+
+
+@cache_por_version(TABLA_TARIFARIO, max_entradas=4)
+def ranking_libro(k: int = 1) -> pd.DataFrame:
+    """Top-k por carril de todas las tarifas activas, en una llamada (compartido entre sesiones)."""
+    df = cargar_bd_completa()
+    return top_k_por_carril(df[df["ACTIVA"] == 1], k=k)
@@ -1,14 +1,532 @@
+import functools
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
 import pandas as pd
-from core.db import get_connection
-from core.queries import SQL_TARIFARIO_BASE
 
-def cargar_bd_completa():
-    conn = get_connection()
-    df = pd.read_sql(SQL_TARIFARIO_BASE, conn)
-    conn.close()
-    return df
+from core import db
+from core.db import conexion_lectura, ejecutar_escritura
+from core.queries import (
+    COLUMNAS_CARRIL_TARIFA,
+    FECHA_ABIERTA,
+    FORMATO_FECHA,
+    SQL_ACTIVA_CARRIL,
+    SQL_BASE_TARIFA,
+    SQL_DESACTIVAR_CARRIL,
+    SQL_DESACTIVAR_TARIFA,
+    SQL_MARCAS_TARIFARIO,
+    SQL_PODAR_CAMBIOS,
+    SQL_PRIMER_SEQ_CAMBIOS,
+    SQL_SIGUIENTE_ID_TARIFA,
+    SQL_SIGUIENTE_VERSION,
+)
+
+TABLA_TARIFARIO = "tarifario_estandar"
+
+
+# =====================================================
+# TOKEN DE VERSIÓN DE DATOS
+# =====================================================
+def token_datos(tablas) -> tuple:
+    """
+    Token barato (O(1)) que cambia cuando cambia cualquiera de las tablas:
+    - tarifario_estandar: (MAX(id), MAX(SEQ) de tarifario_cambios)
+    - catálogos: contador de control_cambios (lo suben los triggers)
+    Se lee en una sola transacción para que sea consistente.
+    """
+    with conexion_lectura() as conn:
+        conn.execute("BEGIN")
+        valores = []
+        for tabla in tablas:
+            if tabla == TABLA_TARIFARIO:
+                valores.append(tuple(conn.execute(SQL_MARCAS_TARIFARIO).fetchone()))
+            else:
+                fila = conn.execute(
+                    "SELECT VERSION FROM control_cambios WHERE TABLA = ?", (tabla,)
+                ).fetchone()
+                valores.append(fila[0] if fila else 0)
+        conn.rollback()
+    return (str(db.DB_PATH), *valores)
+
+
+def cache_por_version(*tablas, max_entradas: int | None = None):
+    """
+    Reemplazo de st.cache_data compartido entre sesiones: cada llamada
+    revalida con token_datos(tablas) y solo recarga si el token cambió.
+    Así un cambio hecho en cualquier página invalida la caché sola.
+    max_entradas acota cuántas combinaciones de argumentos se guardan (LRU).
+    """
+    def decorador(fn):
+        entradas = OrderedDict()  # (args, kwargs) -> (token, valor)
+        lock_entradas = threading.Lock()
+        lock_carga = threading.Lock()
+        contadores = {"hits": 0, "recargas": 0}
+
+        def vigente(clave, token):
+            with lock_entradas:
+                entrada = entradas.get(clave)
+                if entrada is None or entrada[0] != token:
+                    return None
+                entradas.move_to_end(clave)
+                contadores["hits"] += 1
+                return entrada
+
+        @functools.wraps(fn)
+        def envoltura(*args, **kwargs):
+            clave = (args, tuple(sorted(kwargs.items())))
+            token = token_datos(tablas)
+            entrada = vigente(clave, token)
+            if entrada is not None:
+                return entrada[1]
+
+            # Una sola recarga a la vez: las demás sesiones esperan y reusan
+            with lock_carga:
+                entrada = vigente(clave, token)
+                if entrada is not None:
+                    return entrada[1]
+                # El token se leyó ANTES de cargar: si hay escrituras en medio,
+                # la próxima llamada ve otro token y vuelve a cargar
+                valor = fn(*args, **kwargs)
+                with lock_entradas:
+                    entradas[clave] = (token, valor)
+                    entradas.move_to_end(clave)
+                    if max_entradas is not None:
+                        while len(entradas) > max_entradas:
+                            entradas.popitem(last=False)
+                    contadores["recargas"] += 1
+                return valor
+
+        def clear():
+            with lock_entradas:
+                entradas.clear()
+
+        envoltura.clear = clear
+        envoltura.stats = lambda: dict(contadores, entradas=len(entradas))
+        return envoltura
+
+    return decorador
+
+
+# =====================================================
+# DELTA POR MARCA DE AGUA
+# =====================================================
+# Tamaño de bloque para listas IN (...) en SQLite
+BLOQUE_IN = 900
+# Filas de tarifario_cambios ya leídas por todos los lectores antes de podar (un DELETE por tanda)
+PODA_MINIMA = 500
+
+
+class BitacoraPodada(Exception):
+    """El lector va detrás de la poda de tarifario_cambios (la hizo otro proceso): carga completa."""
+
+
+def leer_delta(conn, max_id: int, max_seq: int, columnas: str = "*", solo_activas: bool = False):
+    """
+    Lee solo lo que cambió desde (max_id, max_seq): filas con id nuevo y filas
+    registradas en tarifario_cambios. Debe llamarse dentro de una transacción
+    de lectura para que marcas y filas sean del mismo snapshot.
+    Devuelve (filas, ids_cambiados, nuevo_max_id, nuevo_max_seq); filas es None si no hubo cambios.
+    Lanza BitacoraPodada si ya se borraron cambios que este lector no ha leído.
+    """
+    nuevo_max_id, nuevo_max_seq = conn.execute(SQL_MARCAS_TARIFARIO).fetchone()
+    if (nuevo_max_id, nuevo_max_seq) == (max_id, max_seq):
+        return None, [], max_id, max_seq
+    primer_seq = conn.execute(SQL_PRIMER_SEQ_CAMBIOS).fetchone()[0]
+    if primer_seq is not None and primer_seq > max_seq + 1:
+        raise BitacoraPodada(f"tarifario_cambios empieza en SEQ {primer_seq}; el lector va en {max_seq}")
+
+    activas = "ACTIVA = 1 AND " if solo_activas else ""
+    cambiados = [
+        r[0] for r in conn.execute(
+            "SELECT DISTINCT ID_FILA FROM tarifario_cambios WHERE SEQ > ? AND SEQ <= ?",
+            (max_seq, nuevo_max_seq),
+        )
+    ]
+    partes = [
+        pd.read_sql(
+            f"SELECT {columnas} FROM tarifario_estandar WHERE {activas}id > ? AND id <= ?",
+            conn,
+            params=(max_id, nuevo_max_id),
+        )
+    ]
+    for i in range(0, len(cambiados), BLOQUE_IN):
+        bloque = cambiados[i:i + BLOQUE_IN]
+        partes.append(pd.read_sql(
+            f"SELECT {columnas} FROM tarifario_estandar "
+            f"WHERE {activas}id <= ? AND id IN ({', '.join('?' * len(bloque))})",
+            conn,
+            params=(nuevo_max_id, *bloque),
+        ))
+    filas = pd.concat(partes, ignore_index=True).drop_duplicates("id").sort_values("id", ignore_index=True)
+    return filas, cambiados, nuevo_max_id, nuevo_max_seq
+
+
+# =====================================================
+# PODA DE LA BITÁCORA
+# =====================================================
+# Lectores de tarifario_cambios del proceso (TarifarioIncremental, IndiceCarriles):
+# objetos con db_path y max_seq. Lo que todos ya leyeron se borra.
+_lectores_bitacora = weakref.WeakSet()
+_podada_hasta: dict = {}  # DB_PATH -> SEQ
+_lock_poda = threading.Lock()
+
+
+def registrar_lector(lector) -> None:
+    with _lock_poda:
+        _lectores_bitacora.add(lector)
+
+
+def olvidar_lector(lector) -> None:
+    with _lock_poda:
+        _lectores_bitacora.discard(lector)
+
+
+def podar_bitacora():
+    """
+    Encola el borrado de tarifario_cambios hasta el SEQ más viejo que leyeron los
+    lectores de esta BD, si ya son PODA_MINIMA filas o más. Un lector de otro proceso
+    que quede detrás lo detecta en leer_delta y hace carga completa.
+    Devuelve el Future del borrado (None si no tocaba).
+    """
+    with _lock_poda:
+        marcas = [l.max_seq for l in list(_lectores_bitacora) if l.db_path == db.DB_PATH]
+        hasta = min(marcas, default=0)
+        if hasta - _podada_hasta.get(db.DB_PATH, 0) < PODA_MINIMA:
+            return None
+        _podada_hasta[db.DB_PATH] = hasta
+    return db.enviar_escritura(lambda conn: conn.execute(SQL_PODAR_CAMBIOS, (hasta,)).rowcount)
+
+
+class TarifarioIncremental:
+    """
+    Copia en memoria de tarifario_estandar compartida por todas las sesiones.
+    La primera carga es completa; después solo se leen las filas nuevas
+    (id > marca) y las que cambiaron (bitácora tarifario_cambios).
+    Cada refresco arma un DataFrame nuevo: los que ya entregamos no se mutan.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.limpiar()
+
+    def limpiar(self) -> None:
+        olvidar_lector(self)
+        self.df = None
+        self.db_path = None
+        self.max_id = 0
+        self.max_seq = 0
+        self.cargas_completas = 0
+        self.refrescos = 0
+        self.filas_leidas = 0
+        self.ultimo_refresco = 0
+
+    def _carga_completa(self, conn) -> None:
+        self.max_id, self.max_seq = conn.execute(SQL_MARCAS_TARIFARIO).fetchone()
+        self.df = pd.read_sql(
+            "SELECT * FROM tarifario_estandar WHERE id <= ? ORDER BY id", conn, params=(self.max_id,)
+        )
+        self.db_path = db.DB_PATH
+        registrar_lector(self)
+        self.cargas_completas += 1
+        self.filas_leidas += len(self.df)
+        self.ultimo_refresco = len(self.df)
+
+    def _fusionar(self, filas: pd.DataFrame, cambiados) -> None:
+        # Las filas cambiadas que ya no vienen en "filas" fueron borradas
+        quitar = self.df["id"].isin(cambiados) | self.df["id"].isin(filas["id"])
+        base = self.df.loc[~quitar]
+        if len(filas):
+            filas = filas[self.df.columns]
+            # Un bloque todo NULL llega como object: se alinean tipos con la base
+            for columna, tipo in self.df.dtypes.items():
+                if filas[columna].dtype != tipo:
+                    try:
+                        filas[columna] = filas[columna].astype(tipo)
+                    except (TypeError, ValueError):
+                        pass
+            base = pd.concat([base, filas], ignore_index=True)
+        self.df = base.sort_values("id", ignore_index=True)
+
+    def obtener(self) -> pd.DataFrame:
+        with self._lock:
+            with conexion_lectura() as conn:
+                conn.execute("BEGIN")
+                try:
+                    if self.df is None or self.db_path != db.DB_PATH:
+                        self._carga_completa(conn)
+                    else:
+                        try:
+                            filas, cambiados, max_id, max_seq = leer_delta(conn, self.max_id, self.max_seq)
+                        except BitacoraPodada:
+                            self._carga_completa(conn)
+                            filas = None
+                        if filas is not None:
+                            self._fusionar(filas, cambiados)
+                            self.max_id, self.max_seq = max_id, max_seq
+                            self.refrescos += 1
+                            self.ultimo_refresco = len(filas)
+                            self.filas_leidas += len(filas)
+                finally:
+                    conn.rollback()
+            podar_bitacora()
+            return self.df
+
+    def stats(self) -> dict:
+        return {
+            "filas": 0 if self.df is None else len(self.df),
+            "max_id": self.max_id,
+            "max_seq": self.max_seq,
+            "cargas_completas": self.cargas_completas,
+            "refrescos": self.refrescos,
+            "filas_ultimo_refresco": self.ultimo_refresco,
+            "filas_leidas": self.filas_leidas,
+        }
+
+
+# =====================================================
+# CARGAS CACHEADAS
+# =====================================================
+_tarifario = TarifarioIncremental()
+
+
+def cargar_bd_completa() -> pd.DataFrame:
+    """
+    Carga TODA la BD (incremental tras la primera vez).
+    El filtrado por ACTIVA se hace en los bloques de negocio,
+    no aquí (evita romper vistas y reportes).
+    """
+    return _tarifario.obtener()
+
+
+cargar_bd_completa.clear = _tarifario.limpiar
+cargar_bd_completa.stats = _tarifario.stats
+
+
+# =====================================================
+# CLAVE DE CARRIL (LANE_KEY)
+# =====================================================
+def _normalizar_carril(valor) -> str:
+    if valor is None or (isinstance(valor, float) and valor != valor):  # NULL / NaN
+        return ""
+    return " ".join(str(valor).split()).upper()
+
+
+def clave_carril(valores) -> int:
+    """
+    LANE_KEY: entero de 64 bits (blake2b) de los valores del carril en el orden de
+    COLUMNAS_CARRIL_TARIFA, normalizados (sin espacios de más, mayúsculas, NULL = '').
+    """
+    texto = "\x1f".join(_normalizar_carril(v) for v in valores)
+    return int.from_bytes(hashlib.blake2b(texto.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+def clave_carril_fila(fila) -> int:
+    """clave_carril() de un dict / Series con las columnas del tarifario."""
+    return clave_carril(fila.get(c) for c in COLUMNAS_CARRIL_TARIFA)
+
+
+# =====================================================
+# VERSIONADO (NUEVA VERSIÓN ATÓMICA, CONCURRENCIA OPTIMISTA)
+# =====================================================
+# Las pone el versionado; todo lo demás se copia de la versión base
+COLUMNAS_VERSIONADO = (
+    "id", "ID_TARIFA", "VERSION", "ACTIVA", "FECHA_CAMBIO", "USUARIO_CAMBIO", "MOTIVO_CAMBIO", "LANE_KEY",
+    "VIGENTE_DESDE", "VIGENTE_HASTA",
+)
+
+# version_esperada por omisión: no comparar (None sí compara: "no había activa")
+SIN_VERIFICAR = object()
+
+
+@dataclass
+class ResultadoVersion:
+    """Versión escrita por crear_nueva_version(), o el conflicto que lo impidió (no se escribió nada)."""
+
+    id_tarifa: int | None = None
+    version: int | None = None
+    id_fila: int | None = None
+    conflicto: str | None = None
+    version_actual: int | None = None  # la activa que había al intentar escribir
+
+    @property
+    def ok(self) -> bool:
+        return self.conflicto is None
+
+
+def ahora() -> str:
+    """Fecha-hora local en FORMATO_FECHA (la de FECHA_CAMBIO y la vigencia)."""
+    return datetime.now().strftime(FORMATO_FECHA)
+
+
+def siguiente_id_tarifa(conn) -> int:
+    """ID_TARIFA para una tarifa nueva; llamar dentro de un trabajo de escritura."""
+    return int(conn.execute(SQL_SIGUIENTE_ID_TARIFA).fetchone()[0])
+
+
+def _entero(valor):
+    """VERSION / ID_TARIFA como int (ID_TARIFA es REAL en la tabla)."""
+    return None if valor is None else int(valor)
+
+
+def _mensaje_conflicto(quien: str, esperada, actual) -> str:
+    if actual is None:
+        detalle = f"{quien} ya no tiene versión activa"
+    elif esperada is None:
+        detalle = f"{quien} ya tiene una versión activa (v{actual}) que no existía al cargar la pantalla"
+    else:
+        detalle = f"{quien} cambió mientras la editabas: la activa es v{actual} y editaste v{esperada}"
+    # Las páginas recargan la versión actual y dicen qué hacer
+    return f"{detalle}."
+
+
+def nueva_version(
+    conn,
+    cambios: dict,
+    id_tarifa=None,
+    version_esperada=SIN_VERIFICAR,
+    reemplazar_carril: bool = False,
+    usuario: str | None = None,
+    motivo: str | None = None,
+) -> ResultadoVersion:
+    """
+    Cuerpo de crear_nueva_version() para un trabajo de escritura ya abierto
+    (el importador escribe muchas en un solo trabajo con la misma regla).
+    """
+    base = {}
+    if id_tarifa is not None:
+        cur = conn.execute(SQL_BASE_TARIFA, (id_tarifa,))
+        fila = cur.fetchone()
+        if fila is None:
+            return ResultadoVersion(
+                id_tarifa=_entero(id_tarifa), conflicto=f"La tarifa {_entero(id_tarifa)} no existe."
+            )
+        base = dict(zip((d[0] for d in cur.description), fila))
+        actual = _entero(base["VERSION"]) if base["ACTIVA"] == 1 else None
+        if version_esperada is not SIN_VERIFICAR and actual != version_esperada:
+            return ResultadoVersion(
+                id_tarifa=_entero(id_tarifa),
+                version_actual=actual,
+                conflicto=_mensaje_conflicto(f"La tarifa {_entero(id_tarifa)}", version_esperada, actual),
+            )
+
+    datos = {c: v for c, v in base.items() if c not in COLUMNAS_VERSIONADO}
+    datos.update(cambios)
+    lane_key = clave_carril_fila(datos)
+    activa = conn.execute(SQL_ACTIVA_CARRIL, (lane_key,)).fetchone()
+
+    if id_tarifa is None:
+        # Tarifa capturada como nueva: si el carril ya tiene activa, la reemplaza con su ID_TARIFA
+        actual = _entero(activa[2]) if activa else None
+        if version_esperada is not SIN_VERIFICAR and actual != version_esperada:
+            return ResultadoVersion(
+                id_tarifa=_entero(activa[1]) if activa else None,
+                version_actual=actual,
+                conflicto=_mensaje_conflicto("El carril", version_esperada, actual),
+            )
+        if activa and not reemplazar_carril:
+            return ResultadoVersion(
+                id_tarifa=_entero(activa[1]),
+                version_actual=actual,
+                conflicto=f"Ya existe una tarifa ACTIVA para este carril (ID {_entero(activa[1])}, v{actual}).",
+            )
+        id_tarifa = activa[1] if activa and activa[1] is not None else siguiente_id_tarifa(conn)
+    elif activa and activa[1] != id_tarifa and not reemplazar_carril:
+        # La edición movió la tarifa a un carril que ya tiene otra activa
+        return ResultadoVersion(
+            id_tarifa=_entero(id_tarifa),
+            version_actual=_entero(activa[2]),
+            conflicto=(
+                f"El carril nuevo ya tiene otra tarifa ACTIVA (ID {_entero(activa[1])}, v{_entero(activa[2])})."
+            ),
+        )
+
+    # La vigencia de la anterior termina justo donde empieza la nueva
+    fecha = ahora()
+    version = int(conn.execute(SQL_SIGUIENTE_VERSION, (id_tarifa,)).fetchone()[0])
+    conn.execute(SQL_DESACTIVAR_TARIFA, (fecha, id_tarifa))
+    conn.execute(SQL_DESACTIVAR_CARRIL, (fecha, lane_key))
+
+    datos.update(
+        ID_TARIFA=id_tarifa,
+        VERSION=version,
+        ACTIVA=1,
+        FECHA_CAMBIO=fecha,
+        VIGENTE_DESDE=fecha,
+        VIGENTE_HASTA=FECHA_ABIERTA,
+        USUARIO_CAMBIO=usuario,
+        MOTIVO_CAMBIO=motivo,
+        LANE_KEY=lane_key,
+    )
+    existentes = {r[1] for r in conn.execute(f"PRAGMA table_info({TABLA_TARIFARIO})")}
+    desconocidas = set(datos) - existentes
+    if desconocidas:
+        raise ValueError(f"Columnas que no existen en {TABLA_TARIFARIO}: {', '.join(sorted(desconocidas))}")
+
+    cur = conn.execute(
+        f"INSERT INTO {TABLA_TARIFARIO} ({', '.join(datos)}) VALUES ({', '.join('?' * len(datos))})",
+        list(datos.values()),
+    )
+    return ResultadoVersion(id_tarifa=_entero(id_tarifa), version=version, id_fila=cur.lastrowid)
+
+
+def crear_nueva_version(
+    cambios: dict,
+    id_tarifa=None,
+    version_esperada=SIN_VERIFICAR,
+    reemplazar_carril: bool = False,
+    usuario: str | None = None,
+    motivo: str | None = None,
+) -> ResultadoVersion:
+    """
+    Única forma de versionar una tarifa desde las pantallas.
+
+    - id_tarifa: la nueva versión copia la versión base (la activa) y aplica `cambios`.
+      Sin id_tarifa es una captura nueva: hereda el ID_TARIFA de la activa del carril
+      (si reemplazar_carril) o recibe MAX(ID_TARIFA) + 1.
+    - version_esperada: VERSION activa que vio el usuario (None = no había activa).
+      Si ya no coincide, no se escribe y se regresa el conflicto.
+
+    Leer, comparar, desactivar e insertar corre en un solo trabajo del hilo escritor
+    (BEGIN IMMEDIATE): nadie, ni otro proceso, escribe entre la lectura y el INSERT.
+    """
+    return ejecutar_escritura(
+        lambda conn: nueva_version(
+            conn, cambios, id_tarifa, version_esperada, reemplazar_carril, usuario, motivo
+        )
+    )
+
+
+# =====================================================
+# LÓGICA DE NEGOCIO
+# =====================================================
+# En el tarifario conviven "Exportación", "EXPORTACIÓN", "Importación "...
+OPERACIONES_PRECIO_SENCILLO = ("EXPORTACIÓN", "IMPORTACIÓN")
 
 
+def obtener_columna_precio(tipo_operacion: str, tipo_viaje: str) -> str:
+    if str(tipo_operacion).strip().upper() in OPERACIONES_PRECIO_SENCILLO:
+        return "PRECIO_VIAJE_SENCILLO"
+    if str(tipo_viaje).strip().upper() == "REDONDO":
+        return "PRECIO_VIAJE_REDONDO"
+    return "PRECIO_VIAJE_SENCILLO"
 
 
+def calcular_mejor_opcion(df: pd.DataFrame, col_precio: str) -> pd.Series | None:
+    """Fila válida con menor ALL_IN + PRECIO_USADO / PROFIT / MARGEN (argmin, sin ordenar ni copiar)."""
+    precio = pd.to_numeric(df[col_precio], errors="coerce").to_numpy(dtype=float)
+    all_in = pd.to_numeric(df["ALL_IN"], errors="coerce").to_numpy(dtype=float)
+    valida = (precio > 0) & (all_in > 0)  # NaN > 0 es False
+    if not valida.any():
+        return None
 
+    i = int(np.argmin(np.where(valida, all_in, np.inf)))
+    mejor = df.iloc[i].copy()
+    mejor["PRECIO_USADO"] = precio[i]
+    mejor["PROFIT"] = precio[i] - all_in[i]
+    mejor["MARGEN"] = mejor["PROFIT"] / precio[i]
+    return mejor
@@ -3,34 +3,60 @@
 # BLOQUE 1 - IMPORTS + CONFIG + BD (Cloud/Local)
 # =====================================================
 
-import sqlite3
-from pathlib import Path
-
 import pandas as pd
 import streamlit as st
 
+from core.archive import RETENCION_DIAS, TABLA_HISTORIAL, archivar
+from core.catalogs import obtener_catalogos, recargas as recargas_catalogos
+from core.db import (
+    DB_PATH,
+    ETIQUETAS_CUBETAS,
+    SQL_LENTA_MS,
+    conexion_lectura,
+    ejecutar_escritura,
+    escribir,
+    estadisticas_sql,
+    limpiar_estadisticas_sql,
+    pool_stats,
+    sentencias_lentas,
+)
+from core.geography import completar_ids_geografia, ids_sin_resolver, obtener_arbol
+from core.importer import CATALOGOS_PLANOS, GEOGRAFIA, importar_catalogo, importar_geografia
+from core.jobs import stats as stats_exports
+from core.migrations import aplicar_migraciones, asegurar_unica_activa, carriles_duplicados, verificar_planes
+from core.queries import SQL_FECHAS_DUDOSAS
+from core.services import cargar_bd_completa
+
 st.set_page_config(page_title="Catálogos", layout="wide")
 
 st.title("🛠️ Administración de catálogos")
 st.info("Aquí se administran clientes, transportistas y futuros catálogos.")
 
 # --- DB robusto (Cloud y local) ---
-REPO_ROOT = Path(__file__).resolve().parents[1]   # repo/
-DB_PATH = REPO_ROOT / "tarifario.db"             # repo/tarifario.db
-
 if not DB_PATH.exists():
     st.error(f"❌ No encuentro la BD en: {DB_PATH}")
     st.stop()
 
-conn = sqlite3.connect(str(DB_PATH), check_same_thread=False)
+aplicar_migraciones()
+catalogos = obtener_catalogos()
 
 def df_sql(query: str, params: tuple = ()) -> pd.DataFrame:
-    return pd.read_sql(query, conn, params=params)
+    with conexion_lectura() as conn:
+        return pd.read_sql(query, conn, params=params)
 
 def exec_sql(query: str, params: tuple = ()) -> None:
-    cur = conn.cursor()
-    cur.execute(query, params)
-    conn.commit()
+    escribir(query, params)
+
+def alta_geografia(query: str, params: tuple = ()) -> int:
+    """
+    INSERT de país / estado / ciudad y, en el mismo trabajo del escritor, los ids de
+    las tarifas que ya traían ese nombre (Cotización filtra la ruta por ID_*).
+    """
+    def trabajo(conn):
+        conn.execute(query, params)
+        return completar_ids_geografia(conn)
+
+    return ejecutar_escritura(trabajo)
 
 # (Opcional) Diagnóstico rápido
 with st.expander("🔎 Diagnóstico", expanded=False):
@@ -38,31 +64,15 @@ with st.expander("🔎 Diagnóstico", expanded=False):
     tablas = df_sql("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")
     st.dataframe(tablas, use_container_width=True)
 
-# Cierre seguro (al final del archivo ponlo también)
-# conn.close()
-
 
 # =====================================================
 # BLOQUE 1 - BD: path robusto (Cloud / Local)
 # =====================================================
-REPO_ROOT = Path(__file__).resolve().parents[1]          # repo/
-DB_PATH = REPO_ROOT / "tarifario.db"                    # repo/tarifario.db
-
 st.caption(f"DB: {DB_PATH}")
 if not DB_PATH.exists():
     st.error("❌ No encuentro tarifario.db dentro del repo.")
     st.stop()
 
-conn = sqlite3.connect(str(DB_PATH), check_same_thread=False)
-
-def df_sql(query: str, params: tuple = ()) -> pd.DataFrame:
-    return pd.read_sql(query, conn, params=params)
-
-def exec_sql(query: str, params: tuple = ()) -> None:
-    cur = conn.cursor()
-    cur.execute(query, params)
-    conn.commit()
-
 # =====================================================
 # BLOQUE 2 - DIAGNÓSTICO (para que NUNCA quede blanco)
 # =====================================================
@@ -70,6 +80,171 @@ with st.expander("🔎 Diagnóstico"):
     tablas = df_sql("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")
     st.write("Tablas detectadas:")
     st.dataframe(tablas, use_container_width=True)
+    st.write("Pool de conexiones:")
+    st.json(pool_stats())
+    st.write("Tarifario en memoria (refresco incremental):")
+    st.json(cargar_bd_completa.stats())
+    st.write("Recargas de catálogos (solo el catálogo modificado se recarga):")
+    st.json(recargas_catalogos)
+    st.write("Exportaciones en segundo plano (caché en disco):")
+    st.json(stats_exports())
+
+    # 🩺 Lo que recorre el tarifario (EXPLAIN de cada consulta, SUMs y GROUP BY sobre toda
+    # la tabla) solo corre si se pide: el expander cerrado también se ejecuta en cada rerun
+    if st.checkbox("🩺 Revisar BD (planes, ids de geografía, fechas, carriles duplicados)", key="ver_revision_bd"):
+        st.write("Planes de consultas críticas (EXPLAIN QUERY PLAN):")
+        st.dataframe(pd.DataFrame(verificar_planes()), use_container_width=True)
+        st.write("Tarifas con nombre de geografía sin id (no está en el catálogo):")
+        with conexion_lectura() as conn:
+            st.json(ids_sin_resolver(conn))
+        # Tras dar de alta el país / estado / ciudad que faltaba
+        if st.button("🌎 Resolver ids de geografía", key="btn_ids_geografia"):
+            llenados = ejecutar_escritura(completar_ids_geografia)
+            st.success(f"✅ {llenados} ids de geografía resueltos")
+        st.write("Fechas de texto leídas con duda (día/mes) o que no se pudieron leer (no se modifican):")
+        st.dataframe(df_sql(SQL_FECHAS_DUDOSAS), use_container_width=True)
+        st.write("Carriles con más de una tarifa ACTIVA (sin índice único hasta resolverlos):")
+        with conexion_lectura() as conn:
+            st.dataframe(carriles_duplicados(conn), use_container_width=True)
+        # Tras desactivar a mano las que sobran
+        if st.button("🔒 Crear índice único de activas", key="btn_unica_activa"):
+            pendientes = ejecutar_escritura(asegurar_unica_activa)
+            if pendientes:
+                st.warning(f"⚠️ {pendientes} carriles siguen con más de una tarifa activa")
+            else:
+                st.success("✅ Índice único de activas creado")
+
+# =====================================================
+# BLOQUE 2.1 - TIEMPOS DE SQL (TODAS LAS PÁGINAS)
+# =====================================================
+with st.expander("⏱️ Tiempos de SQL"):
+    if st.button("🧹 Reiniciar contadores", key="btn_limpiar_sql"):
+        limpiar_estadisticas_sql()
+
+    stats_sql = estadisticas_sql()
+    por_origen = pd.DataFrame(stats_sql["por_origen"])
+    por_sentencia = pd.DataFrame(stats_sql["por_sentencia"])
+    st.caption(
+        f"Desde {pd.Timestamp.fromtimestamp(stats_sql['desde']):%Y-%m-%d %H:%M:%S} · "
+        "tiempo = execute + lectura de filas; filas leídas iterando el cursor no se cuentan"
+    )
+
+    if por_sentencia.empty:
+        st.info("Todavía no hay sentencias medidas.")
+    else:
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Sentencias", f"{int(por_sentencia['llamadas'].sum()):,}")
+        c2.metric("Tiempo en SQL", f"{por_sentencia['ms_total'].sum() / 1000:,.2f} s")
+        c3.metric("Datos leídos (aprox.)", f"{por_sentencia['bytes'].sum() / 2**20:,.1f} MB")
+
+        st.write("Histograma de latencia (todas las sentencias):")
+        st.bar_chart(por_sentencia[ETIQUETAS_CUBETAS].sum().rename("sentencias"))
+
+        st.write("Por página · bloque (quién manda el SQL):")
+        st.dataframe(por_origen, use_container_width=True)
+        st.write("Por sentencia (las que más tiempo suman primero):")
+        st.dataframe(por_sentencia.head(100), use_container_width=True)
+
+    lentas = sentencias_lentas()
+    st.write(f"Sentencias lentas (≥ {SQL_LENTA_MS:,.0f} ms) con su EXPLAIN QUERY PLAN:")
+    if lentas:
+        st.dataframe(pd.DataFrame(lentas), use_container_width=True)
+    else:
+        st.caption("Ninguna por ahora.")
+
+# =====================================================
+# BLOQUE 2.5 - ARCHIVO DE VERSIONES VIEJAS
+# =====================================================
+with st.expander("🗄️ Archivo de versiones viejas"):
+    st.caption(
+        "Mueve a tarifario_historial las versiones inactivas que dejaron de valer antes de la "
+        "retención. Los historiales y el tarifario a una fecha siguen viéndolas."
+    )
+    conteos = df_sql(
+        f"""
+        SELECT
+            (SELECT COUNT(*) FROM tarifario_estandar) AS TABLA_CALIENTE,
+            (SELECT COUNT(*) FROM tarifario_estandar WHERE ACTIVA = 0) AS INACTIVAS,
+            (SELECT COUNT(*) FROM {TABLA_HISTORIAL}) AS ARCHIVADAS
+        """
+    )
+    st.dataframe(conteos, use_container_width=True, hide_index=True)
+    dias_retencion = st.number_input(
+        "Retención (días)", min_value=0, value=RETENCION_DIAS, step=30, key="dias_retencion"
+    )
+    if st.button("🗄️ Archivar versiones", key="btn_archivar"):
+        with st.spinner("Archivando..."):
+            st.session_state["resultado_archivo"] = archivar(int(dias_retencion))
+
+    resultado_archivo = st.session_state.get("resultado_archivo")
+    if resultado_archivo is not None:
+        st.success(
+            f"✅ {resultado_archivo.filas:,} versiones archivadas (vigentes hasta antes de "
+            f"{resultado_archivo.corte}) en {resultado_archivo.segundos:.2f} s"
+        )
+        a1, a2, a3 = st.columns(3)
+        a1.metric(
+            "Filas en la tabla caliente",
+            f"{resultado_archivo.filas_activa_despues:,}",
+            f"{resultado_archivo.filas_activa_despues - resultado_archivo.filas_activa_antes:,}",
+            delta_color="inverse",
+        )
+        if resultado_archivo.bytes_ahorrados is not None:
+            a2.metric(
+                "Tamaño (MB)",
+                f"{resultado_archivo.bytes_activa_despues / 2**20:,.1f}",
+                f"{-resultado_archivo.bytes_ahorrados / 2**20:,.1f}",
+                delta_color="inverse",
+            )
+        a3.metric(
+            "SELECT * completo (ms)",
+            f"{resultado_archivo.scan_ms_despues:,.0f}",
+            f"{resultado_archivo.scan_ms_despues - resultado_archivo.scan_ms_antes:,.0f}",
+            delta_color="inverse",
+        )
+
+# =====================================================
+# BLOQUE 3 - CARGA MASIVA DE CATÁLOGOS (EXCEL / CSV)
+# =====================================================
+with st.expander("📥 Carga masiva de catálogos (Excel / CSV)"):
+    st.caption(
+        "Un archivo por catálogo con la columna del catálogo (CLIENTE, TRANSPORTISTA, ...) "
+        "o, para geografía, columnas PAIS, ESTADO, CIUDAD. Lo que ya existe se ignora; "
+        "todo se guarda en una sola transacción."
+    )
+    catalogo_carga = st.selectbox(
+        "Catálogo", list(CATALOGOS_PLANOS) + [GEOGRAFIA], key="catalogo_carga"
+    )
+    archivo_carga = st.file_uploader("Archivo", type=["xlsx", "csv"], key="archivo_carga")
+
+    if archivo_carga is not None and st.button("📥 Cargar catálogo", key="btn_carga_catalogo"):
+        try:
+            if catalogo_carga == GEOGRAFIA:
+                resultado_carga = importar_geografia(archivo_carga, archivo_carga.name)
+            else:
+                resultado_carga = importar_catalogo(archivo_carga, archivo_carga.name, catalogo_carga)
+            st.session_state["resultado_carga"] = resultado_carga
+            st.rerun()  # una sola recarga para todo el archivo
+        except ValueError as e:
+            st.error(f"❌ {e}")
+
+    resultado_carga = st.session_state.get("resultado_carga")
+    if resultado_carga is not None:
+        st.success(
+            f"✅ {sum(resultado_carga.nuevos.values()):,} registros nuevos · "
+            f"{resultado_carga.existentes:,} ya existían · "
+            f"{resultado_carga.filas_leidas:,} filas en {resultado_carga.segundos:.2f} s"
+        )
+        st.json(resultado_carga.nuevos)
+        if resultado_carga.ids_tarifario:
+            st.info(f"🌎 {resultado_carga.ids_tarifario:,} ids de geografía resueltos en tarifas existentes.")
+        if resultado_carga.rechazadas:
+            st.warning("Filas ignoradas:")
+            st.dataframe(
+                pd.DataFrame(resultado_carga.rechazadas, columns=["FILA", "MOTIVO"]),
+                use_container_width=True,
+                hide_index=True,
+            )
 
 ## =====================================================
 # 👤 CLIENTES
@@ -106,13 +281,7 @@ with c2:
                 st.rerun()
 
 # --- Tabla de clientes ---
-df_clientes = df_sql(
-    """
-    SELECT CLIENTE, ACTIVO
-    FROM CAT_CLIENTES
-    ORDER BY CLIENTE
-    """
-)
+df_clientes = catalogos["CAT_CLIENTES"].a_dataframe()
 st.dataframe(df_clientes, use_container_width=True)
 
 # =====================================================
@@ -120,16 +289,14 @@ st.dataframe(df_clientes, use_container_width=True)
 # =====================================================
 st.subheader("🗑️ Desactivar cliente (confirmación)")
 
-df_activos = df_sql(
-    "SELECT CLIENTE FROM CAT_CLIENTES WHERE ACTIVO = 1 ORDER BY CLIENTE"
-)
+clientes_activos = list(catalogos["CAT_CLIENTES"].lista())
 
-if df_activos.empty:
+if not clientes_activos:
     st.info("No hay clientes activos para desactivar.")
 else:
     cliente_desactivar = st.selectbox(
         "Selecciona cliente a desactivar",
-        df_activos["CLIENTE"].tolist(),
+        clientes_activos,
         key="cat_cliente_desactivar"
     )
 
@@ -168,16 +335,14 @@ else:
 # =====================================================
 st.subheader("♻️ Reactivar cliente")
 
-df_inactivos = df_sql(
-    "SELECT CLIENTE FROM CAT_CLIENTES WHERE ACTIVO = 0 ORDER BY CLIENTE"
-)
+clientes_inactivos = list(catalogos["CAT_CLIENTES"].nombres_inactivos)
 
-if df_inactivos.empty:
+if not clientes_inactivos:
     st.info("No hay clientes inactivos.")
 else:
     cliente_reactivar = st.selectbox(
         "Selecciona cliente a reactivar",
-        df_inactivos["CLIENTE"].tolist(),
+        clientes_inactivos,
         key="cat_cliente_reactivar"
     )
 
@@ -225,13 +390,7 @@ with c2:
                 st.rerun()
 
 # --- Tabla (activos e inactivos) ---
-df_transportistas = df_sql(
-    """
-    SELECT TRANSPORTISTA, ACTIVO
-    FROM CAT_TRANSPORTISTAS
-    ORDER BY TRANSPORTISTA
-    """
-)
+df_transportistas = catalogos["CAT_TRANSPORTISTAS"].a_dataframe()
 st.dataframe(df_transportistas, use_container_width=True)
 
 # =====================================================
@@ -239,16 +398,14 @@ st.dataframe(df_transportistas, use_container_width=True)
 # =====================================================
 st.subheader("🚫 Desactivar transportista")
 
-df_trp_activos = df_sql(
-    "SELECT TRANSPORTISTA FROM CAT_TRANSPORTISTAS WHERE ACTIVO = 1 ORDER BY TRANSPORTISTA"
-)
+trp_activos = list(catalogos["CAT_TRANSPORTISTAS"].lista())
 
-if df_trp_activos.empty:
+if not trp_activos:
     st.info("No hay transportistas activos.")
 else:
     transportista_off = st.selectbox(
         "Selecciona transportista a desactivar",
-        df_trp_activos["TRANSPORTISTA"].tolist(),
+        trp_activos,
         key="cat_transportista_off"
     )
 
@@ -273,16 +430,14 @@ else:
 # =====================================================
 st.subheader("♻️ Reactivar transportista")
 
-df_trp_inactivos = df_sql(
-    "SELECT TRANSPORTISTA FROM CAT_TRANSPORTISTAS WHERE ACTIVO = 0 ORDER BY TRANSPORTISTA"
-)
+trp_inactivos = list(catalogos["CAT_TRANSPORTISTAS"].nombres_inactivos)
 
-if df_trp_inactivos.empty:
+if not trp_inactivos:
     st.info("No hay transportistas inactivos.")
 else:
     transportista_on = st.selectbox(
         "Selecciona transportista a reactivar",
-        df_trp_inactivos["TRANSPORTISTA"].tolist(),
+        trp_inactivos,
         key="cat_transportista_on"
     )
 
@@ -335,9 +490,7 @@ with c2:
                 st.success("✅ Tipo de operación agregado correctamente.")
                 st.rerun()
 
-df_tipo_operacion = df_sql(
-    "SELECT TIPO_OPERACION FROM CAT_TIPO_OPERACION ORDER BY TIPO_OPERACION"
-)
+df_tipo_operacion = catalogos["CAT_TIPO_OPERACION"].a_dataframe()
 st.dataframe(df_tipo_operacion, use_container_width=True)
 # =====================================================
 # 🚚 TIPO DE VIAJE
@@ -372,7 +525,7 @@ with c2:
                 st.success("✅ Tipo de viaje agregado correctamente.")
                 st.rerun()
 
-df_tipo_viaje = df_sql("SELECT TIPO_VIAJE FROM CAT_TIPO_VIAJE ORDER BY TIPO_VIAJE")
+df_tipo_viaje = catalogos["CAT_TIPO_VIAJE"].a_dataframe()
 st.dataframe(df_tipo_viaje, use_container_width=True)
 
 # =====================================================
@@ -396,20 +549,18 @@ if st.button("➕ Agregar país", key="btn_add_pais"):
     if not pais:
         st.warning("Escribe un país.")
     else:
-        existe = pd.read_sql(
+        existe = df_sql(
             "SELECT 1 FROM CAT_PAISES WHERE PAIS = ? LIMIT 1",
-            conn,
-            params=(pais,)
+            (pais,)
         )
 
         if not existe.empty:
             st.warning("⚠️ El país ya existe.")
         else:
-            conn.execute(
+            alta_geografia(
                 "INSERT INTO CAT_PAISES (PAIS, ACTIVO) VALUES (?, 1)",
                 (pais,)
             )
-            conn.commit()
             st.success("✅ País agregado.")
             st.rerun()
 # -----------------
@@ -417,17 +568,14 @@ if st.button("➕ Agregar país", key="btn_add_pais"):
 # -----------------
 st.markdown("### 🗺️ Nuevo estado")
 
-df_paises_all = pd.read_sql(
-    "SELECT ID_PAIS, PAIS FROM CAT_PAISES WHERE ACTIVO = 1 ORDER BY PAIS",
-    conn
-)
+cat_paises = catalogos["CAT_PAISES"]
 
-if df_paises_all.empty:
+if not cat_paises.nombres_activos:
     st.warning("⚠️ No hay países activos. Primero agrega un país.")
 else:
     pais_estado = st.selectbox(
         "País del estado",
-        df_paises_all["PAIS"].tolist(),
+        list(cat_paises.lista()),
         key="pais_estado"
     )
 
@@ -439,33 +587,31 @@ else:
 
     if st.button("➕ Agregar estado", key="btn_add_estado"):
         estado = (nuevo_estado or "").strip().upper()
-        id_pais = int(df_paises_all.loc[df_paises_all["PAIS"] == pais_estado, "ID_PAIS"].iloc[0])
+        id_pais = cat_paises.id_de(pais_estado)
 
         if not estado:
             st.warning("Escribe un estado.")
         else:
-            existe = pd.read_sql(
+            existe = df_sql(
                 """
                 SELECT 1
                 FROM CAT_ESTADOS_NEW
                 WHERE ESTADO = ? AND ID_PAIS = ?
                 LIMIT 1
                 """,
-                conn,
-                params=(estado, id_pais)
+                (estado, id_pais)
             )
 
             if not existe.empty:
                 st.warning("⚠️ El estado ya existe para ese país.")
             else:
-                conn.execute(
+                alta_geografia(
                     """
                     INSERT INTO CAT_ESTADOS_NEW (ESTADO, ID_PAIS, ACTIVO)
                     VALUES (?, ?, 1)
                     """,
                     (estado, id_pais)
                 )
-                conn.commit()
                 st.success("✅ Estado agregado.")
                 st.rerun()
 # -----------------
@@ -473,15 +619,14 @@ else:
 # -----------------
 st.markdown("### 🏙️ Nueva ciudad")
 
-df_estados_all = pd.read_sql(
+df_estados_all = df_sql(
     """
     SELECT E.ID_ESTADO, E.ESTADO, P.PAIS
     FROM CAT_ESTADOS_NEW E
     JOIN CAT_PAISES P ON P.ID_PAIS = E.ID_PAIS
     WHERE E.ACTIVO = 1
     ORDER BY P.PAIS, E.ESTADO
-    """,
-    conn
+    """
 )
 
 if df_estados_all.empty:
@@ -508,28 +653,26 @@ else:
         if not ciudad:
             st.warning("Escribe una ciudad.")
         else:
-            existe = pd.read_sql(
+            existe = df_sql(
                 """
                 SELECT 1
                 FROM CAT_CIUDADES
                 WHERE CIUDAD = ? AND ID_ESTADO = ?
                 LIMIT 1
                 """,
-                conn,
-                params=(ciudad, id_estado)
+                (ciudad, id_estado)
             )
 
             if not existe.empty:
                 st.warning("⚠️ La ciudad ya existe para ese estado.")
             else:
-                conn.execute(
+                alta_geografia(
                     """
                     INSERT INTO CAT_CIUDADES (CIUDAD, ID_ESTADO, ACTIVO)
                     VALUES (?, ?, 1)
                     """,
                     (ciudad, id_estado)
                 )
-                conn.commit()
                 st.success("✅ Ciudad agregada.")
                 st.rerun()
 # ============================
@@ -539,77 +682,50 @@ st.divider()
 st.subheader("🌍 País / Estado / Ciudad (vista)")
 
 # 🌍 PAÍS
-df_paises = pd.read_sql(
-    """
-    SELECT ID_PAIS, PAIS
-    FROM CAT_PAISES
-    WHERE ACTIVO = 1
-    ORDER BY PAIS
-    """,
-    conn
-)
+arbol = obtener_arbol()
+paises_vista = arbol.paises.hijos()
 
-if df_paises.empty:
+if not paises_vista:
     st.error("❌ No hay países activos en el catálogo.")
     st.stop()
 
 pais_sel = st.selectbox(
     "🌍 País",
-    df_paises["PAIS"].tolist(),
+    list(paises_vista),
     key="pais_sel_norm"
 )
 
-id_pais = int(df_paises.loc[df_paises["PAIS"] == pais_sel, "ID_PAIS"].iloc[0])
+id_pais = arbol.paises.id_de(pais_sel)
 
 # 🗺️ ESTADO
-df_estados = pd.read_sql(
-    """
-    SELECT ID_ESTADO, ESTADO
-    FROM CAT_ESTADOS_NEW
-    WHERE ID_PAIS = ?
-      AND ACTIVO = 1
-    ORDER BY ESTADO
-    """,
-    conn,
-    params=(id_pais,)
-)
+estados_vista = arbol.estados.hijos(id_pais)
 
-if df_estados.empty:
+if not estados_vista:
     st.warning("⚠️ No hay estados registrados para este país.")
     id_estado = None
 else:
     estado_sel = st.selectbox(
         "🗺️ Estado",
-        df_estados["ESTADO"].tolist(),
+        list(estados_vista),
         key="estado_sel_norm"
     )
-    id_estado = int(df_estados.loc[df_estados["ESTADO"] == estado_sel, "ID_ESTADO"].iloc[0])
+    id_estado = arbol.estados.id_de(estado_sel, id_pais)
 
 # 🏙️ CIUDAD
 if id_estado is None:
     st.info("Selecciona un estado para ver ciudades.")
 else:
-    df_ciudades = pd.read_sql(
-        """
-        SELECT ID_CIUDAD, CIUDAD
-        FROM CAT_CIUDADES
-        WHERE ID_ESTADO = ?
-          AND ACTIVO = 1
-        ORDER BY CIUDAD
-        """,
-        conn,
-        params=(id_estado,)
-    )
+    ciudades_vista = arbol.ciudades.hijos(id_estado)
 
-    if df_ciudades.empty:
+    if not ciudades_vista:
         st.warning("⚠️ No hay ciudades registradas para este estado.")
     else:
         ciudad_sel = st.selectbox(
             "🏙️ Ciudad",
-            df_ciudades["CIUDAD"].tolist(),
+            list(ciudades_vista),
             key="ciudad_sel_norm"
         )
-        id_ciudad = int(df_ciudades.loc[df_ciudades["CIUDAD"] == ciudad_sel, "ID_CIUDAD"].iloc[0])
+        id_ciudad = arbol.ciudades.id_de(ciudad_sel, id_estado)
 
         # (Opcional) Mostrar IDs para debug / auditoría
         st.caption(f"IDs: país={id_pais} | estado={id_estado} | ciudad={id_ciudad}")
@@ -631,34 +747,24 @@ if st.button("➕ Agregar tipo de unidad", key="btn_add_unidad"):
     if not unidad:
         st.warning("Escribe un tipo de unidad.")
     else:
-        existe = pd.read_sql(
+        existe = df_sql(
             "SELECT 1 FROM CAT_TIPO_UNIDAD WHERE TIPO_UNIDAD = ? LIMIT 1",
-            conn,
-            params=(unidad,)
+            (unidad,)
         )
 
         if not existe.empty:
             st.warning("⚠️ El tipo de unidad ya existe.")
         else:
-            conn.execute(
+            exec_sql(
                 "INSERT INTO CAT_TIPO_UNIDAD (TIPO_UNIDAD) VALUES (?)",
                 (unidad,)
             )
-            conn.commit()
             st.success("✅ Tipo de unidad agregado.")
             st.rerun()
 
-df_unidades = pd.read_sql(
-    "SELECT TIPO_UNIDAD FROM CAT_TIPO_UNIDAD ORDER BY TIPO_UNIDAD",
-    conn
-)
+df_unidades = catalogos["CAT_TIPO_UNIDAD"].a_dataframe()
 st.dataframe(df_unidades, use_container_width=True)
 
-# Cierre seguro
-try:
-    conn.close()
-except Exception:
-    pass
 
 
 
@@ -1,15 +1,16 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
-from pathlib import Path
-from datetime import datetime
 
+from core.catalogs import obtener_catalogos
+from core.db import DB_PATH, conexion_lectura
+from core.geography import obtener_arbol
+from core.importer import importar, plantilla_csv, validar_archivo
+from core.migrations import aplicar_migraciones, falta_unica_activa
+from core.queries import SQL_ACTIVA_CARRIL, SQL_BASE_TARIFA, SQL_VIGENTE_POR_CARRIL
+from core.services import clave_carril, crear_nueva_version
 
-st.set_page_config(page_title="Captura de tarifas", layout="wide")
 
-DB_NAME = "tarifario.db"
-REPO_ROOT = Path(__file__).resolve().parents[1]
-DB_PATH = REPO_ROOT / DB_NAME
+st.set_page_config(page_title="Captura de tarifas", layout="wide")
 
 st.title("🟩 Captura de tarifas y costos")
 
@@ -21,12 +22,9 @@ if st.button("RESET ESTADO"):
 # =====================================================
 # HELPERS SQL (CORRECTO – SIN CACHE RO)
 # =====================================================
-def _connect():
-    return sqlite3.connect(str(DB_PATH), check_same_thread=False)
-
 def table_exists(table: str) -> bool:
     try:
-        with _connect() as conn:
+        with conexion_lectura() as conn:
             r = pd.read_sql(
                 "SELECT name FROM sqlite_master WHERE type='table' AND name=?",
                 conn,
@@ -38,7 +36,7 @@ def table_exists(table: str) -> bool:
 
 def get_columns(table: str) -> list[str]:
     try:
-        with _connect() as conn:
+        with conexion_lectura() as conn:
             info = pd.read_sql(f"PRAGMA table_info({table})", conn)
         return info["name"].tolist() if "name" in info.columns else []
     except Exception:
@@ -46,7 +44,7 @@ def get_columns(table: str) -> list[str]:
 
 def df_sql(query: str, params=()):
     try:
-        with _connect() as conn:
+        with conexion_lectura() as conn:
             return pd.read_sql(query, conn, params=params)
     except Exception as e:
         st.warning(f"⚠️ No se pudo leer SQL.\n{e}")
@@ -62,6 +60,16 @@ if not DB_PATH.exists():
     st.error(f"❌ No existe el archivo de BD: {DB_PATH}")
     st.stop()
 
+aplicar_migraciones()
+
+# 🔒 Sin ux_tarifario_carril_activa solo el hilo escritor de la app evita dos activas por carril
+if falta_unica_activa():
+    st.warning(
+        "⚠️ Hay carriles con más de una tarifa activa, así que la BD todavía no tiene el índice "
+        "único de activas: una importación o un programa externo podría dejar dos versiones "
+        "activas en un carril. Resuélvelos en Catálogos → 🔎 Diagnóstico."
+    )
+
 if not table_exists("tarifario_estandar"):
     st.warning("⚠️ No existe la tabla tarifario_estandar.")
     df_existentes = pd.DataFrame()
@@ -76,7 +84,8 @@ else:
         "PAIS_ORIGEN","ESTADO_ORIGEN","CIUDAD_ORIGEN",
         "PAIS_DESTINO","ESTADO_DESTINO","CIUDAD_DESTINO",
         "ALL_IN",
-        "ACTIVA"
+        "ACTIVA",
+        "VERSION"
     ]
 
     select_cols = [c for c in deseadas if c in cols]
@@ -93,27 +102,15 @@ else:
     where = "WHERE 1=1"
     params = []
 
-    # 👉 FIX CLAVE: ID_TARIFA ES FLOAT → CAST A INTEGER
+    # 👉 ID_TARIFA es REAL: 11.0 = 11 compara numérico y usa el índice (sin CAST)
     if buscar_id:
-        where += " AND CAST(ID_TARIFA AS INTEGER) = ?"
+        where += " AND ID_TARIFA = ?"
         params.append(int(buscar_id))
 
+    # 👉 Sin historial: solo la tarifa vigente de cada carril (tabla mantenida por triggers)
     elif not ver_historial:
-        where += """
-        AND ID_TARIFA IN (
-            SELECT MAX(ID_TARIFA)
-            FROM tarifario_estandar
-            GROUP BY
-                TRANSPORTISTA,
-                CLIENTE,
-                COALESCE(TIPO_UNIDAD,''),
-                PAIS_ORIGEN,
-                ESTADO_ORIGEN,
-                CIUDAD_ORIGEN,
-                PAIS_DESTINO,
-                ESTADO_DESTINO,
-                CIUDAD_DESTINO
-        )
+        where += f"""
+        AND id IN ({SQL_VIGENTE_POR_CARRIL})
         """
 
     sql = f"""
@@ -183,14 +180,21 @@ tarifa_id_sel = st.selectbox(
 # ---------------- CONTROL DE MODO ----------------
 if tarifa_id_sel == "NUEVA":
     st.session_state.pop("id_tarifa_editar", None)
+    st.session_state.pop("version_tarifa_editar", None)
+    st.session_state.pop("version_tarifa_recargada", None)
     st.session_state["tarifa_base_tmp"] = None
     st.session_state["tarifa_cargada"] = False
     st.info("🆕 Captura de tarifa nueva")
 else:
     fila = df_existentes[df_existentes["ID_TARIFA"].astype(int).astype(str) == tarifa_id_sel].iloc[0]
+    # 🔒 Versión que se empieza a editar, fija hasta guardar (None si la elegida ya no está activa).
+    # El formulario se carga una vez por tarifa elegida: los reruns no pisan lo capturado
+    if st.session_state.get("id_tarifa_editar") != int(fila["ID_TARIFA"]):
+        st.session_state["version_tarifa_editar"] = int(fila["VERSION"]) if fila["ACTIVA"] == 1 else None
+        st.session_state.pop("version_tarifa_recargada", None)
+        st.session_state["tarifa_base_tmp"] = fila
+        st.session_state["tarifa_cargada"] = False
     st.session_state["id_tarifa_editar"] = int(fila["ID_TARIFA"])
-    st.session_state["tarifa_base_tmp"] = fila
-    st.session_state["tarifa_cargada"] = False
 
 
 # =====================================================
@@ -250,9 +254,18 @@ if (
         st.session_state[campo_ui] = tarifa_base.get(campo_bd, DEFAULTS[campo_ui])
     st.session_state["tarifa_cargada"] = True
     st.session_state["tarifa_base_tmp"] = None
+    # 🔒 La versión recargada tras un conflicto se acepta ya con sus valores en pantalla
+    if "version_tarifa_recargada" in st.session_state:
+        st.session_state["version_tarifa_editar"] = st.session_state.pop("version_tarifa_recargada")
 else:
     tarifa_base = None
 
+if "conflicto_tarifa" in st.session_state:
+    st.error(
+        f"⛔ {st.session_state.pop('conflicto_tarifa')} "
+        "Se recargó la versión actual: revisa los valores y guarda de nuevo."
+    )
+
 
 # =====================================================
 # BOTÓN - ADMINISTRAR CATÁLOGOS
@@ -269,14 +282,89 @@ if st.button("✏️ Editar tarifa"):
         else:
             st.switch_page("pages/3_Editar_tarifa.py")
 
+# =====================================================
+# BLOQUE 0.2 - IMPORTACIÓN MASIVA (EXCEL / CSV)
+# =====================================================
+with st.expander("📥 Importación masiva (Excel / CSV)"):
+    st.caption(
+        "Una fila por tarifa, mismas reglas que el formulario. ALL IN = suma de costos. "
+        "Todo se guarda en una sola transacción."
+    )
+    st.download_button(
+        "📄 Descargar plantilla (CSV)",
+        data=plantilla_csv(),
+        file_name="plantilla_tarifas.csv",
+        mime="text/csv",
+        key="btn_plantilla_import",
+    )
+    archivo_import = st.file_uploader("Archivo de tarifas", type=["xlsx", "csv"], key="archivo_import")
+    reemplazar_import = st.checkbox(
+        "Si el carril ya tiene tarifa ACTIVA, crear NUEVA versión (si no, la fila se rechaza)",
+        value=True,
+        key="reemplazar_import",
+    )
+
+    if archivo_import is not None:
+        clave_import = (archivo_import.file_id, reemplazar_import)
+        previo = st.session_state.get("importacion")
+        if previo is None or previo[0] != clave_import:
+            try:
+                with st.spinner("Validando archivo..."):
+                    resultado_import = validar_archivo(archivo_import, archivo_import.name, reemplazar_import)
+                st.session_state["importacion"] = (clave_import, resultado_import)
+            except ValueError as e:
+                st.session_state.pop("importacion", None)
+                st.error(f"❌ {e}")
+                resultado_import = None
+        else:
+            resultado_import = previo[1]
+
+        if resultado_import is not None:
+            m1, m2, m3, m4 = st.columns(4)
+            m1.metric("Filas leídas", f"{resultado_import.filas_leidas:,}")
+            m2.metric("Aceptadas", f"{len(resultado_import.aceptadas):,}")
+            m3.metric("Rechazadas", f"{len(resultado_import.rechazadas):,}")
+            m4.metric("Nuevas versiones", f"{resultado_import.nuevas_versiones:,}")
+            st.caption(
+                f"⚡ Validación: {resultado_import.segundos_validacion:.2f} s "
+                f"({resultado_import.filas_leidas / max(resultado_import.segundos_validacion, 1e-9):,.0f} filas/s)"
+            )
+
+            if not resultado_import.rechazadas.empty:
+                st.warning("Filas rechazadas (no se importan):")
+                st.dataframe(resultado_import.rechazadas, use_container_width=True, hide_index=True)
+                st.download_button(
+                    "⬇️ Descargar rechazadas (CSV)",
+                    data=resultado_import.rechazadas.to_csv(index=False).encode("utf-8-sig"),
+                    file_name="tarifas_rechazadas.csv",
+                    mime="text/csv",
+                    key="btn_rechazadas_import",
+                )
+
+            if resultado_import.insertadas:
+                st.success(
+                    f"✅ {resultado_import.insertadas:,} tarifas importadas "
+                    f"({resultado_import.nuevas_versiones:,} como nueva versión) en "
+                    f"{resultado_import.segundos_escritura:.2f} s · "
+                    f"{resultado_import.filas_por_segundo:,.0f} filas/s de punta a punta"
+                )
+            elif not resultado_import.aceptadas.empty and st.button(
+                f"💾 Importar {len(resultado_import.aceptadas):,} tarifas", key="btn_importar_tarifas"
+            ):
+                try:
+                    importar(resultado_import)
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"❌ No se importó nada: {e}")
+
 # =====================================================
 # BLOQUE A - DATOS DEL SERVICIO
 # =====================================================
 st.subheader("📌 Datos del servicio")
 
 # si no existen catálogos, no truena
-df_ops = df_sql("SELECT TIPO_OPERACION FROM CAT_TIPO_OPERACION ORDER BY TIPO_OPERACION")
-ops_list = df_ops["TIPO_OPERACION"].tolist() if "TIPO_OPERACION" in df_ops.columns and not df_ops.empty else ["EXPORTACIÓN", "IMPORTACIÓN"]
+catalogos = obtener_catalogos()
+ops_list = list(catalogos["CAT_TIPO_OPERACION"].lista()) or ["EXPORTACIÓN", "IMPORTACIÓN"]
 
 c1, c2, c3 = st.columns(3)
 
@@ -291,271 +379,196 @@ st.caption(f"DB PATH: {DB_PATH}")
 
 st.subheader("📍 Ruta")
 
-with sqlite3.connect(str(DB_PATH), check_same_thread=False) as conn:
+# ---------- PAÍSES ----------
+arbol = obtener_arbol()
+paises = list(arbol.paises.hijos())
 
-    # ---------- PAÍSES ----------
-    df_paises = pd.read_sql(
-        "SELECT ID_PAIS, PAIS FROM CAT_PAISES WHERE ACTIVO = 1 ORDER BY PAIS",
-        conn
-    )
-
-    if df_paises.empty:
-        st.error("No hay países activos en CAT_PAISES.")
-        st.stop()
+if not paises:
+    st.error("No hay países activos en CAT_PAISES.")
+    st.stop()
 
-    df_paises["PAIS"] = df_paises["PAIS"].astype(str).str.strip().str.upper()
-    paises = df_paises["PAIS"].tolist()
+# ---------- PAÍS ORIGEN ----------
+pais_origen_prev = (st.session_state.get("pais_origen") or "").strip().upper()
+pais_origen = st.selectbox(
+    "País origen",
+    paises,
+    index=arbol.paises.posicion(pais_origen_prev),
+    key="pais_origen"
+)
 
-    # ---------- PAÍS ORIGEN ----------
-    pais_origen_prev = (st.session_state.get("pais_origen") or "").strip().upper()
-    pais_origen = st.selectbox(
-        "País origen",
-        paises,
-        index=paises.index(pais_origen_prev) if pais_origen_prev in paises else 0,
-        key="pais_origen"
-    )
+if st.session_state.get("pais_origen_prev") and st.session_state["pais_origen_prev"] != pais_origen:
+    st.session_state["estado_origen"] = None
+    st.session_state["ciudad_origen"] = None
+st.session_state["pais_origen_prev"] = pais_origen
 
-    if st.session_state.get("pais_origen_prev") and st.session_state["pais_origen_prev"] != pais_origen:
-        st.session_state["estado_origen"] = None
-        st.session_state["ciudad_origen"] = None
-    st.session_state["pais_origen_prev"] = pais_origen
+id_pais_origen = arbol.paises.id_de(pais_origen)
+if id_pais_origen is None:
+    st.error("País origen inválido.")
+    st.stop()
 
-    fila_pais_origen = df_paises[df_paises["PAIS"] == pais_origen]
-    if fila_pais_origen.empty:
-        st.error("País origen inválido.")
-        st.stop()
-    id_pais_origen = int(fila_pais_origen.iloc[0]["ID_PAIS"])
+# ---------- ESTADO ORIGEN ----------
+estados_origen = list(arbol.estados.hijos(id_pais_origen))
 
-    # ---------- ESTADO ORIGEN ----------
-    df_estados_origen = pd.read_sql(
-        """
-        SELECT ID_ESTADO, ESTADO
-        FROM CAT_ESTADOS_NEW
-        WHERE ID_PAIS = ? AND ACTIVO = 1
-        ORDER BY ESTADO
-        """,
-        conn,
-        params=(id_pais_origen,)
+if not estados_origen:
+    st.warning("No hay estados activos para el país origen.")
+    estado_origen = None
+    id_estado_origen = None
+else:
+    estado_origen_prev = st.session_state.get("estado_origen")
+    estado_origen = st.selectbox(
+        "Estado origen",
+        estados_origen,
+        index=arbol.estados.posicion(estado_origen_prev, id_pais_origen),
+        key="estado_origen"
     )
 
-    if df_estados_origen.empty:
-        st.warning("No hay estados activos para el país origen.")
-        estado_origen = None
-        id_estado_origen = None
-    else:
-        df_estados_origen["ESTADO"] = df_estados_origen["ESTADO"].astype(str).str.strip()
-        estados_origen = df_estados_origen["ESTADO"].tolist()
-
-        estado_origen_prev = st.session_state.get("estado_origen")
-        estado_origen = st.selectbox(
-            "Estado origen",
-            estados_origen,
-            index=estados_origen.index(estado_origen_prev) if estado_origen_prev in estados_origen else 0,
-            key="estado_origen"
-        )
+    if st.session_state.get("estado_origen_prev") and st.session_state["estado_origen_prev"] != estado_origen:
+        st.session_state["ciudad_origen"] = None
+    st.session_state["estado_origen_prev"] = estado_origen
 
-        if st.session_state.get("estado_origen_prev") and st.session_state["estado_origen_prev"] != estado_origen:
-            st.session_state["ciudad_origen"] = None
-        st.session_state["estado_origen_prev"] = estado_origen
+    id_estado_origen = arbol.estados.id_de(estado_origen, id_pais_origen)
 
-        fila_estado_origen = df_estados_origen[df_estados_origen["ESTADO"] == estado_origen]
-        id_estado_origen = int(fila_estado_origen.iloc[0]["ID_ESTADO"]) if not fila_estado_origen.empty else None
+# ---------- CIUDAD ORIGEN ----------
+if not id_estado_origen:
+    ciudad_origen = None
+    st.info("Selecciona estado origen.")
+else:
+    ciudades_origen = list(arbol.ciudades.hijos(id_estado_origen))
 
-    # ---------- CIUDAD ORIGEN ----------
-    if not id_estado_origen:
+    if not ciudades_origen:
         ciudad_origen = None
-        st.info("Selecciona estado origen.")
+        st.warning("No hay ciudades activas para el estado origen.")
     else:
-        df_ciudades_origen = pd.read_sql(
-            """
-            SELECT ID_CIUDAD, CIUDAD
-            FROM CAT_CIUDADES
-            WHERE ID_ESTADO = ? AND ACTIVO = 1
-            ORDER BY CIUDAD
-            """,
-            conn,
-            params=(id_estado_origen,)
+        ciudad_origen_prev = st.session_state.get("ciudad_origen")
+        ciudad_origen = st.selectbox(
+            "Ciudad origen",
+            ciudades_origen,
+            index=arbol.ciudades.posicion(ciudad_origen_prev, id_estado_origen),
+            key="ciudad_origen"
         )
 
-        if df_ciudades_origen.empty:
-            ciudad_origen = None
-            st.warning("No hay ciudades activas para el estado origen.")
-        else:
-            df_ciudades_origen["CIUDAD"] = df_ciudades_origen["CIUDAD"].astype(str).str.strip()
-            ciudades_origen = df_ciudades_origen["CIUDAD"].tolist()
-
-            ciudad_origen_prev = st.session_state.get("ciudad_origen")
-            ciudad_origen = st.selectbox(
-                "Ciudad origen",
-                ciudades_origen,
-                index=ciudades_origen.index(ciudad_origen_prev) if ciudad_origen_prev in ciudades_origen else 0,
-                key="ciudad_origen"
-            )
+st.divider()
 
-    st.divider()
+# ---------- PAÍS DESTINO ----------
+pais_destino_prev = (st.session_state.get("pais_destino") or "").strip().upper()
+pais_destino = st.selectbox(
+    "País destino",
+    paises,
+    index=arbol.paises.posicion(pais_destino_prev),
+    key="pais_destino"
+)
 
-    # ---------- PAÍS DESTINO ----------
-    pais_destino_prev = (st.session_state.get("pais_destino") or "").strip().upper()
-    pais_destino = st.selectbox(
-        "País destino",
-        paises,
-        index=paises.index(pais_destino_prev) if pais_destino_prev in paises else 0,
-        key="pais_destino"
-    )
+if st.session_state.get("pais_destino_prev") and st.session_state["pais_destino_prev"] != pais_destino:
+    st.session_state["estado_destino"] = None
+    st.session_state["ciudad_destino"] = None
+st.session_state["pais_destino_prev"] = pais_destino
 
-    if st.session_state.get("pais_destino_prev") and st.session_state["pais_destino_prev"] != pais_destino:
-        st.session_state["estado_destino"] = None
-        st.session_state["ciudad_destino"] = None
-    st.session_state["pais_destino_prev"] = pais_destino
+id_pais_destino = arbol.paises.id_de(pais_destino)
+if id_pais_destino is None:
+    st.error("País destino inválido.")
+    st.stop()
 
-    fila_pais_destino = df_paises[df_paises["PAIS"] == pais_destino]
-    if fila_pais_destino.empty:
-        st.error("País destino inválido.")
-        st.stop()
-    id_pais_destino = int(fila_pais_destino.iloc[0]["ID_PAIS"])
+# ---------- ESTADO DESTINO ----------
+estados_destino = list(arbol.estados.hijos(id_pais_destino))
 
-    # ---------- ESTADO DESTINO ----------
-    df_estados_destino = pd.read_sql(
-        """
-        SELECT ID_ESTADO, ESTADO
-        FROM CAT_ESTADOS_NEW
-        WHERE ID_PAIS = ? AND ACTIVO = 1
-        ORDER BY ESTADO
-        """,
-        conn,
-        params=(id_pais_destino,)
+if not estados_destino:
+    estado_destino = None
+    id_estado_destino = None
+    st.warning("No hay estados activos para el país destino.")
+else:
+    estado_destino_prev = st.session_state.get("estado_destino")
+    estado_destino = st.selectbox(
+        "Estado destino",
+        estados_destino,
+        index=arbol.estados.posicion(estado_destino_prev, id_pais_destino),
+        key="estado_destino"
     )
 
-    if df_estados_destino.empty:
-        estado_destino = None
-        id_estado_destino = None
-        st.warning("No hay estados activos para el país destino.")
-    else:
-        df_estados_destino["ESTADO"] = df_estados_destino["ESTADO"].astype(str).str.strip()
-        estados_destino = df_estados_destino["ESTADO"].tolist()
-
-        estado_destino_prev = st.session_state.get("estado_destino")
-        estado_destino = st.selectbox(
-            "Estado destino",
-            estados_destino,
-            index=estados_destino.index(estado_destino_prev) if estado_destino_prev in estados_destino else 0,
-            key="estado_destino"
-        )
+    if st.session_state.get("estado_destino_prev") and st.session_state["estado_destino_prev"] != estado_destino:
+        st.session_state["ciudad_destino"] = None
+    st.session_state["estado_destino_prev"] = estado_destino
 
-        if st.session_state.get("estado_destino_prev") and st.session_state["estado_destino_prev"] != estado_destino:
-            st.session_state["ciudad_destino"] = None
-        st.session_state["estado_destino_prev"] = estado_destino
+    id_estado_destino = arbol.estados.id_de(estado_destino, id_pais_destino)
 
-        fila_estado_destino = df_estados_destino[df_estados_destino["ESTADO"] == estado_destino]
-        id_estado_destino = int(fila_estado_destino.iloc[0]["ID_ESTADO"]) if not fila_estado_destino.empty else None
+# ---------- CIUDAD DESTINO ----------
+if not id_estado_destino:
+    ciudad_destino = None
+    st.info("Selecciona estado destino.")
+else:
+    ciudades_destino = list(arbol.ciudades.hijos(id_estado_destino))
 
-    # ---------- CIUDAD DESTINO ----------
-    if not id_estado_destino:
+    if not ciudades_destino:
         ciudad_destino = None
-        st.info("Selecciona estado destino.")
+        st.warning("No hay ciudades activas para el estado destino.")
     else:
-        df_ciudades_destino = pd.read_sql(
-            """
-            SELECT ID_CIUDAD, CIUDAD
-            FROM CAT_CIUDADES
-            WHERE ID_ESTADO = ? AND ACTIVO = 1
-            ORDER BY CIUDAD
-            """,
-            conn,
-            params=(id_estado_destino,)
+        ciudad_destino_prev = st.session_state.get("ciudad_destino")
+        ciudad_destino = st.selectbox(
+            "Ciudad destino",
+            ciudades_destino,
+            index=arbol.ciudades.posicion(ciudad_destino_prev, id_estado_destino),
+            key="ciudad_destino"
         )
 
-        if df_ciudades_destino.empty:
-            ciudad_destino = None
-            st.warning("No hay ciudades activas para el estado destino.")
-        else:
-            df_ciudades_destino["CIUDAD"] = df_ciudades_destino["CIUDAD"].astype(str).str.strip()
-            ciudades_destino = df_ciudades_destino["CIUDAD"].tolist()
-
-            ciudad_destino_prev = st.session_state.get("ciudad_destino")
-            ciudad_destino = st.selectbox(
-                "Ciudad destino",
-                ciudades_destino,
-                index=ciudades_destino.index(ciudad_destino_prev) if ciudad_destino_prev in ciudades_destino else 0,
-                key="ciudad_destino"
-            )
-
-    st.divider()
+st.divider()
 
-    # ---------- TIPO DE UNIDAD ----------
-    df_unidades = pd.read_sql(
-        "SELECT TIPO_UNIDAD FROM CAT_TIPO_UNIDAD ORDER BY TIPO_UNIDAD",
-        conn
-    )
+# ---------- TIPO DE UNIDAD ----------
+unidades = list(catalogos["CAT_TIPO_UNIDAD"].lista())
 
-    if df_unidades.empty:
-        st.error("No hay registros en CAT_TIPO_UNIDAD.")
-        st.stop()
+if not unidades:
+    st.error("No hay registros en CAT_TIPO_UNIDAD.")
+    st.stop()
 
-    unidades = df_unidades["TIPO_UNIDAD"].astype(str).str.strip().tolist()
-    tipo_unidad_prev = st.session_state.get("tipo_unidad")
+tipo_unidad_prev = st.session_state.get("tipo_unidad")
 
-    tipo_unidad = st.selectbox(
-        "Tipo de unidad",
-        unidades,
-        index=unidades.index(tipo_unidad_prev) if tipo_unidad_prev in unidades else 0,
-        key="tipo_unidad"
-    )
+tipo_unidad = st.selectbox(
+    "Tipo de unidad",
+    unidades,
+    index=unidades.index(tipo_unidad_prev) if tipo_unidad_prev in unidades else 0,
+    key="tipo_unidad"
+)
 
 # =====================================================
 # BLOQUE C - DATOS COMERCIALES ✅ ROBUSTO (CLOUD/LOCAL)
 # =====================================================
 st.subheader("👤 Datos comerciales")
 
-with sqlite3.connect(str(DB_PATH), check_same_thread=False) as conn:
-
-    col_cli, col_trp = st.columns(2)
-
-    # ---------- CLIENTES (solo activos) ----------
-    df_cli = pd.read_sql(
-        "SELECT CLIENTE FROM CAT_CLIENTES WHERE ACTIVO = 1 ORDER BY CLIENTE",
-        conn
-    )
-
-    lista_clientes = ["SIN CLIENTE"] + df_cli["CLIENTE"].astype(str).tolist()
+col_cli, col_trp = st.columns(2)
 
-    cliente_default = "SIN CLIENTE"
-    if tarifa_base is not None:
-        cli_tmp = str(tarifa_base.get("CLIENTE", "")).strip()
-        if cli_tmp in lista_clientes:
-            cliente_default = cli_tmp
+# ---------- CLIENTES (solo activos) ----------
+lista_clientes = ["SIN CLIENTE"] + list(catalogos["CAT_CLIENTES"].lista())
 
-    cliente = col_cli.selectbox(
-        "Cliente",
-        lista_clientes,
-        index=lista_clientes.index(cliente_default),
-        key="cliente"
-    )
-
-    # ---------- TRANSPORTISTAS (solo activos) ----------
-    df_trp = pd.read_sql(
-        "SELECT TRANSPORTISTA FROM CAT_TRANSPORTISTAS WHERE ACTIVO = 1 ORDER BY TRANSPORTISTA",
-        conn
-    )
-
-    lista_transportistas = df_trp["TRANSPORTISTA"].astype(str).tolist()
+cliente_default = "SIN CLIENTE"
+if tarifa_base is not None:
+    cli_tmp = str(tarifa_base.get("CLIENTE", "")).strip()
+    if cli_tmp in lista_clientes:
+        cliente_default = cli_tmp
+
+cliente = col_cli.selectbox(
+    "Cliente",
+    lista_clientes,
+    index=lista_clientes.index(cliente_default),
+    key="cliente"
+)
 
-    if not lista_transportistas:
-        st.error("❌ No hay transportistas activos en CAT_TRANSPORTISTAS.")
-        st.stop()
+# ---------- TRANSPORTISTAS (solo activos) ----------
+lista_transportistas = list(catalogos["CAT_TRANSPORTISTAS"].lista())
 
-    transportista_default = lista_transportistas[0]
-    if tarifa_base is not None:
-        trp_tmp = str(tarifa_base.get("TRANSPORTISTA", "")).strip()
-        if trp_tmp in lista_transportistas:
-            transportista_default = trp_tmp
+if not lista_transportistas:
+    st.error("❌ No hay transportistas activos en CAT_TRANSPORTISTAS.")
+    st.stop()
 
-    transportista = col_trp.selectbox(
-        "Transportista",
-        lista_transportistas,
-        index=lista_transportistas.index(transportista_default),
-        key="transportista"
-    )
+transportista_default = lista_transportistas[0]
+if tarifa_base is not None:
+    trp_tmp = str(tarifa_base.get("TRANSPORTISTA", "")).strip()
+    if trp_tmp in lista_transportistas:
+        transportista_default = trp_tmp
+
+transportista = col_trp.selectbox(
+    "Transportista",
+    lista_transportistas,
+    index=lista_transportistas.index(transportista_default),
+    key="transportista"
+)
 # =====================================================
 # BLOQUE D - TARIFAS (PRECARGA CONTROLADA) ✅ ROBUSTO
 # =====================================================
@@ -719,42 +732,33 @@ if errores:
 
 # Modo edición si existe una tarifa base seleccionada
 editando = "id_tarifa_editar" in st.session_state
-
-with sqlite3.connect(str(DB_PATH)) as conn:
-    cur = conn.cursor()
-
-    sql_duplicado = """
-        SELECT COUNT(1)
-        FROM tarifario_estandar
-        WHERE
-            TRANSPORTISTA = ?
-            AND TIPO_UNIDAD = ?
-            AND PAIS_ORIGEN = ?
-            AND ESTADO_ORIGEN = ?
-            AND CIUDAD_ORIGEN = ?
-            AND PAIS_DESTINO = ?
-            AND ESTADO_DESTINO = ?
-            AND CIUDAD_DESTINO = ?
-            AND ACTIVA = 1
-    """
-
-    params = (
-        transportista,
-        tipo_unidad,
-        pais_origen,
-        estado_origen,
-        ciudad_origen,
-        pais_destino,
-        estado_destino,
-        ciudad_destino,
-    )
-
-    duplicado_activo = cur.execute(sql_duplicado, params).fetchone()[0]
+id_tarifa_editar = st.session_state.get("id_tarifa_editar")
+
+# 🔑 Clave del carril (mismo orden que COLUMNAS_CARRIL_TARIFA)
+lane_key = clave_carril((
+    transportista,
+    cliente,
+    tipo_unidad,
+    tipo_operacion,
+    tipo_viaje,
+    pais_origen,
+    estado_origen,
+    ciudad_origen,
+    pais_destino,
+    estado_destino,
+    ciudad_destino,
+))
+
+with conexion_lectura() as conn:
+    activa_carril = conn.execute(SQL_ACTIVA_CARRIL, (lane_key,)).fetchone()
+
+# Otra tarifa ACTIVA en el carril (la que se está editando no cuenta)
+duplicado_activo = activa_carril is not None and (not editando or activa_carril[1] != id_tarifa_editar)
 
 # -----------------------------------------------------
 # REGLAS DE NEGOCIO
 # -----------------------------------------------------
-if duplicado_activo > 0 and not editando:
+if duplicado_activo:
     st.warning(
         "⚠️ Ya existe una tarifa ACTIVA para esta ruta y proveedor.\n"
         "Si continúas, se creará una NUEVA versión."
@@ -768,146 +772,104 @@ else:
     confirmar = True
 
 # =====================================================
-# BLOQUE E.5 - INSERT FINAL (CON VERSIONADO CORRECTO)
+# BLOQUE E.5 - GUARDADO (NUEVA VERSIÓN ATÓMICA)
 # =====================================================
 if st.button("💾 Guardar tarifa", key="btn_guardar_tarifa") and confirmar:
-    with sqlite3.connect(str(DB_PATH)) as conn:
-        cur = conn.cursor()
-
-        # 🔁 SI VIENE DE EDITAR → DESACTIVA LA TARIFA ANTERIOR
-        editando = "id_tarifa_editar" in st.session_state
-        if editando:
-            cur.execute(
-                "UPDATE tarifario_estandar SET ACTIVA = 0 WHERE ID_TARIFA = ?",
-                (st.session_state["id_tarifa_editar"],)
-            )
-
-        # ➕ INSERT NUEVA VERSIÓN (ACTIVA = 1)
-        cur.execute(
-            """
-            INSERT INTO tarifario_estandar (
-                RESPONSABLE,
-                TIPO_DE_OPERACION,
-                TIPO_DE_VIAJE,
-                TIPO_UNIDAD,
-                TRANSPORTISTA,
-                CLIENTE,
-
-                PAIS_ORIGEN,
-                ESTADO_ORIGEN,
-                CIUDAD_ORIGEN,
-                DIRECCION_DE_RECOLECCION,
-                DESTINO,
-                PAIS_DESTINO,
-                ESTADO_DESTINO,
-                CIUDAD_DESTINO,
-                DESTINO_EMPRESA,
-                DESTINO_DIRECCION,
-
-                USA_FREIGHT,
-                MEXICAN_FREIGHT,
-                CROSSING,
-                TEAM_DRIVER,
-                PEAJES,
-                MANIOBRAS,
-                INSURANCE,
-                ADUANAS_ARANCELES,
-
-                TARIFA_VIAJE_SENCILLO,
-                TARIFA_VIAJE_FULL,
-                TARIFA_VIAJE_REDONDO,
-
-                PRECIO_VIAJE_SENCILLO,
-                PRECIO_VIAJE_REDONDO,
-                MONEDA,
-
-                BORDER_CROSSING,
-                ALL_IN,
-
-                REMARK,
-                REQUERIMIENTO,
-
-                WAITING,
-                COSTO_DE_WAITING_CHARGE,
-                FREE_TIME,
-                TRUCKING_CANCEL_FEE,
-
-                VERSION,
-                ACTIVA,
-                FECHA_CAMBIO,
-                USUARIO_CAMBIO
-            )
-            VALUES (
-                ?, ?, ?, ?, ?, ?,
-                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-                ?, ?, ?, ?, ?, ?, ?, ?,
-                ?, ?, ?,
-                ?, ?, ?,
-                ?, ?,
-                ?, ?,
-                ?, ?, ?, ?,
-                ?, ?, ?, ?
-            )
-            """,
-            (
-                1,  # RESPONSABLE
-                tipo_operacion,
-                tipo_viaje,
-                tipo_unidad,
-                transportista,
-                cliente,
-
-                pais_origen,
-                estado_origen,
-                ciudad_origen,
-                direccion_recoleccion,
-                destino_empresa,
-                pais_destino,
-                estado_destino,
-                ciudad_destino,
-                destino_empresa,
-                destino_direccion,
-
-                usa_freight,
-                mexican_freight,
-                crossing,
-                int(team_driver),
-                peajes,
-                maniobras,
-                insurance,
-                aduanas_aranceles,
-
-                tarifa_sencillo,
-                tarifa_full,
-                tarifa_redondo,
-
-                precio_sencillo,
-                precio_redondo,
-                moneda,
-
-                border_crossing,
-                all_in,
-
-                remark,
-                requerimiento,
-
-                int(waiting),
-                costo_waiting,
-                free_time,
-                trucking_cancel_fee,
-
-                1,  # VERSION
-                1,  # ACTIVA
-                datetime.now().isoformat(),
-                "HUGO"
-            )
-        )
+    # 🔒 Lo que vio el usuario: la versión que edita, o la activa del carril (None = ninguna).
+    # Si cambió antes del guardado, crear_nueva_version no escribe y regresa el conflicto.
+    if editando:
+        version_esperada = st.session_state.get("version_tarifa_editar")
+    else:
+        version_esperada = int(activa_carril[2]) if activa_carril and activa_carril[2] is not None else None
+
+    resultado = crear_nueva_version(
+        {
+            "RESPONSABLE": 1,
+            "TIPO_DE_OPERACION": tipo_operacion,
+            "TIPO_DE_VIAJE": tipo_viaje,
+            "TIPO_UNIDAD": tipo_unidad,
+            "TRANSPORTISTA": transportista,
+            "CLIENTE": cliente,
+
+            "PAIS_ORIGEN": pais_origen,
+            "ESTADO_ORIGEN": estado_origen,
+            "CIUDAD_ORIGEN": ciudad_origen,
+            "DIRECCION_DE_RECOLECCION": direccion_recoleccion,
+            "DESTINO": destino_empresa,
+            "PAIS_DESTINO": pais_destino,
+            "ESTADO_DESTINO": estado_destino,
+            "CIUDAD_DESTINO": ciudad_destino,
+            "DESTINO_EMPRESA": destino_empresa,
+            "DESTINO_DIRECCION": destino_direccion,
+
+            # Ids del árbol de los selectores (mismos que los nombres)
+            "ID_PAIS_ORIGEN": id_pais_origen,
+            "ID_ESTADO_ORIGEN": id_estado_origen,
+            "ID_CIUDAD_ORIGEN": arbol.ciudades.id_de(ciudad_origen, id_estado_origen),
+            "ID_PAIS_DESTINO": id_pais_destino,
+            "ID_ESTADO_DESTINO": id_estado_destino,
+            "ID_CIUDAD_DESTINO": arbol.ciudades.id_de(ciudad_destino, id_estado_destino),
+
+            "USA_FREIGHT": usa_freight,
+            "MEXICAN_FREIGHT": mexican_freight,
+            "CROSSING": crossing,
+            "TEAM_DRIVER": int(team_driver),
+            "PEAJES": peajes,
+            "MANIOBRAS": maniobras,
+            "INSURANCE": insurance,
+            "ADUANAS_ARANCELES": aduanas_aranceles,
+
+            "TARIFA_VIAJE_SENCILLO": tarifa_sencillo,
+            "TARIFA_VIAJE_FULL": tarifa_full,
+            "TARIFA_VIAJE_REDONDO": tarifa_redondo,
+
+            "PRECIO_VIAJE_SENCILLO": precio_sencillo,
+            "PRECIO_VIAJE_REDONDO": precio_redondo,
+            "MONEDA": moneda,
+
+            "BORDER_CROSSING": border_crossing,
+            "ALL_IN": all_in,
+
+            "REMARK": remark,
+            "REQUERIMIENTO": requerimiento,
+
+            "WAITING": int(waiting),
+            "COSTO_DE_WAITING_CHARGE": costo_waiting,
+            "FREE_TIME": free_time,
+            "TRUCKING_CANCEL_FEE": trucking_cancel_fee,
+        },
+        id_tarifa=id_tarifa_editar,
+        version_esperada=version_esperada,
+        # 🔁 La activa del carril (si hay) pasa a historial: una sola activa por carril
+        reemplazar_carril=duplicado_activo,
+        usuario="HUGO",
+    )
 
-        conn.commit()
+    if not resultado.ok:
+        if not editando:
+            # La activa del carril se vuelve a leer en BLOQUE E.4 en cuanto se recarga
+            st.error(f"⛔ {resultado.conflicto} Revisa el carril y vuelve a guardar.")
+            st.stop()
+        # 🔄 El formulario cargado ya no vale: se recarga la base desde la BD principal y
+        # su versión se acepta hasta que el usuario la vea (BLOQUE 0.1)
+        with conexion_lectura() as conn:
+            df_base = pd.read_sql(SQL_BASE_TARIFA, conn, params=(id_tarifa_editar,))
+        st.session_state.pop("version_tarifa_editar", None)
+        st.session_state["conflicto_tarifa"] = resultado.conflicto
+        if not df_base.empty:
+            base = df_base.iloc[0]
+            st.session_state["tarifa_base_tmp"] = base
+            st.session_state["tarifa_cargada"] = False
+            st.session_state["version_tarifa_recargada"] = int(base["VERSION"]) if base["ACTIVA"] == 1 else None
+            # Los selectores con key conservan su valor: se sueltan para tomar el de la base
+            st.session_state.pop("cliente", None)
+            st.session_state.pop("transportista", None)
+        st.rerun()
 
     # 🧹 LIMPIEZA DE ESTADO
     st.session_state.pop("id_tarifa_editar", None)
+    st.session_state.pop("version_tarifa_editar", None)
     st.session_state["tarifa_cargada"] = False
 
-    st.success("✅ Tarifa guardada correctamente")
+    st.success(f"✅ Tarifa guardada correctamente (ID {resultado.id_tarifa}, v{resultado.version})")
     st.rerun()
\ No newline at end of file
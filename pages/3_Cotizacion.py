@@ -1,13 +1,14 @@
 import streamlit as st
 st.write("COTIZACION VERSION NUEVA 2026")
-import sqlite3
 import pandas as pd
-from pathlib import Path
+
+from core.catalogs import obtener_catalogos, valores_tarifario
+from core.db import DB_PATH, conexion_replica
+from core.migrations import aplicar_migraciones
 
 # ===============================
 # CONFIG
 # ===============================
-DB_NAME = "tarifario.db"
 TABLA = "tarifario_estandar"
 
 
@@ -17,13 +18,12 @@ st.success("Pantalla de impresión cargada")
 # ===============================
 # DB PATH (CLOUD/LOCAL)
 # ===============================
-REPO_ROOT = Path(__file__).resolve().parents[1]   # .../tarifario-streamlit-v2
-DB_PATH = REPO_ROOT / DB_NAME
-
 if not DB_PATH.exists():
     st.error(f"❌ No encuentro la base: {DB_PATH}")
     st.stop()
 
+aplicar_migraciones()
+
 # ===============================
 # HELPERS
 # ===============================
@@ -31,14 +31,6 @@ def tabla_columnas(conn, tabla: str) -> set:
     df_cols = pd.read_sql(f"PRAGMA table_info({tabla})", conn)
     return set(df_cols["name"].tolist()) if not df_cols.empty else set()
 
-def safe_distinct(conn, col: str, solo_activa: bool = True) -> list:
-    cols = tabla_columnas(conn, TABLA)
-    if col not in cols:
-        return []
-    where = "WHERE ACTIVA = 1" if (solo_activa and "ACTIVA" in cols) else ""
-    df = pd.read_sql(f"SELECT DISTINCT {col} FROM {TABLA} {where}", conn)
-    return df[col].dropna().astype(str).tolist()
-
 def get_val(row, *cols, default=""):
     for c in cols:
         if c in row.index:
@@ -46,11 +38,6 @@ def get_val(row, *cols, default=""):
             return default if pd.isna(v) else v
     return default
 
-# ===============================
-# CONEXIÓN BD
-# ===============================
-conn = sqlite3.connect(str(DB_PATH), check_same_thread=False)
-
 # ===============================
 # COLUMNAS BASE
 # ===============================
@@ -76,12 +63,19 @@ COL_ALLIN     = "ALL_IN"
 # ===============================
 st.subheader("🔎 Buscador de tarifas")
 
-clientes    = safe_distinct(conn, COL_CLIENTE)
-claves      = safe_distinct(conn, COL_CLAVE)
-unidades    = safe_distinct(conn, COL_UNIDAD)
-viajes      = safe_distinct(conn, COL_VIAJE)
-operaciones = safe_distinct(conn, COL_OPERACION)
-trps        = safe_distinct(conn, COL_TRP)
+# Una sola lectura (cacheada por versión del tarifario) para todos los dropdowns
+valores = valores_tarifario((
+    COL_CLIENTE, COL_CLAVE, COL_UNIDAD, COL_VIAJE, COL_OPERACION, COL_TRP,
+    COL_PAIS_O, COL_ESTADO_O, COL_CIUDAD_O,
+    COL_PAIS_D, COL_ESTADO_D, COL_CIUDAD_D,
+))
+
+clientes    = valores[COL_CLIENTE]
+claves      = valores[COL_CLAVE]
+unidades    = valores[COL_UNIDAD]
+viajes      = valores[COL_VIAJE]
+operaciones = valores[COL_OPERACION]
+trps        = valores[COL_TRP]
 
 c1, c2, c3, c4, c5, c6 = st.columns(6)
 cliente   = c1.selectbox("Cliente", ["Todos"] + sorted(clientes))
@@ -93,13 +87,13 @@ trp       = c6.selectbox("Transportista", ["Todos"] + sorted(trps))
 
 st.markdown("**Ruta**")
 
-paises_o   = safe_distinct(conn, COL_PAIS_O)
-estados_o  = safe_distinct(conn, COL_ESTADO_O)
-ciudades_o = safe_distinct(conn, COL_CIUDAD_O)
+paises_o   = valores[COL_PAIS_O]
+estados_o  = valores[COL_ESTADO_O]
+ciudades_o = valores[COL_CIUDAD_O]
 
-paises_d   = safe_distinct(conn, COL_PAIS_D)
-estados_d  = safe_distinct(conn, COL_ESTADO_D)
-ciudades_d = safe_distinct(conn, COL_CIUDAD_D)
+paises_d   = valores[COL_PAIS_D]
+estados_d  = valores[COL_ESTADO_D]
+ciudades_d = valores[COL_CIUDAD_D]
 
 o1, o2, o3, d1, d2, d3 = st.columns(6)
 pais_o   = o1.selectbox("País O", ["Todos"] + sorted(paises_o))
@@ -129,20 +123,40 @@ add(COL_VIAJE, viaje)
 add(COL_OPERACION, operacion, "Todas")
 add(COL_TRP, trp)
 
-add(COL_PAIS_O, pais_o)
-add(COL_ESTADO_O, estado_o)
-add(COL_CIUDAD_O, ciudad_o)
-
-add(COL_PAIS_D, pais_d)
-add(COL_ESTADO_D, estado_d)
-add(COL_CIUDAD_D, ciudad_d)
+# Ruta: comparación de enteros sobre ID_* (índice por ID_CIUDAD_*).
+# Un nombre puede repetirse en varios estados -> IN con todos sus ids.
+# Si el nombre no está en el catálogo se filtra por texto, como antes.
+# Toda escritura llena los ids en su mismo trabajo (captura, edición, importación
+# y altas de país / estado / ciudad en Catálogos), así que no quedan filas fuera.
+catalogos = obtener_catalogos()
 
-# Solo activas si existe ACTIVA
-cols = tabla_columnas(conn, TABLA)
-if "ACTIVA" in cols:
-    query += " AND ACTIVA = 1"
+def add_geo(col, tabla, val):
+    global query, params
+    if val == "Todos":
+        return
+    ids = catalogos[tabla].ids_con_nombre(str(val).strip())
+    if not ids:
+        add(col, val)
+        return
+    query += f" AND ID_{col} IN ({', '.join('?' * len(ids))})"
+    params.extend(ids)
+
+add_geo(COL_PAIS_O, "CAT_PAISES", pais_o)
+add_geo(COL_ESTADO_O, "CAT_ESTADOS_NEW", estado_o)
+add_geo(COL_CIUDAD_O, "CAT_CIUDADES", ciudad_o)
+
+add_geo(COL_PAIS_D, "CAT_PAISES", pais_d)
+add_geo(COL_ESTADO_D, "CAT_ESTADOS_NEW", estado_d)
+add_geo(COL_CIUDAD_D, "CAT_CIUDADES", ciudad_d)
+
+# Solo lectura: va contra la réplica (no compite con quien está guardando versiones)
+with conexion_replica() as conn:
+    # Solo activas si existe ACTIVA
+    cols = tabla_columnas(conn, TABLA)
+    if "ACTIVA" in cols:
+        query += " AND ACTIVA = 1"
 
-df = pd.read_sql(query, conn, params=params)
+    df = pd.read_sql(query, conn, params=params)
 
 # ===============================
 # RESULTADOS
@@ -151,7 +165,6 @@ st.subheader("📊 Resultados")
 
 if df.empty:
     st.warning("No se encontraron tarifas.")
-    conn.close()
     st.stop()
 
 st.dataframe(df, use_container_width=True)
@@ -317,5 +330,3 @@ st.components.v1.html(
     height=820
 )
 
-conn.close()
-
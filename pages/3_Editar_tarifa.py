@@ -4,19 +4,20 @@
 # =====================================================
 
 import streamlit as st
-import sqlite3
 import pandas as pd
-from pathlib import Path
-from datetime import datetime
+
+from core.db import conexion_lectura
+from core.geography import obtener_arbol
+from core.migrations import aplicar_migraciones
+from core.queries import SQL_BASE_TARIFA
+from core.services import crear_nueva_version
 
 # -----------------------------------------------------
 # CONFIG
 # -----------------------------------------------------
 st.set_page_config(page_title="Editar tarifa", layout="wide")
 
-DB_NAME = "tarifario.db"
-REPO_ROOT = Path(__file__).resolve().parents[1]
-DB_PATH = REPO_ROOT / DB_NAME
+aplicar_migraciones()
 
 st.title("✏️ Edición de tarifa (Versionado ERP)")
 st.caption("✔ No se edita en vivo | ✔ Historial intacto | ✔ Nueva versión")
@@ -33,12 +34,8 @@ id_tarifa = st.session_state["id_tarifa_editar"]
 # -----------------------------------------------------
 # CARGA TARIFA BASE
 # -----------------------------------------------------
-with sqlite3.connect(str(DB_PATH)) as conn:
-    df_base = pd.read_sql(
-        "SELECT * FROM tarifario_estandar WHERE ID_TARIFA = ?",
-        conn,
-        params=(id_tarifa,)
-    )
+with conexion_lectura() as conn:
+    df_base = pd.read_sql(SQL_BASE_TARIFA, conn, params=(id_tarifa,))
 
 if df_base.empty:
     st.error("La tarifa no existe o fue eliminada.")
@@ -46,8 +43,24 @@ if df_base.empty:
 
 tarifa_base = df_base.iloc[0]
 
+# 🔒 Versión que se empezó a editar (la fija Captura al elegir la tarifa): si otro
+# la cambia antes de guardar, hay conflicto
+st.session_state.setdefault(
+    "version_tarifa_editar",
+    int(tarifa_base["VERSION"]) if tarifa_base["ACTIVA"] == 1 else None
+)
+
+if "conflicto_tarifa" in st.session_state:
+    st.error(
+        f"⛔ {st.session_state.pop('conflicto_tarifa')} "
+        "Se recargó la versión actual: revisa los valores y guarda de nuevo."
+    )
+
 st.success(f"Editando tarifa ID {id_tarifa} | Versión {tarifa_base.get('VERSION', 1)}")
 
+# Cada recarga tras un conflicto estrena widgets (no conservan lo capturado antes)
+carga = st.session_state.setdefault("carga_edicion", 0)
+
 # -----------------------------------------------------
 # FORMULARIO (ERP STYLE)
 # -----------------------------------------------------
@@ -57,17 +70,20 @@ c1, c2, c3 = st.columns(3)
 
 transportista = c1.text_input(
     "Transportista",
-    value=str(tarifa_base["TRANSPORTISTA"])
+    value=str(tarifa_base["TRANSPORTISTA"]),
+    key=f"ed_transportista_{carga}"
 )
 
 cliente = c2.text_input(
     "Cliente",
-    value=str(tarifa_base["CLIENTE"])
+    value=str(tarifa_base["CLIENTE"]),
+    key=f"ed_cliente_{carga}"
 )
 
 tipo_unidad = c3.text_input(
     "Tipo unidad",
-    value=str(tarifa_base["TIPO_UNIDAD"])
+    value=str(tarifa_base["TIPO_UNIDAD"]),
+    key=f"ed_tipo_unidad_{carga}"
 )
 
 st.divider()
@@ -78,12 +94,14 @@ c1, c2 = st.columns(2)
 
 ciudad_origen = c1.text_input(
     "Ciudad origen",
-    value=str(tarifa_base["CIUDAD_ORIGEN"])
+    value=str(tarifa_base["CIUDAD_ORIGEN"]),
+    key=f"ed_ciudad_origen_{carga}"
 )
 
 ciudad_destino = c2.text_input(
     "Ciudad destino",
-    value=str(tarifa_base["CIUDAD_DESTINO"])
+    value=str(tarifa_base["CIUDAD_DESTINO"]),
+    key=f"ed_ciudad_destino_{carga}"
 )
 
 st.divider()
@@ -98,17 +116,17 @@ def nf(x):
 
 c1, c2, c3, c4 = st.columns(4)
 
-usa_freight = c1.number_input("USA Freight", value=nf(tarifa_base["USA_FREIGHT"]))
-mexican_freight = c2.number_input("Mexican Freight", value=nf(tarifa_base["MEXICAN_FREIGHT"]))
-crossing = c3.number_input("Crossing", value=nf(tarifa_base["CROSSING"]))
-border_crossing = c4.number_input("Border Crossing", value=nf(tarifa_base["BORDER_CROSSING"]))
+usa_freight = c1.number_input("USA Freight", value=nf(tarifa_base["USA_FREIGHT"]), key=f"ed_usa_freight_{carga}")
+mexican_freight = c2.number_input("Mexican Freight", value=nf(tarifa_base["MEXICAN_FREIGHT"]), key=f"ed_mexican_freight_{carga}")
+crossing = c3.number_input("Crossing", value=nf(tarifa_base["CROSSING"]), key=f"ed_crossing_{carga}")
+border_crossing = c4.number_input("Border Crossing", value=nf(tarifa_base["BORDER_CROSSING"]), key=f"ed_border_crossing_{carga}")
 
 c5, c6, c7, c8 = st.columns(4)
 
-aduanas = c5.number_input("Aduanas", value=nf(tarifa_base["ADUANAS_ARANCELES"]))
-insurance = c6.number_input("Seguro", value=nf(tarifa_base["INSURANCE"]))
-peajes = c7.number_input("Peajes", value=nf(tarifa_base["PEAJES"]))
-maniobras = c8.number_input("Maniobras", value=nf(tarifa_base["MANIOBRAS"]))
+aduanas = c5.number_input("Aduanas", value=nf(tarifa_base["ADUANAS_ARANCELES"]), key=f"ed_aduanas_aranceles_{carga}")
+insurance = c6.number_input("Seguro", value=nf(tarifa_base["INSURANCE"]), key=f"ed_insurance_{carga}")
+peajes = c7.number_input("Peajes", value=nf(tarifa_base["PEAJES"]), key=f"ed_peajes_{carga}")
+maniobras = c8.number_input("Maniobras", value=nf(tarifa_base["MANIOBRAS"]), key=f"ed_maniobras_{carga}")
 
 all_in = (
     usa_freight + mexican_freight + crossing + border_crossing +
@@ -135,71 +153,66 @@ if not motivo.strip():
 st.subheader("💾 Guardar nueva versión")
 
 if st.button("Guardar nueva versión"):
-    with sqlite3.connect(str(DB_PATH)) as conn:
-        cur = conn.cursor()
-
-        # 1️⃣ Desactivar versión anterior
-        cur.execute(
-            "UPDATE tarifario_estandar SET ACTIVA = 0 WHERE ID_TARIFA = ?",
-            (id_tarifa,)
-        )
-
-        # 2️⃣ Insertar nueva versión
-        cur.execute(
-            """
-            INSERT INTO tarifario_estandar (
-                VERSION,
-                ACTIVA,
-                FECHA_CAMBIO,
-                MOTIVO_CAMBIO,
-
-                TRANSPORTISTA,
-                CLIENTE,
-                TIPO_UNIDAD,
-
-                CIUDAD_ORIGEN,
-                CIUDAD_DESTINO,
-
-                USA_FREIGHT,
-                MEXICAN_FREIGHT,
-                CROSSING,
-                BORDER_CROSSING,
-                ADUANAS_ARANCELES,
-                INSURANCE,
-                PEAJES,
-                MANIOBRAS,
-                ALL_IN
-            )
-            VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                int(tarifa_base.get("VERSION", 1)) + 1,
-                datetime.now().isoformat(timespec="seconds"),
-                motivo,
-
-                transportista,
-                cliente,
-                tipo_unidad,
-
-                ciudad_origen,
-                ciudad_destino,
-
-                usa_freight,
-                mexican_freight,
-                crossing,
-                border_crossing,
-                aduanas,
-                insurance,
-                peajes,
-                maniobras,
-                all_in
+    # 🌎 Aquí solo se editan nombres de ciudad: misma ciudad que la base -> su id;
+    # otra -> se busca bajo el estado de la base (los nombres se repiten entre estados)
+    def _id_ciudad(nombre, columna):
+        id_base = tarifa_base.get(f"ID_{columna}")
+        if nombre.strip() == str(tarifa_base[columna]).strip() and pd.notna(id_base):
+            return int(id_base)
+        id_estado = tarifa_base.get(f"ID_ESTADO_{columna.removeprefix('CIUDAD_')}")
+        if pd.isna(id_estado):
+            return None
+        return obtener_arbol().ciudades.id_de(nombre.strip(), int(id_estado))
+
+    ids_ciudad = {}
+    for columna, nombre in (("CIUDAD_ORIGEN", ciudad_origen), ("CIUDAD_DESTINO", ciudad_destino)):
+        ids_ciudad[columna] = _id_ciudad(nombre, columna)
+        # Una ciudad nueva que no está en el estado de la base no se guarda: su id
+        # no coincidiría con el ID_ESTADO_* / ESTADO_* que se copian de la base
+        if ids_ciudad[columna] is None and nombre.strip() != str(tarifa_base[columna]).strip():
+            estado = tarifa_base.get(f"ESTADO_{columna.removeprefix('CIUDAD_')}")
+            st.error(
+                f"❌ La ciudad {nombre.strip()} no existe en el estado {estado} de esta tarifa. "
+                "Dala de alta en Catálogos o corrige el nombre."
             )
-        )
+            st.stop()
+
+    # Lo que no se edita aquí (país, estado, precios...) se copia de la versión base
+    resultado = crear_nueva_version(
+        {
+            "TRANSPORTISTA": transportista,
+            "CLIENTE": cliente,
+            "TIPO_UNIDAD": tipo_unidad,
+
+            "CIUDAD_ORIGEN": ciudad_origen,
+            "CIUDAD_DESTINO": ciudad_destino,
+            "ID_CIUDAD_ORIGEN": ids_ciudad["CIUDAD_ORIGEN"],
+            "ID_CIUDAD_DESTINO": ids_ciudad["CIUDAD_DESTINO"],
+
+            "USA_FREIGHT": usa_freight,
+            "MEXICAN_FREIGHT": mexican_freight,
+            "CROSSING": crossing,
+            "BORDER_CROSSING": border_crossing,
+            "ADUANAS_ARANCELES": aduanas,
+            "INSURANCE": insurance,
+            "PEAJES": peajes,
+            "MANIOBRAS": maniobras,
+            "ALL_IN": all_in,
+        },
+        id_tarifa=id_tarifa,
+        version_esperada=st.session_state["version_tarifa_editar"],
+        motivo=motivo,
+    )
 
-        conn.commit()
+    if not resultado.ok:
+        # 🔄 Lo capturado se descarta: al recargar, la base se vuelve a leer de la BD
+        # principal y su versión se fija con esos valores ya en pantalla
+        st.session_state.pop("version_tarifa_editar", None)
+        st.session_state["conflicto_tarifa"] = resultado.conflicto
+        st.session_state["carga_edicion"] = carga + 1
+        st.rerun()
 
-    st.success("✅ Nueva versión creada correctamente (ERP Style)")
+    st.success(f"✅ Nueva versión v{resultado.version} creada correctamente (ERP Style)")
     st.session_state.pop("id_tarifa_editar", None)
+    st.session_state.pop("version_tarifa_editar", None)
     st.switch_page("pages/2_Captura_tarifas.py")
-
-
@@ -0,0 +1,31 @@
+"""
+Las pruebas nunca abren tarifario.db: antes de importar core, la BD y el
+directorio de exportaciones apuntan a un temporal, y cada prueba que necesita
+BD arma la suya con db.configurar().
+"""
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+_TEMPORAL = Path(tempfile.mkdtemp(prefix="tarifario-pruebas-"))
+os.environ["TARIFARIO_DB"] = str(_TEMPORAL / "sin_usar.db")
+os.environ["TARIFARIO_EXPORTS"] = str(_TEMPORAL / "exports")
+
+from bench.book import BD_MODELO, crear_libro  # noqa: E402
+from core import db  # noqa: E402
+
+
+@pytest.fixture(params=["libro_sintetico", "bd_incluida"])
+def bd_temporal(request, tmp_path):
+    """BD en tmp_path sin migrar: un libro sintético o una copia de la BD del repo."""
+    ruta = tmp_path / "tarifario.db"
+    if request.param == "libro_sintetico":
+        crear_libro(ruta, filas=3_000)
+    else:
+        shutil.copy(BD_MODELO, ruta)
+    db.configurar(ruta)
+    yield ruta
+    db.configurar(ruta)  # detiene el escritor y cierra los pools antes de borrar tmp_path
@@ -0,0 +1,37 @@
+from core import db, services
+from core.migrations import aplicar_migraciones
+from core.services import TarifarioIncremental, cargar_bd_completa, crear_nueva_version, olvidar_lector
+
+
+def _filas_bitacora() -> int:
+    db.ejecutar_escritura(lambda conn: None)  # el escritor es FIFO: la poda encolada ya corrió
+    with db.conexion_lectura() as conn:
+        return conn.execute("SELECT COUNT(*) FROM tarifario_cambios").fetchone()[0]
+
+
+def test_poda_lo_que_todos_los_lectores_leyeron(bd_temporal):
+    aplicar_migraciones()
+    assert _filas_bitacora() >= services.PODA_MINIMA
+    cargar_bd_completa()
+    # Solo queda la última fila: MAX(SEQ) no retrocede
+    assert _filas_bitacora() == 1
+
+
+def test_lector_detras_de_la_poda_recarga_completo(bd_temporal, monkeypatch):
+    monkeypatch.setattr(services, "PODA_MINIMA", 1)
+    aplicar_migraciones()
+    # Un lector que no cuenta para la poda, como el de otro proceso
+    atrasado = TarifarioIncremental()
+    atrasado.obtener()
+    olvidar_lector(atrasado)
+
+    base = atrasado.df[atrasado.df["ACTIVA"] == 1].dropna(subset=["ID_TARIFA"]).iloc[0]
+    for precio in (111.0, 222.0):
+        assert crear_nueva_version({"ALL_IN": precio}, id_tarifa=base["ID_TARIFA"], motivo="prueba").ok
+    cargar_bd_completa()
+    assert _filas_bitacora() == 1
+
+    df = atrasado.obtener()
+    assert atrasado.cargas_completas == 2
+    assert df["id"].tolist() == cargar_bd_completa()["id"].tolist()
+    assert df.loc[df["ACTIVA"] == 1, "ALL_IN"].isin([222.0]).any()
@@ -0,0 +1,42 @@
+import threading
+import time
+
+import pytest
+
+from bench.concurrencia import correr
+from core import db
+
+
+def test_versionado_concurrente_respeta_invariantes():
+    # Pocos procesos e intentos: los mismos invariantes que `python -m bench.concurrencia`
+    # (una activa por carril, VERSION consecutiva por ID_TARIFA, ninguna actualización perdida)
+    r = correr(procesos=2, hilos=3, intentos=8, tarifas=3, filas=600)
+    assert not r.fallas
+    assert r.cuenta.get("errores", 0) == 0
+    assert r.cuenta.get("ok", 0) > 0
+    assert r.cuenta.get("perdidas", 0) == 0
+
+
+def _existe(tabla: str) -> bool:
+    with db.conexion_lectura() as conn:
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (tabla,)).fetchone() is not None
+
+
+def test_timeout_de_escritura_no_reporta_error_de_lo_que_se_guardo(bd_temporal):
+    # Detrás de un trabajo largo: el que no alcanzó a empezar se cancela sin escribir
+    liberar = threading.Event()
+    largo = db.enviar_escritura(lambda conn: liberar.wait(10))
+    with pytest.raises(TimeoutError):
+        db.ejecutar_escritura(lambda conn: conn.execute("CREATE TABLE cancelada (x)"), timeout=0.1)
+    liberar.set()
+    largo.result()
+    assert not _existe("cancelada")
+
+    # El que ya empezó se espera aunque pase el timeout
+    def lento(conn):
+        time.sleep(0.3)
+        conn.execute("CREATE TABLE guardada (x)")
+        return "ok"
+
+    assert db.ejecutar_escritura(lento, timeout=0.1) == "ok"
+    assert _existe("guardada")
@@ -0,0 +1,18 @@
+from core.lane_index import obtener_indice
+from core.migrations import aplicar_migraciones
+from core.services import crear_nueva_version
+
+
+def test_busqueda_ve_la_version_recien_guardada(bd_temporal):
+    aplicar_migraciones()
+    activas = obtener_indice().buscar({})
+    base = activas[activas["ID_TARIFA"].notna()].iloc[0]
+
+    resultado = crear_nueva_version({"ALL_IN": 12345.0}, id_tarifa=base["ID_TARIFA"], motivo="prueba")
+    assert resultado.ok
+
+    # Sin esperar a la réplica: el índice lee la BD principal
+    encontradas = obtener_indice().buscar({"cliente": base["CLIENTE"]})
+    encontradas = encontradas[encontradas["ID_TARIFA"] == base["ID_TARIFA"]]
+    assert list(encontradas["VERSION"]) == [resultado.version]
+    assert list(encontradas["ALL_IN"]) == [12345.0]
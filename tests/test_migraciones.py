@@ -0,0 +1,27 @@
+from core import db
+from core.migrations import MIGRACIONES, aplicar_migraciones, verificar_planes
+from core.queries import CONSULTAS_CRITICAS
+
+
+def test_aplica_todas_las_migraciones(bd_temporal):
+    aplicar_migraciones()
+    with db.conexion_lectura() as conn:
+        hechas = [r[0] for r in conn.execute("SELECT VERSION FROM schema_migrations ORDER BY VERSION")]
+    assert hechas == [version for version, _, _ in MIGRACIONES]
+
+
+def test_consultas_criticas_usan_indice(bd_temporal):
+    aplicar_migraciones()
+    planes = verificar_planes()
+    assert [p["consulta"] for p in planes] == list(CONSULTAS_CRITICAS)
+    sin_indice = {p["consulta"]: p["plan"] for p in planes if not p["usa_indice"]}
+    assert not sin_indice
+
+
+def test_migrar_no_desactiva_tarifas(bd_temporal):
+    with db.conexion_lectura() as conn:
+        antes = conn.execute("SELECT COUNT(*) FROM tarifario_estandar WHERE ACTIVA = 1").fetchone()[0]
+    aplicar_migraciones()
+    with db.conexion_lectura() as conn:
+        despues = conn.execute("SELECT COUNT(*) FROM tarifario_estandar WHERE ACTIVA = 1").fetchone()[0]
+    assert despues == antes
@@ -0,0 +1,60 @@
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+
+from bench.book import BD_MODELO
+from core.db import ReplicaLectura
+
+
+def _bd(tmp_path):
+    ruta = tmp_path / "tarifario.db"
+    shutil.copy(BD_MODELO, ruta)
+    return ruta
+
+
+def _escribir(ruta):
+    with sqlite3.connect(ruta) as conn:
+        conn.execute("UPDATE tarifario_estandar SET ALL_IN = COALESCE(ALL_IN, 0) + 1 WHERE id = 1")
+
+
+def test_borra_copias_de_procesos_muertos(tmp_path):
+    ruta = _bd(tmp_path)
+    muerto = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    pid_muerto = int(muerto.stdout)
+    huerfanas = [tmp_path / f".tarifario.replica-{pid_muerto}-3.db", tmp_path / f".tarifario.replica-{pid_muerto}-4.tmp"]
+    # El proceso padre de pytest sigue vivo: su copia se respeta
+    ajena = tmp_path / f".tarifario.replica-{os.getppid()}-1.db"
+    for archivo in (*huerfanas, ajena):
+        archivo.write_bytes(b"")
+
+    replica = ReplicaLectura(ruta)
+    try:
+        assert replica.huerfanas_borradas == 2
+        assert not any(h.exists() for h in huerfanas)
+        assert ajena.exists()
+    finally:
+        replica.cerrar()
+
+
+def test_copia_anterior_vive_hasta_devolver_la_conexion(tmp_path):
+    ruta = _bd(tmp_path)
+    replica = ReplicaLectura(ruta)
+    try:
+        replica.refrescar()
+        ruta_vieja = replica._ruta
+        with replica.conexion() as conn:
+            _escribir(ruta)
+            replica.refrescar()  # o ya la hizo el refresco en segundo plano del primer préstamo
+            assert replica.generacion == 2
+            assert replica._ruta != ruta_vieja
+            # La copia reemplazada sigue en disco y la conexión prestada sigue leyendo
+            assert ruta_vieja.exists()
+            assert conn.execute("SELECT COUNT(*) FROM tarifario_estandar").fetchone()[0] > 0
+            assert replica.stats()["retiradas_en_uso"] == 1
+        assert not ruta_vieja.exists()
+        assert replica.stats()["retiradas_en_uso"] == 0
+    finally:
+        replica.cerrar()
+    assert not list(tmp_path.glob(".tarifario.replica-*"))